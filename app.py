@@ -1,8 +1,7 @@
 import os
 import shutil
-import whisper
 import torch
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import logging
 import time
@@ -13,10 +12,23 @@ import json
 import webbrowser
 import socket
 from threading import Timer
-import io
 import re
-import sys
 import contextlib
+import uuid
+from model_cache import ModelCache
+from result_cache import ResultCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_MB
+from feature_cache import FeatureCache, DEFAULT_FEATURE_CACHE_DIR, DEFAULT_FEATURE_CACHE_MB
+from backends import BACKENDS, DEFAULT_BACKEND, load_backend
+from job_journal import JobJournal, DEFAULT_JOURNAL_PATH, finish_move
+from output_writers import OUTPUT_FORMATS, PartialOutput, parse_output_formats, output_paths, write_outputs
+from metrics import REGISTRY, JOBS, STAGE_SECONDS, CallbackMetric
+from scheduler import JobScheduler, DEFAULT_POLICY, DEFAULT_AGING_RATE, DEFAULT_USAGE_HALF_LIFE
+from streaming import probe_duration
+from eta import RtfModel, DEFAULT_RTF_MODEL_PATH, make_key as make_rtf_key, blend_rtf, schedule_eta
+from whisper.audio import HOP_LENGTH
+from live_transcribe import (
+    LiveTranscriber, PcmDecoder, FfmpegDecoder, DEFAULT_STEP_SECONDS, DEFAULT_HOLD_SECONDS, SAMPLE_RATE
+)
 
 # ロギングの設定
 logging.basicConfig(
@@ -46,43 +58,344 @@ for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, PROCESSED_FOLDER]:
 # 許可するファイル拡張子
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'flac', 'aac', 'ogg'}
 
-# モデルとデバイスのグローバル変数
-model = None
-device = "cpu"
-
-# 処理の進捗状況を保存するグローバル変数
-transcription_progress = {
-    "status": "idle",  # idle, loading_model, processing, completed, error
-    "file": "",
-    "progress": 0,
-    "message": "",
-    "time_elapsed": 0
-}
+# 処理待ち・処理中とみなすジョブの状態
+ACTIVE_STATUSES = ("queued", "loading_model", "processing")
+
+# 同時に文字起こしを実行するワーカースレッド数（環境変数 WHISPER_WORKERS で変更可能）
+MAX_WORKERS = max(1, int(os.environ.get("WHISPER_WORKERS", "1")))
+
+# 処理待ちのジョブの順番の決め方（環境変数 WHISPER_SCHEDULER: fair, sjf, fifo）
+# WHISPER_SCHEDULER_AGING: 待ち時間1秒あたりに順位を上げる音声の秒数、
+# WHISPER_FAIR_SHARE_HALF_LIFE: fair で利用者の処理量を半分に減らすまでの秒数、
+# WHISPER_RESERVED_WORKERS: 長い音声（10分超）を割り当てず、短い音声のために空けておくワーカー数
+SCHEDULER_POLICY = os.environ.get("WHISPER_SCHEDULER", DEFAULT_POLICY)
+SCHEDULER_AGING = float(os.environ.get("WHISPER_SCHEDULER_AGING", DEFAULT_AGING_RATE))
+FAIR_SHARE_HALF_LIFE = float(os.environ.get("WHISPER_FAIR_SHARE_HALF_LIFE", DEFAULT_USAGE_HALF_LIFE))
+RESERVED_WORKERS = int(os.environ.get("WHISPER_RESERVED_WORKERS", "0"))
+
+# ジョブごとの進捗状況を保存するグローバル変数（ジョブID -> 進捗状況）
+# status: queued, loading_model, processing, completed, error, cancelled
+jobs = {}
+# ジョブごとに文字起こし中に確定したセグメント（ジョブID -> セグメントのリスト）
+job_segments = {}
+# 終了したジョブを一覧から外すまでの時間（他のクライアントが結果を読み終えられるよう、一定時間は残す）
+FINISHED_JOB_RETENTION_SECONDS = 10 * 60
+job_queue = JobScheduler(SCHEDULER_POLICY, SCHEDULER_AGING, FAIR_SHARE_HALF_LIFE, MAX_WORKERS, RESERVED_WORKERS)
 transcription_lock = threading.Lock()
-stop_progress_update = threading.Event()
+
+# 進捗状況の変更通知（状態が変わるたびにバージョンを進め、待機中のストリームを起こす）
+progress_changed = threading.Condition(transcription_lock)
+progress_version = 0
+
+# 進捗ストリームで変更がない場合にキープアライブを送る間隔（秒）
+PROGRESS_KEEPALIVE_SECONDS = 15
+
+# 推論バックエンド（環境変数 WHISPER_BACKEND で変更可能: whisper, faster-whisper）
+BACKEND = os.environ.get("WHISPER_BACKEND", DEFAULT_BACKEND)
+if BACKEND not in BACKENDS:
+    raise ValueError(f"不明なバックエンドです: {BACKEND}（{', '.join(BACKENDS)} から選択してください）")
+
+# モデルキャッシュのメモリ上限（環境変数 WHISPER_MODEL_CACHE_MB で変更可能、未指定時は物理メモリの半分）
+MODEL_CACHE_MB = os.environ.get("WHISPER_MODEL_CACHE_MB")
+
+# 文字起こし結果キャッシュの保存先と容量上限（環境変数 WHISPER_RESULT_CACHE_DIR / WHISPER_RESULT_CACHE_MB）
+RESULT_CACHE_DIR = os.environ.get("WHISPER_RESULT_CACHE_DIR", DEFAULT_CACHE_DIR)
+RESULT_CACHE_MB = int(os.environ.get("WHISPER_RESULT_CACHE_MB", DEFAULT_MAX_MB))
+
+# 特徴量（log-mel・エンコーダ出力）キャッシュの設定
+# （環境変数 WHISPER_FEATURE_CACHE_DIR / WHISPER_FEATURE_CACHE_MB、WHISPER_FEATURE_CACHE_ENCODER=1 でエンコーダ出力も保存）
+FEATURE_CACHE_DIR = os.environ.get("WHISPER_FEATURE_CACHE_DIR", DEFAULT_FEATURE_CACHE_DIR)
+FEATURE_CACHE_MB = int(os.environ.get("WHISPER_FEATURE_CACHE_MB", DEFAULT_FEATURE_CACHE_MB))
+FEATURE_CACHE_ENCODER = os.environ.get("WHISPER_FEATURE_CACHE_ENCODER", "") not in ("", "0")
+
+# ジョブごとの処理時間の上限（分、環境変数 WHISPER_JOB_TIMEOUT_MINUTES、0 で無制限）
+# フォームの timeout_minutes でジョブごとに指定することもできる
+JOB_TIMEOUT_MINUTES = float(os.environ.get("WHISPER_JOB_TIMEOUT_MINUTES", "0"))
+
+# 処理時間の見積もりに使う実時間比の学習結果の保存先（環境変数 WHISPER_RTF_MODEL_PATH）
+RTF_MODEL_PATH = os.environ.get("WHISPER_RTF_MODEL_PATH", DEFAULT_RTF_MODEL_PATH)
+
+# ジョブジャーナルの保存先（環境変数 WHISPER_JOURNAL_PATH、再起動時に未完了のジョブを再開する）
+JOURNAL_PATH = os.environ.get("WHISPER_JOURNAL_PATH", DEFAULT_JOURNAL_PATH)
+
+# 起動時にバックグラウンドで読み込むモデル（環境変数 WHISPER_PRELOAD_MODELS、例: "base,tiny:float16"）
+PRELOAD_MODELS = [name.strip() for name in os.environ.get("WHISPER_PRELOAD_MODELS", "").split(",") if name.strip()]
+
+# 事前読み込みとウォームアップの状態（/healthz で公開）
+# status: pending, loading, ready, error
+preload_state = {
+    "status": "ready" if not PRELOAD_MODELS else "pending",
+    "models": {name: "pending" for name in PRELOAD_MODELS},
+    "message": ""
+}
+
+# 分割アップロードの設定（1ファイルの最大サイズは環境変数 WHISPER_MAX_UPLOAD_MB で変更可能）
+MAX_UPLOAD_SIZE = int(os.environ.get("WHISPER_MAX_UPLOAD_MB", "4096")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # クライアントが1リクエストで送るチャンクの推奨サイズ
+UPLOAD_STALE_SECONDS = 24 * 60 * 60  # 更新が途絶えた未完了アップロードを削除するまでの時間
+upload_locks = {}
+uploads_lock = threading.Lock()
+
+# リアルタイム文字起こしの設定（環境変数 WHISPER_LIVE_STEP_SECONDS / WHISPER_LIVE_HOLD_SECONDS で変更可能）
+LIVE_STEP_SECONDS = float(os.environ.get("WHISPER_LIVE_STEP_SECONDS", DEFAULT_STEP_SECONDS))  # 文字起こしし直す間隔
+LIVE_HOLD_SECONDS = float(os.environ.get("WHISPER_LIVE_HOLD_SECONDS", DEFAULT_HOLD_SECONDS))  # 確定を保留する末尾の長さ
+LIVE_IDLE_SECONDS = 60  # 音声が届かなくなったセッションを終了するまでの時間
+LIVE_KEEP_SECONDS = 10 * 60  # 終了したセッションの結果を保持する時間
+live_sessions = {}
+live_sessions_lock = threading.Lock()
+
+# ワーカースレッドの起動状態
+worker_threads = []
+workers_lock = threading.Lock()
 
 # ブラウザを開いたかどうかのフラグ
 browser_opened = False
 
-# Whisper進捗バーの正規表現パターン
-whisper_progress_pattern = re.compile(r'(\d+)%\|(.+?)\| (\d+)/(\d+)')
+class JobCancelled(Exception):
+    """キャンセルの要求または処理時間の上限により、文字起こしを中断したことを示す例外"""
 
-def update_progress(status, file="", progress=0, message="", time_elapsed=0):
-    """進捗状況を更新するヘルパー関数"""
-    global transcription_progress
+def notify_progress_changed(job=None):
+    """進捗のバージョンを進めて待機中のストリームに通知する（transcription_lock 取得済みで呼ぶこと）"""
+    global progress_version
+    progress_version += 1
+    if job is not None:
+        job["version"] = progress_version
+    progress_changed.notify_all()
+
+def update_progress(job_id, status, progress=0, message="", time_elapsed=0, processed_seconds=None, eta_seconds=None):
+    """ジョブの進捗状況を更新するヘルパー関数
+
+    processed_seconds には文字起こし済みの音声の長さ（秒）、eta_seconds には完了までの残り時間の見積もり（秒）を指定する
+    """
     with transcription_lock:
-        # 進捗値が0に戻る問題を防止（処理中の場合）
-        if status == "processing" and progress == 0 and transcription_progress["progress"] > 0:
-            # 既に進行中で、進捗が0に戻るのを防止（初期状態じゃない場合）
-            if transcription_progress["file"] == file:
-                # 同じファイルの処理中は進捗を0に戻さない
-                progress = transcription_progress["progress"]
+        job = jobs.get(job_id)
+        if job is None:
+            return
+        # 処理中に進捗値が0に戻る問題を防止
+        if status == "processing" and progress == 0 and job["progress"] > 0:
+            progress = job["progress"]
+        
+        # キュー待ち時間と処理時間を計測するため、開始・終了時刻を記録
+        if job["started_at"] is None and status not in ("queued", "cancelled"):
+            job["started_at"] = time.time()
+            STAGE_SECONDS.observe(job["started_at"] - job["created_at"], stage="queue_wait")
+        if job["finished_at"] is None and status in ("completed", "error", "cancelled"):
+            job["finished_at"] = time.time()
+            JOBS.inc(status=status)
         
-        transcription_progress["status"] = status
-        transcription_progress["file"] = file
-        transcription_progress["progress"] = progress
-        transcription_progress["message"] = message
-        transcription_progress["time_elapsed"] = time_elapsed
+        # 経過時間と残り時間以外に変化がなければ通知しない
+        status_changed = job["status"] != status
+        if processed_seconds is None:
+            processed_seconds = job["processed_seconds"]
+        changed = ((job["status"], job["progress"], job["message"], job["processed_seconds"])
+                   != (status, progress, message, processed_seconds))
+        job["status"] = status
+        job["progress"] = progress
+        job["message"] = message
+        job["time_elapsed"] = time_elapsed
+        job["processed_seconds"] = processed_seconds
+        if eta_seconds is not None:
+            job["eta_at"] = time.time() + eta_seconds
+        if changed:
+            notify_progress_changed(job)
+    
+    # 状態が変わったときだけジャーナルに記録する（モデル読み込み中も処理中として扱う）
+    if status_changed:
+        journal.update(job_id, "processing" if status == "loading_model" else status, message)
+
+def append_segments(job_id, segments):
+    """確定したセグメントをジョブに追加し、待機中のクライアントに通知する"""
+    with transcription_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return
+        job_segments.setdefault(job_id, []).extend(
+            {"id": segment["id"], "start": segment["start"], "end": segment["end"], "text": segment["text"]}
+            for segment in segments
+        )
+        job["segment_count"] = len(job_segments[job_id])
+        notify_progress_changed(job)
+
+def get_segments(job_id, start=0):
+    """ジョブで確定したセグメントのうち start 番目以降を返す"""
+    with transcription_lock:
+        return list(job_segments.get(job_id, [])[start:])
+
+def wait_for_progress(since, timeout, job_id=None):
+    """進捗のバージョンが since より新しくなるまで最大 timeout 秒待ち、現在のバージョンを返す"""
+    def has_changed():
+        if job_id is None:
+            return progress_version > since
+        job = jobs.get(job_id)
+        return job is None or job["version"] > since
+    
+    with progress_changed:
+        progress_changed.wait_for(has_changed, timeout=timeout)
+        if job_id is None:
+            return progress_version
+        job = jobs.get(job_id)
+        return job["version"] if job else progress_version
+
+def create_job(selected_file, model_name, language, compute_type, reload_model=False,
+               output_formats=("txt",), word_timestamps=False, job_id=None, user="", priority=0,
+               timeout_minutes=JOB_TIMEOUT_MINUTES):
+    """ジョブを登録してキューに追加し、ジョブIDを返す（job_id を指定した場合は中断したジョブの再開）
+
+    処理する順番は、音声の長さ・利用者（user）・優先度（priority、大きいほど先）からスケジューラが決める。
+    処理を始めてから timeout_minutes 分（0 で無制限）を超えたジョブは中断する
+    """
+    if job_id is None:
+        job_id = uuid.uuid4().hex[:12]
+    expire_finished_jobs()
+    duration = probe_duration(os.path.join(UPLOAD_FOLDER, selected_file))
+    journal.add(job_id, "web", selected_file, {
+        "model": model_name,
+        "language": language,
+        "compute_type": compute_type,
+        "reload_model": reload_model,
+        "output_formats": list(output_formats),
+        "word_timestamps": word_timestamps,
+        "user": user,
+        "priority": priority,
+        "timeout_minutes": timeout_minutes
+    })
+    with transcription_lock:
+        jobs[job_id] = {
+            "id": job_id,
+            "status": "queued",
+            "file": selected_file,
+            "model": model_name,
+            "language": language,
+            "compute_type": compute_type,
+            "reload_model": reload_model,
+            "output_formats": list(output_formats),
+            "word_timestamps": word_timestamps,
+            "user": user,
+            "priority": priority,
+            "timeout_minutes": timeout_minutes,
+            "cancel_reason": None,
+            "duration": duration,
+            "processed_seconds": 0.0,
+            "eta_at": None,
+            "cached": False,
+            "segment_count": 0,
+            "progress": 0,
+            "message": "処理待ち...",
+            "time_elapsed": 0,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "version": 0
+        }
+        notify_progress_changed(jobs[job_id])
+    job_queue.put(job_id, duration, user, priority)
+    return job_id
+
+def expire_finished_jobs():
+    """終了してから FINISHED_JOB_RETENTION_SECONDS 秒を過ぎたジョブを一覧から外す"""
+    now = time.time()
+    with transcription_lock:
+        expired = [job_id for job_id, job in jobs.items()
+                   if job["finished_at"] is not None and now - job["finished_at"] > FINISHED_JOB_RETENTION_SECONDS]
+        for job_id in expired:
+            del jobs[job_id]
+            job_segments.pop(job_id, None)
+        if expired:
+            notify_progress_changed()
+
+def cancel_job(job_id, reason="キャンセルしました"):
+    """ジョブのキャンセルを要求する（終了済みなどでキャンセルできない場合は False）
+
+    処理待ちのジョブはすぐにキャンセル済みにし、処理中のジョブは次のウィンドウの区切りで中断させる
+    """
+    with transcription_lock:
+        job = jobs.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return False
+        job["cancel_reason"] = reason
+    if job_queue.remove(job_id):
+        update_progress(job_id, "cancelled", message=reason)
+        logging.info(f"処理待ちのジョブをキャンセルしました: {job['file']}（ジョブID: {job_id}）")
+    return True
+
+def check_cancelled(job_id):
+    """キャンセルが要求されたか処理時間の上限を超えたジョブなら JobCancelled を送出する"""
+    with transcription_lock:
+        job = jobs[job_id]
+        reason = job["cancel_reason"]
+        timeout_minutes = job["timeout_minutes"]
+        if (reason is None and timeout_minutes and job["started_at"] is not None
+                and time.time() - job["started_at"] > timeout_minutes * 60):
+            reason = job["cancel_reason"] = f"処理時間の上限（{timeout_minutes:g}分）を超えたため中断しました"
+    if reason is not None:
+        raise JobCancelled(reason)
+
+def is_file_in_queue(selected_file):
+    """指定ファイルが処理待ちまたは処理中のジョブに含まれているか確認"""
+    with transcription_lock:
+        return any(job["file"] == selected_file and job["status"] in ACTIVE_STATUSES
+                   for job in jobs.values())
+
+def estimate_processing_seconds(job):
+    """学習済みの実時間比から、ジョブの文字起こしにかかる時間を見積もる（見積もれない場合は None）"""
+    rtf = rtf_model.estimate(make_rtf_key(BACKEND, job["model"], get_optimal_device(), job["compute_type"]))
+    if rtf is None or job["duration"] is None:
+        return None
+    return job["duration"] * rtf
+
+def add_estimates(job_list):
+    """ジョブの進捗状況のコピーに、処理待ちの順番（queue_position）と、処理開始・完了までの秒数の見積もり
+    （wait_seconds / eta_seconds、見積もれない場合は None）を付ける"""
+    now = time.time()
+    queue_order = job_queue.order()
+    busy_seconds = []
+    for job in job_list:
+        job["queue_position"] = None
+        job["wait_seconds"] = None
+        job["eta_seconds"] = 0.0 if job["status"] == "completed" else None
+        if job["status"] in ("loading_model", "processing"):
+            # 文字起こし中のジョブは進捗から求めた見積もり、モデル読み込み中は学習済みの実時間比で見積もる
+            job["eta_seconds"] = (max(job["eta_at"] - now, 0.0) if job["eta_at"] is not None
+                                  else estimate_processing_seconds(job))
+            busy_seconds.append(job["eta_seconds"])
+    busy_seconds += [0.0] * max(MAX_WORKERS - len(busy_seconds), 0)
+    
+    # 処理待ちのジョブは、スケジューラが決めた順に空いたワーカーで処理されるとして見積もる
+    queued = {job["id"]: job for job in job_list if job["status"] == "queued"}
+    ordered = [queued[job_id] for job_id in queue_order if job_id in queued]
+    estimates = schedule_eta(busy_seconds, [estimate_processing_seconds(job) for job in ordered])
+    for position, (job, (wait, finish)) in enumerate(zip(ordered, estimates), 1):
+        job["queue_position"] = position
+        job["wait_seconds"] = wait
+        job["eta_seconds"] = finish
+
+def get_job_snapshots():
+    """全ジョブの進捗状況のコピーを、処理待ちの順番と残り時間の見積もりを付けて返す"""
+    with transcription_lock:
+        job_list = [dict(job) for job in jobs.values()]
+    add_estimates(job_list)
+    return job_list
+
+def get_progress_snapshot():
+    """全ジョブの進捗状況のスナップショットを返す"""
+    job_list = get_job_snapshots()
+    
+    # 旧来の単一ジョブ形式との互換のため、最新の処理中ジョブ（なければ最新のジョブ）を最上位に展開
+    active = [job for job in job_list if job["status"] in ACTIVE_STATUSES and job["status"] != "queued"]
+    current = (active or job_list or [None])[-1]
+    snapshot = dict(current) if current else {
+        "status": "idle", "file": "", "progress": 0, "message": "", "time_elapsed": 0
+    }
+    snapshot["version"] = max([job["version"] for job in job_list], default=0)
+    snapshot["jobs"] = job_list
+    snapshot["queue_length"] = sum(1 for job in job_list if job["status"] == "queued")
+    snapshot["workers"] = MAX_WORKERS
+    snapshot["scheduler"] = SCHEDULER_POLICY
+    # 処理待ち・処理中のジョブがすべて終わるまでの見積もり（キャパシティの目安）
+    etas = [job["eta_seconds"] for job in job_list if job["status"] in ACTIVE_STATUSES]
+    snapshot["backlog_seconds"] = max(etas, default=0.0) if None not in etas else None
+    snapshot["result_cache"] = result_cache.stats()
+    return snapshot
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -95,48 +408,119 @@ def get_optimal_device():
     # MPSでもCPUを返すように修正
     return "cpu"
 
-def load_model(model_name="base", device=None):
-    """Whisperモデルをロード"""
-    update_progress("loading_model", message=f"{model_name}モデルをロード中...")
+def load_model(model_name="base", device=None, job_id=None, compute_type="float32"):
+    """設定された推論バックエンドでモデルをロード"""
+    update_progress(job_id, "loading_model", message=f"{model_name}モデルをロード中...")
     
     if device is None:
         device = get_optimal_device()
     
     start_time = time.time()
     try:
-        model = whisper.load_model(
-            model_name,
-            device=device,
-            download_root=os.path.join(os.path.expanduser("~"), ".cache", "whisper")
-        )
+        model = load_backend(BACKEND, model_name, device, compute_type)
         elapsed_time = time.time() - start_time
-        update_progress("idle", message=f"{model_name}モデルを{device}デバイスで読み込みました（所要時間: {elapsed_time:.2f}秒）")
-        logging.info(f"{model_name}モデルを{device}デバイスで読み込みました（所要時間: {elapsed_time:.2f}秒）")
+        update_progress(job_id, "loading_model", message=f"{model_name}モデルを{device}デバイスで読み込みました（所要時間: {elapsed_time:.2f}秒）")
+        logging.info(f"{model_name}モデルを{device}デバイスで読み込みました（バックエンド: {BACKEND}、所要時間: {elapsed_time:.2f}秒）")
         return model
     except Exception as e:
         logging.error(f"モデル読み込みエラー: {e}")
         # MPSの場合に失敗したら、CPUにフォールバック
         if device != "cpu":
             logging.info(f"{device}での読み込みに失敗しました。CPUにフォールバックします。")
-            update_progress("loading_model", message=f"{device}での読み込みに失敗しました。CPUにフォールバックします。")
-            return load_model(model_name, "cpu")
-        update_progress("error", message=f"モデル読み込みエラー: {str(e)}")
+            update_progress(job_id, "loading_model", message=f"{device}での読み込みに失敗しました。CPUにフォールバックします。")
+            return load_model(model_name, "cpu", job_id, compute_type)
+        update_progress(job_id, "error", message=f"モデル読み込みエラー: {str(e)}")
         return None
 
+def preload_models():
+    """設定されたモデルを読み込み、ウォームアップしてキャッシュに残す"""
+    device = get_optimal_device()
+    preload_state["status"] = "loading"
+    failed = []
+    for entry in PRELOAD_MODELS:
+        model_name, _, compute_type = entry.partition(":")
+        compute_type = compute_type or "float32"
+        preload_state["models"][entry] = "loading"
+        start_time = time.time()
+        try:
+            with model_cache.use(model_name, device, compute_type) as model:
+                if model is None:
+                    raise RuntimeError(f"{model_name}モデルを読み込めませんでした")
+                model.warm_up()
+            preload_state["models"][entry] = "ready"
+            logging.info(f"{model_name}モデルの事前読み込みとウォームアップが完了しました（所要時間: {time.time() - start_time:.2f}秒）")
+        except Exception as e:
+            failed.append(entry)
+            preload_state["models"][entry] = "error"
+            logging.error(f"{model_name}モデルの事前読み込みに失敗しました: {e}")
+    
+    if failed:
+        preload_state["status"] = "error"
+        preload_state["message"] = f"事前読み込みに失敗したモデル: {', '.join(failed)}"
+    else:
+        preload_state["status"] = "ready"
+        preload_state["message"] = "すべてのモデルの準備が完了しました"
+
+def start_preload():
+    """バックグラウンドスレッドでモデルの事前読み込みを開始する"""
+    if not PRELOAD_MODELS:
+        return
+    logging.info(f"モデルの事前読み込みを開始します: {', '.join(PRELOAD_MODELS)}")
+    thread = threading.Thread(target=preload_models, name="model-preload")
+    thread.daemon = True
+    thread.start()
+
+def load_cached_model(model_name, device, compute_type, job_id=None):
+    """モデルキャッシュから呼ばれるローダー"""
+    return load_model(model_name, device, job_id, compute_type)
+
+# 読み込み済みモデルのキャッシュ（ジョブごとに異なるモデルを再読み込みなしで使い分ける）
+model_cache = ModelCache(
+    load_cached_model,
+    int(MODEL_CACHE_MB) * 1024 * 1024 if MODEL_CACHE_MB else None
+)
+
+# 処理待ち・処理中のジョブを記録し、再起動時に再開するためのジャーナル
+journal = JobJournal(JOURNAL_PATH)
+
+# 同じ音声の再アップロード時に推論を省略するための結果キャッシュ
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MB * 1024 * 1024)
+
+# 残り時間を見積もるための、実行環境ごとの実時間比の学習結果
+rtf_model = RtfModel(RTF_MODEL_PATH)
+
+# 言語を変えて文字起こしし直す場合などに、音声の読み込みとlog-melの計算を省略するための特徴量キャッシュ
+feature_cache = (FeatureCache(FEATURE_CACHE_DIR, FEATURE_CACHE_MB * 1024 * 1024, FEATURE_CACHE_ENCODER)
+                 if FEATURE_CACHE_MB > 0 else None)
+
+def count_jobs_by_status():
+    """/metrics 用に、処理待ち・処理中のジョブ数を状態ごとに数える"""
+    with transcription_lock:
+        return [({"status": status}, sum(1 for job in jobs.values() if job["status"] == status))
+                for status in ACTIVE_STATUSES]
+
+def model_cache_memory():
+    """/metrics 用に、キャッシュ中のモデルのメモリ量をモデルごとに返す"""
+    return [({"model": entry["model"], "device": entry["device"], "compute_type": entry["compute_type"]},
+             entry["memory_mb"] * 1024**2)
+            for entry in model_cache.stats()["models"]]
+
+REGISTRY.register(CallbackMetric("whisper_jobs_active", "処理待ち・処理中のジョブ数", count_jobs_by_status))
+REGISTRY.register(CallbackMetric("whisper_workers", "文字起こしワーカーのスレッド数", lambda: len(worker_threads)))
+REGISTRY.register(CallbackMetric("whisper_model_cache_memory_bytes", "キャッシュ中のモデルのメモリ量（バイト）",
+                                 model_cache_memory))
+REGISTRY.register(CallbackMetric("whisper_live_sessions", "リアルタイム文字起こしのセッション数",
+                                 lambda: len(live_sessions)))
+
 @app.route('/')
 def index():
-    # 処理済みファイル一覧の取得の前に、ページロード時に完了状態をリセット
-    global transcription_progress
-    with transcription_lock:
-        if transcription_progress["status"] == "completed":
-            transcription_progress["status"] = "idle"
-            transcription_progress["message"] = ""
-            transcription_progress["progress"] = 0
+    # 終了から時間が経ったジョブを一覧から外す（他のクライアントが参照中のジョブは一定時間残す）
+    expire_finished_jobs()
     
     # 処理済みファイル一覧の取得
     output_files = []
-    for file in os.listdir(OUTPUT_FOLDER):
-        if file.endswith('.txt'):
+    for file in sorted(os.listdir(OUTPUT_FOLDER)):
+        if file.endswith(tuple(f".{output_format}" for output_format in OUTPUT_FORMATS)):
             output_files.append({
                 'name': file,
                 'path': url_for('download_file', filename=file)
@@ -148,12 +532,135 @@ def index():
         if allowed_file(file):
             pending_files.append(file)
     
-    return render_template('index.html', output_files=output_files, pending_files=pending_files)
+    return render_template('index.html', output_files=output_files, pending_files=pending_files,
+                           output_formats=OUTPUT_FORMATS, job_timeout_minutes=JOB_TIMEOUT_MINUTES)
+
+def get_job_snapshot(job_id):
+    """指定ジョブの進捗状況のコピーを返す（存在しない場合は None）"""
+    with transcription_lock:
+        if job_id not in jobs:
+            return None
+    return next((job for job in get_job_snapshots() if job["id"] == job_id), None)
 
 @app.route('/progress')
 def progress():
-    """進捗状況を返すAPIエンドポイント"""
-    return jsonify(transcription_progress)
+    """全ジョブの進捗状況を返すAPIエンドポイント
+
+    ?since=<version> を指定すると、それより新しい変更があるまで最大 timeout 秒待つ（ロングポーリング）
+    """
+    since = request.args.get('since', type=int)
+    if since is not None:
+        wait_for_progress(since, min(request.args.get('timeout', 30, type=float), 60))
+    return jsonify(get_progress_snapshot())
+
+@app.route('/progress/<job_id>')
+def job_progress(job_id):
+    """指定ジョブの進捗状況を返すAPIエンドポイント（?since=<version> でロングポーリング）"""
+    since = request.args.get('since', type=int)
+    if since is not None:
+        wait_for_progress(since, min(request.args.get('timeout', 30, type=float), 60), job_id)
+    job = get_job_snapshot(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    return jsonify(job)
+
+@app.route('/progress/<job_id>/segments')
+def job_segments_view(job_id):
+    """指定ジョブで確定したセグメントを返すAPIエンドポイント
+
+    ?start=<番号> を指定するとその番号以降のセグメントだけを返す。
+    ?since=<version> を指定すると、ジョブに変化があるまで最大 timeout 秒待つ（ロングポーリング）
+    """
+    since = request.args.get('since', type=int)
+    if since is not None:
+        wait_for_progress(since, min(request.args.get('timeout', 30, type=float), 60), job_id)
+    job = get_job_snapshot(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    start = max(request.args.get('start', 0, type=int), 0)
+    return jsonify({
+        "id": job_id,
+        "status": job["status"],
+        "version": job["version"],
+        "start": start,
+        "segments": get_segments(job_id, start),
+        "segment_count": job["segment_count"]
+    })
+
+def progress_events(job_id=None):
+    """進捗が変化したときだけ Server-Sent Events を送るジェネレータ
+
+    個別ジョブのストリームでは、前回の送信以降に確定したセグメントを "segments" に含める
+    """
+    last_version = -1
+    sent_segments = 0
+    while True:
+        version = wait_for_progress(last_version, PROGRESS_KEEPALIVE_SECONDS, job_id)
+        if version == last_version:
+            # 変化がない間は接続維持のためのコメントだけ送る
+            yield ": keep-alive\n\n"
+            continue
+        last_version = version
+        
+        if job_id is None:
+            payload = get_progress_snapshot()
+        else:
+            payload = get_job_snapshot(job_id)
+            if payload is None:
+                yield f"event: gone\ndata: {json.dumps({'error': 'ジョブが見つかりません'}, ensure_ascii=False)}\n\n"
+                return
+            payload["segments"] = get_segments(job_id, sent_segments)
+            sent_segments += len(payload["segments"])
+        yield f"id: {version}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        
+        # 個別ジョブのストリームは終了状態を送ったら閉じる
+        if job_id is not None and payload["status"] not in ACTIVE_STATUSES:
+            return
+
+def event_stream_response(events):
+    """SSE用のレスポンスを作成"""
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/progress/stream')
+def progress_stream():
+    """全ジョブの進捗状況を変化時にのみ送るSSEエンドポイント"""
+    return event_stream_response(progress_events())
+
+@app.route('/progress/<job_id>/stream')
+def job_progress_stream(job_id):
+    """指定ジョブの進捗状況を変化時にのみ送るSSEエンドポイント"""
+    if get_job_snapshot(job_id) is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    return event_stream_response(progress_events(job_id))
+
+@app.route('/cancel/<job_id>', methods=['POST'])
+def cancel(job_id):
+    """ジョブをキャンセルするAPIエンドポイント（処理中のジョブは次のウィンドウの区切りで中断し、音声は audiofile に残す）"""
+    if get_job_snapshot(job_id) is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    if not cancel_job(job_id):
+        return jsonify({"error": "このジョブは既に終了しています"}), 409
+    return jsonify(get_job_snapshot(job_id)), 202
+
+@app.route('/models')
+def model_stats():
+    """モデルキャッシュのヒット率・読み込み時間などの統計を返すAPIエンドポイント"""
+    return jsonify({"backend": BACKEND, **model_cache.stats(), "rtf_model": rtf_model.stats()})
+
+@app.route('/metrics')
+def metrics():
+    """処理段階ごとの所要時間・実時間比・キャッシュのヒット数などをPrometheusのテキスト形式で返す"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/healthz')
+def healthz():
+    """事前読み込みが完了していれば200、それ以外は503を返すヘルスチェック用エンドポイント"""
+    status_code = 200 if preload_state["status"] == "ready" else 503
+    return jsonify(preload_state), status_code
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -177,154 +684,536 @@ def upload_file():
         flash('許可されていないファイル形式です')
         return redirect(request.url)
 
-# 標準出力をキャプチャするためのコンテキストマネージャ
-class WhisperProgressCapture:
-    def __init__(self, selected_file, start_time):
-        self.selected_file = selected_file
-        self.start_time = start_time
-        self.buffer = io.StringIO()
-        self.old_stdout = None
-    
-    def __enter__(self):
-        self.old_stdout = sys.stdout
-        sys.stdout = self.buffer
-        return self
-    
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        sys.stdout = self.old_stdout
-    
-    def check_progress(self):
-        # バッファの内容を取得
-        output = self.buffer.getvalue()
-        # バッファをリセット
-        self.buffer.truncate(0)
-        self.buffer.seek(0)
-        
-        # 進捗バーを検索
-        for line in output.split('\n'):
-            match = whisper_progress_pattern.search(line)
-            if match:
-                percent = int(match.group(1))
-                # 進捗状況を更新（Whisperの進捗は0-100%）
-                elapsed = time.time() - self.start_time
-                update_progress("processing", file=self.selected_file, progress=percent, 
-                             message=f"処理中... {percent}%完了", time_elapsed=elapsed)
-                return percent
+def upload_paths(upload_id):
+    """未完了アップロードの一時ファイルとメタデータのパス（audiofile内の隠しファイル）"""
+    base = os.path.join(UPLOAD_FOLDER, f".upload-{upload_id}")
+    return f"{base}.part", f"{base}.json"
+
+def read_upload_meta(upload_id):
+    """未完了アップロードのメタデータを読み込む（存在しない場合は None）"""
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
         return None
+    _, meta_path = upload_paths(upload_id)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def remove_upload(upload_id):
+    """未完了アップロードの一時ファイルを削除"""
+    for path in upload_paths(upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+
+def cleanup_stale_uploads():
+    """長時間更新されていない未完了アップロードを削除"""
+    now = time.time()
+    for name in os.listdir(UPLOAD_FOLDER):
+        if name.startswith(".upload-") and name.endswith(".json"):
+            upload_id = name[len(".upload-"):-len(".json")]
+            _, meta_path = upload_paths(upload_id)
+            if now - os.path.getmtime(meta_path) > UPLOAD_STALE_SECONDS:
+                remove_upload(upload_id)
+
+def upload_status(upload_id, meta):
+    """分割アップロードの受信状況を返す"""
+    part_path, _ = upload_paths(upload_id)
+    received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    return {
+        "upload_id": upload_id,
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "received": received,
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "completed": False
+    }
 
-def process_transcription(selected_file, model_name, language, compute_type):
-    """別スレッドで文字起こし処理を実行する関数"""
-    global model, device, stop_progress_update, transcription_progress
+@app.route('/upload/init', methods=['POST'])
+def init_chunked_upload():
+    """分割アップロードを開始する。同じファイル名・サイズの未完了アップロードがあれば続きから再開する"""
+    data = request.get_json(silent=True) or request.form
+    filename = secure_filename(data.get('filename', ''))
+    size = int(data.get('size', 0) or 0)
     
-    # 処理開始時に前回の完了状態をリセット
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": "許可されていないファイル形式です"}), 400
+    if size <= 0 or size > MAX_UPLOAD_SIZE:
+        return jsonify({"error": f"ファイルサイズは{MAX_UPLOAD_SIZE // 1024 // 1024}MBまでです"}), 400
+    
+    with uploads_lock:
+        cleanup_stale_uploads()
+        for name in os.listdir(UPLOAD_FOLDER):
+            if name.startswith(".upload-") and name.endswith(".json"):
+                upload_id = name[len(".upload-"):-len(".json")]
+                meta = read_upload_meta(upload_id)
+                if meta and meta["filename"] == filename and meta["size"] == size:
+                    return jsonify(upload_status(upload_id, meta))
+        
+        upload_id = uuid.uuid4().hex
+        meta = {"filename": filename, "size": size, "created_at": time.time()}
+        part_path, meta_path = upload_paths(upload_id)
+        open(part_path, "wb").close()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+    return jsonify(upload_status(upload_id, meta))
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """受信済みのバイト数を返す（接続が切れた後の再開位置の確認用）"""
+    meta = read_upload_meta(upload_id)
+    if meta is None:
+        return jsonify({"error": "アップロードが見つかりません"}), 404
+    return jsonify(upload_status(upload_id, meta))
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """チャンクを受信して一時ファイルに追記する。全体を受信したら最終的なファイル名に置き換える
+
+    リクエスト本文はチャンクの生データで、?offset= に書き込み開始位置を指定する。
+    本文はメモリに溜めずに少しずつ一時ファイルへ書き込む
+    """
+    meta = read_upload_meta(upload_id)
+    if meta is None:
+        return jsonify({"error": "アップロードが見つかりません"}), 404
+    offset = request.args.get('offset', type=int)
+    
+    with uploads_lock:
+        lock = upload_locks.setdefault(upload_id, threading.Lock())
+    
+    with lock:
+        part_path, meta_path = upload_paths(upload_id)
+        if not os.path.exists(part_path):
+            return jsonify({"error": "アップロードが見つかりません"}), 404
+        received = os.path.getsize(part_path)
+        if offset != received:
+            # 再送などで位置がずれた場合は、現在の受信済みサイズを返してクライアントに合わせてもらう
+            status = upload_status(upload_id, meta)
+            status["error"] = "書き込み位置が一致しません"
+            return jsonify(status), 409
+        
+        with open(part_path, "ab") as f:
+            while True:
+                data = request.stream.read(1024 * 1024)
+                if not data:
+                    break
+                if received + len(data) > meta["size"]:
+                    f.truncate(received)
+                    return jsonify({"error": "宣言されたサイズを超えています"}), 400
+                f.write(data)
+                received += len(data)
+        os.utime(meta_path)
+        
+        if received < meta["size"]:
+            return jsonify(upload_status(upload_id, meta))
+        
+        # 受信完了：一時ファイルを最終的なファイル名にアトミックに置き換える
+        os.replace(part_path, os.path.join(UPLOAD_FOLDER, meta["filename"]))
+        os.remove(meta_path)
+    with uploads_lock:
+        upload_locks.pop(upload_id, None)
+    logging.info(f"分割アップロードが完了しました: {meta['filename']}（{meta['size'] / 1024**2:.1f}MB）")
+    return jsonify({
+        "upload_id": upload_id,
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "received": received,
+        "completed": True
+    })
+
+def get_live_session(session_id):
+    with live_sessions_lock:
+        return live_sessions.get(session_id)
+
+def cleanup_live_sessions():
+    """終了してから時間が経ったリアルタイム文字起こしのセッションを削除"""
+    now = time.time()
+    with live_sessions_lock:
+        expired = [session_id for session_id, session in live_sessions.items()
+                   if session["transcriber"].done and now - session["last_audio_at"] > LIVE_KEEP_SECONDS]
+        for session_id in expired:
+            del live_sessions[session_id]
+
+def finish_live_session(session):
+    """音声の受信を終了し、残りの音声を文字起こしさせる"""
+    with session["lock"]:
+        if session["finished"]:
+            return
+        session["finished"] = True
+        # ffmpegでデコード中の音声を出し切ってから終わりを通知する
+        session["decoder"].close()
+    session["transcriber"].finish()
+
+def live_worker(session):
+    """音声が溜まるたびにスライディングウィンドウを文字起こしするスレッド
+
+    モデルはファイルの文字起こしと同じキャッシュから1ステップごとに借りる
+    """
+    transcriber = session["transcriber"]
+    device = get_optimal_device()
+    try:
+        while not transcriber.done:
+            if not transcriber.wait_ready(LIVE_IDLE_SECONDS):
+                logging.info(f"音声が{LIVE_IDLE_SECONDS}秒届かなかったため、リアルタイム文字起こしを終了します: {session['id']}")
+                finish_live_session(session)
+                continue
+            with model_cache.use(session["model"], device, session["compute_type"]) as model:
+                if model is None:
+                    raise RuntimeError(f"{session['model']}モデルを読み込めませんでした")
+                transcriber.step(lambda audio: model.transcribe(audio, language=session["language"]))
+        logging.info(f"リアルタイム文字起こしが終了しました: {session['id']}")
+    except Exception as e:
+        session["error"] = str(e)
+        logging.error(f"リアルタイム文字起こし中にエラーが発生しました: {e}")
+        transcriber.close()
+
+def live_status(session, start=0):
+    """セッションの状態と、start 番目以降の確定セグメント・暫定セグメントを返す"""
+    snapshot = session["transcriber"].snapshot(start)
+    if session["error"]:
+        status = "error"
+    elif snapshot["done"]:
+        status = "finished"
+    else:
+        status = "running"
+    return {"session_id": session["id"], "status": status, "error": session["error"], **snapshot}
+
+@app.route('/live/start', methods=['POST'])
+def start_live_session():
+    """リアルタイム文字起こしのセッションを開始する
+
+    パラメータ（フォームまたはJSON）: model, language, compute_type,
+    format（pcm: 16bit リトルエンディアンのモノラルPCM、それ以外: ffmpegでデコードするOpusなど）,
+    sample_rate（pcm の場合のサンプルレート）
+    """
+    params = request.get_json(silent=True) or request.form
+    audio_format = params.get('format', 'pcm')
+    try:
+        sample_rate = int(params.get('sample_rate', SAMPLE_RATE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "sample_rate が不正です"}), 400
+    if sample_rate <= 0:
+        return jsonify({"error": "sample_rate が不正です"}), 400
+    
+    cleanup_live_sessions()
+    transcriber = LiveTranscriber(LIVE_STEP_SECONDS, LIVE_HOLD_SECONDS)
+    try:
+        if audio_format == "pcm":
+            decoder = PcmDecoder(transcriber.add_audio, sample_rate)
+        else:
+            decoder = FfmpegDecoder(transcriber.add_audio)
+    except OSError as e:
+        return jsonify({"error": f"音声のデコーダを起動できません: {e}"}), 500
+    
+    session_id = uuid.uuid4().hex[:12]
+    session = {
+        "id": session_id,
+        "model": params.get('model', 'base'),
+        "language": params.get('language', 'ja'),
+        "compute_type": params.get('compute_type', 'float32'),
+        "format": audio_format,
+        "transcriber": transcriber,
+        "decoder": decoder,
+        "lock": threading.Lock(),
+        "finished": False,
+        "error": None,
+        "last_audio_at": time.time()
+    }
+    with live_sessions_lock:
+        live_sessions[session_id] = session
+    thread = threading.Thread(target=live_worker, args=(session,), name=f"live-{session_id}", daemon=True)
+    thread.start()
+    logging.info(f"リアルタイム文字起こしを開始しました: {session_id}（モデル: {session['model']}、形式: {audio_format}）")
+    return jsonify({
+        "session_id": session_id,
+        "sample_rate": sample_rate,
+        "step_seconds": LIVE_STEP_SECONDS,
+        "hold_seconds": LIVE_HOLD_SECONDS
+    })
+
+@app.route('/live/<session_id>', methods=['PUT', 'POST'])
+def live_audio(session_id):
+    """音声データを受け取る（Transfer-Encoding: chunked で1つのリクエストに流し続けることもできる）"""
+    session = get_live_session(session_id)
+    if session is None:
+        return jsonify({"error": "セッションが見つかりません"}), 404
+    # 受信はロックの外で行い、ロックはデコーダへの書き込みの間だけ取る
+    # （送信が止まったクライアントが、終了の通知やアイドル時の終了処理を妨げないように）
+    try:
+        while True:
+            chunk = request.stream.read(64 * 1024)
+            with session["lock"]:
+                if session["finished"]:
+                    return jsonify({"error": "このセッションは終了しています"}), 409
+                if not chunk:
+                    break
+                session["decoder"].write(chunk)
+                session["last_audio_at"] = time.time()
+    except OSError as e:
+        # ffmpegがデコードできない音声を受け取って終了した場合など
+        return jsonify({"error": f"音声をデコードできません: {e}"}), 400
+    return jsonify(live_status(session, request.args.get('start', 0, type=int)))
+
+@app.route('/live/<session_id>/finish', methods=['POST'])
+def live_finish(session_id):
+    """音声の終わりを通知する（?timeout= を指定すると、すべて確定するまで待ってから結果を返す）"""
+    session = get_live_session(session_id)
+    if session is None:
+        return jsonify({"error": "セッションが見つかりません"}), 404
+    finish_live_session(session)
+    timeout = min(request.args.get('timeout', 0, type=float), 60)
+    if timeout > 0:
+        session["transcriber"].wait_for_update(float("inf"), timeout)
+    return jsonify(live_status(session, request.args.get('start', 0, type=int)))
+
+@app.route('/live/<session_id>', methods=['GET'])
+def live_result(session_id):
+    """確定・暫定の文字起こし結果を返す
+
+    ?start=<番号> でその番号以降の確定セグメントだけを返し、
+    ?since=<version> で結果が更新されるまで最大 timeout 秒待つ（ロングポーリング）
+    """
+    session = get_live_session(session_id)
+    if session is None:
+        return jsonify({"error": "セッションが見つかりません"}), 404
+    since = request.args.get('since', type=int)
+    if since is not None:
+        session["transcriber"].wait_for_update(since, min(request.args.get('timeout', 30, type=float), 60))
+    return jsonify(live_status(session, request.args.get('start', 0, type=int)))
+
+@app.route('/live/<session_id>/stream')
+def live_stream(session_id):
+    """結果が更新されるたびに、新しく確定したセグメントと暫定セグメントを送るSSEエンドポイント"""
+    session = get_live_session(session_id)
+    if session is None:
+        return jsonify({"error": "セッションが見つかりません"}), 404
+    
+    def events():
+        version = -1
+        sent = 0
+        while True:
+            session["transcriber"].wait_for_update(version, PROGRESS_KEEPALIVE_SECONDS)
+            payload = live_status(session, sent)
+            if payload["version"] == version and payload["status"] == "running":
+                yield ": keep-alive\n\n"
+                continue
+            version = payload["version"]
+            sent += len(payload["final"])
+            yield f"id: {version}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            if payload["status"] != "running":
+                return
+    
+    return event_stream_response(events())
+
+def run_whisper(job_id, model, full_audio_path, language, transcription_start, word_timestamps=False,
+                duration=None, rtf_key=None):
+    """デコードの進捗と確定したセグメントをジョブに反映しながら推論バックエンドで文字起こしを実行し、結果を返す
+
+    確定したセグメントは出力フォルダの途中経過ファイルにも追記する。rtf_key を指定すると、
+    その実行環境の学習済みの実時間比とここまでの処理速度から残り時間を見積もり、完了後に処理時間を学習する。
+    特徴量キャッシュを使った実行は音声の読み込みなどを省略して通常より速いため、処理時間を学習しない
+    """
+    inference_start = time.time()
+    # 実行前に確認する（キャッシュがない場合は、この実行で保存される）
+    uses_cached_features = (BACKEND == "whisper" and feature_cache is not None
+                            and feature_cache.has_features(full_audio_path))
+    learned = rtf_model.estimate(rtf_key) if rtf_key is not None else None
+    if learned is not None and duration:
+        update_progress(job_id, "processing", message="音声解析の準備中...", eta_seconds=duration * learned)
+    
+    def on_progress(processed_frames, total_frames):
+        # ウィンドウの区切りごとに呼ばれるため、ここでキャンセルと処理時間の上限を確認して中断する
+        check_cancelled(job_id)
+        # 文字起こし本体の進捗を全体の0〜80%に割り当てる（残りは保存と移動）
+        now = time.time()
+        elapsed = now - transcription_start
+        if total_frames:
+            percent = int(processed_frames * 100 / total_frames)
+            processed = processed_frames * HOP_LENGTH / SAMPLE_RATE
+            total = duration or total_frames * HOP_LENGTH / SAMPLE_RATE
+            rtf = blend_rtf(learned, now - inference_start, processed, total)
+            eta = max(total - processed, 0.0) * rtf if rtf is not None else None
+            update_progress(job_id, "processing", progress=int(percent * 0.8),
+                            message=f"処理中... {percent}%完了", time_elapsed=elapsed,
+                            processed_seconds=round(processed, 1), eta_seconds=eta)
+        else:
+            update_progress(job_id, "processing", message="処理中...", time_elapsed=elapsed)
+    
+    def on_segments(segments):
+        partial.write_segments(segments)
+        append_segments(job_id, segments)
+    
+    with PartialOutput(OUTPUT_FOLDER, full_audio_path) as partial:
+        result = model.transcribe(full_audio_path, language=language, word_timestamps=word_timestamps,
+                                  progress_callback=on_progress, segment_callback=on_segments,
+                                  feature_cache=feature_cache)
+    if rtf_key is not None and not uses_cached_features:
+        rtf_model.update(rtf_key, duration, time.time() - inference_start)
+    return result
+
+def process_transcription(job_id):
+    """ワーカースレッド上で1件のジョブの文字起こし処理を実行する関数"""
     with transcription_lock:
-        if transcription_progress["status"] == "completed":
-            transcription_progress["status"] = "idle"
-            
-    # 前回実行の進捗更新スレッドが残っていれば停止
-    stop_progress_update.set()
-    time.sleep(0.5)  # 確実に停止させるため
-    stop_progress_update.clear()
+        job = dict(jobs[job_id])
+    selected_file = job["file"]
+    language = job["language"]
+    compute_type = job["compute_type"]
     
     full_audio_path = os.path.join(UPLOAD_FOLDER, selected_file)
     
     try:
-        # Whisperで文字起こし
-        update_progress("processing", file=selected_file, progress=0, message="音声解析の準備中...")
-        transcription_start = time.time()
+        if not os.path.exists(full_audio_path):
+            raise FileNotFoundError(f"ファイル {selected_file} が見つかりません")
         
-        # 標準出力をキャプチャして進捗を監視
-        with WhisperProgressCapture(selected_file, transcription_start) as progress_capture:
-            # 進捗監視スレッド
-            def monitor_progress():
-                start_elapsed = time.time()
-                current_progress = 0
-                while not stop_progress_update.is_set():
-                    # 進捗キャプチャを実行して現在の進行状況を取得
-                    captured_progress = progress_capture.check_progress()
-                    
-                    # 有効な進捗が得られた場合は更新
-                    if captured_progress is not None:
-                        current_progress = captured_progress
-                    
-                    # Whisperが進捗を出力しない場合でも経過時間を更新
-                    current_elapsed = time.time() - transcription_start
-                    update_progress("processing", file=selected_file, 
-                                   progress=current_progress,
-                                   message=f"処理中... {current_progress}%完了" if current_progress > 0 else "処理中...",
-                                   time_elapsed=current_elapsed)
-                    time.sleep(0.5)  # 短い間隔で確認
-            
-            # 進捗監視スレッド開始
-            monitor_thread = threading.Thread(target=monitor_progress)
-            monitor_thread.daemon = True
-            monitor_thread.start()
-            
-            # 実際の文字起こし処理
-            logging.info(f"文字起こし処理開始: {selected_file}")
-            result = model.transcribe(
-                full_audio_path, 
-                language=language,
-                fp16=(compute_type == "float16"),
-                verbose=True  # 進捗バーを表示するために有効化
-            )
-            logging.info(f"文字起こし処理完了: {selected_file}")
+        update_progress(job_id, "processing", progress=0, message="音声解析の準備中...")
+        check_cancelled(job_id)
+        transcription_start = time.time()
         
-        # 進捗更新スレッドを停止
-        stop_progress_update.set()
+        # 同じ音声・設定の結果がキャッシュにあれば推論を省略
+        cache_key = result_cache.make_key(full_audio_path, job["model"], language, compute_type, BACKEND,
+                                          job["word_timestamps"])
+        result = result_cache.get(cache_key)
+        cached = result is not None
+        if cached:
+            with transcription_lock:
+                jobs[job_id]["cached"] = True
+                notify_progress_changed(jobs[job_id])
+            logging.info(f"キャッシュ済みの結果を使用します: {selected_file}（{format_cache_stats()}）")
+            append_segments(job_id, result["segments"])
+        else:
+            # キャッシュからモデルを借りる（未読み込みまたは再読み込み指定時のみロード）
+            with model_cache.use(job["model"], get_optimal_device(), compute_type,
+                                 reload=job["reload_model"], job_id=job_id) as model:
+                if model is None:
+                    return
+                # モデルの読み込み中に要求されたキャンセルは、文字起こしを始める前に反映する
+                check_cancelled(job_id)
+                
+                # Whisperで文字起こし
+                update_progress(job_id, "processing", progress=0, message="音声解析の準備中...")
+                logging.info(f"文字起こし処理開始: {selected_file}")
+                rtf_key = make_rtf_key(BACKEND, job["model"], get_optimal_device(), compute_type)
+                result = run_whisper(job_id, model, full_audio_path, language, transcription_start,
+                                     job["word_timestamps"], duration=job["duration"], rtf_key=rtf_key)
+                logging.info(f"文字起こし処理完了: {selected_file}（{format_cache_stats()}）")
+            result_cache.put(cache_key, result)
         
         transcription_time = time.time() - transcription_start
         
         # 出力ファイルの作成
-        update_progress("processing", file=selected_file, progress=85, 
+        update_progress(job_id, "processing", progress=85, 
                       message="ファイル保存中...", time_elapsed=transcription_time)
         
-        base_name = os.path.splitext(selected_file)[0]
-        output_file = os.path.join(OUTPUT_FOLDER, f"{base_name}.txt")
-        
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(result["text"])
+        # 途中まで書かれた出力が残らないよう、各形式とも一時ファイル経由で書き込む
+        output_files = write_outputs(result, OUTPUT_FOLDER, selected_file, job["output_formats"])
+        journal.update(job_id, "written")
         
         # 処理済みファイルを移動
-        update_progress("processing", file=selected_file, progress=95, 
+        update_progress(job_id, "processing", progress=95, 
                       message="ファイルを移動中...", time_elapsed=transcription_time)
         
         shutil.move(full_audio_path, os.path.join(PROCESSED_FOLDER, selected_file))
         
         # 完了
-        update_progress("completed", file=selected_file, progress=100, 
-                      message=f"文字起こし完了（処理時間: {transcription_time:.2f}秒）。出力: {base_name}.txt", 
+        cached_note = "キャッシュ済みの結果を使用、" if cached else ""
+        update_progress(job_id, "completed", progress=100, 
+                      message=f"文字起こし完了（{cached_note}処理時間: {transcription_time:.2f}秒）。"
+                              f"出力: {', '.join(os.path.basename(path) for path in output_files)}", 
                       time_elapsed=transcription_time)
         
+    except JobCancelled as e:
+        # 音声は audiofile に残し、途中経過ファイルは削除済み
+        update_progress(job_id, "cancelled", message=str(e))
+        logging.info(f"文字起こしを中断しました: {selected_file}（{e}）")
     except Exception as e:
-        # エラー発生時は進捗更新スレッドを停止
-        stop_progress_update.set()
-        
         error_message = f'エラーが発生しました: {str(e)}'
-        update_progress("error", file=selected_file, message=error_message)
+        update_progress(job_id, "error", message=error_message)
         logging.error(error_message)
 
+def resume_jobs():
+    """前回の起動時に完了しなかったジョブを再開する
+
+    出力済みで音声の移動だけが残っているジョブは移動して完了にし、それ以外はキューに戻す
+    """
+    for job in journal.unfinished("web"):
+        full_audio_path = os.path.join(UPLOAD_FOLDER, job["file"])
+        settings = job["settings"]
+        outputs = output_paths(OUTPUT_FOLDER, job["file"], settings.get("output_formats", ["txt"]))
+        if job["status"] == "written" and all(os.path.exists(path) for path in outputs):
+            finish_move(full_audio_path, os.path.join(PROCESSED_FOLDER, job["file"]))
+            journal.update(job["id"], "completed")
+            logging.info(f"前回出力済みのファイルを処理済みフォルダに移動しました: {job['file']}")
+        elif os.path.exists(full_audio_path):
+            create_job(job["file"], settings["model"], settings["language"], settings["compute_type"],
+                       settings["reload_model"], settings.get("output_formats", ["txt"]),
+                       settings.get("word_timestamps", False), job_id=job["id"],
+                       user=settings.get("user", ""), priority=settings.get("priority", 0),
+                       timeout_minutes=settings.get("timeout_minutes", JOB_TIMEOUT_MINUTES))
+            logging.info(f"前回中断したジョブを再開します: {job['file']}（ジョブID: {job['id']}）")
+        else:
+            journal.update(job["id"], "error", f"ファイル {job['file']} が見つかりません")
+
+def format_cache_stats():
+    """ログ出力用に結果キャッシュのヒット率を整形"""
+    stats = result_cache.stats()
+    return f"結果キャッシュ ヒット率: {stats['hit_rate']:.0%} ({stats['hits']}/{stats['hits'] + stats['misses']})"
+
+def transcription_worker():
+    """キューからジョブを取り出して順に処理するワーカースレッド"""
+    while True:
+        job_id = job_queue.get()
+        try:
+            with transcription_lock:
+                if job_id not in jobs:
+                    continue
+            process_transcription(job_id)
+        except Exception as e:
+            logging.error(f"ワーカーでエラーが発生しました: {e}")
+            update_progress(job_id, "error", message=f'エラーが発生しました: {str(e)}')
+        finally:
+            job_queue.done(job_id)
+
+def start_workers():
+    """ワーカースレッドを起動する（起動済みの場合は何もしない）"""
+    with workers_lock:
+        if worker_threads:
+            return
+        # ワーカー同士でCPUコアを奪い合わないよう、PyTorchのスレッド数を分配する
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // MAX_WORKERS))
+        for i in range(MAX_WORKERS):
+            thread = threading.Thread(target=transcription_worker, name=f"transcription-worker-{i}")
+            thread.daemon = True
+            thread.start()
+            worker_threads.append(thread)
+        logging.info(f"文字起こしワーカーを{MAX_WORKERS}個起動しました")
+
 @app.route('/transcribe', methods=['POST'])
 def transcribe():
-    global model, device
-    
-    # 現在処理中の場合は警告
-    if transcription_progress["status"] in ["processing", "loading_model"]:
-        flash('別の処理が進行中です。完了するまでお待ちください。')
-        return redirect(url_for('index'))
-    
     # モデル選択
     model_name = request.form.get('model', 'base')
     language = request.form.get('language', 'ja')
     compute_type = request.form.get('compute_type', 'float32')
-    
-    # モデルがロードされていないか、異なるモデルが選択された場合、新しくロード
-    if model is None or request.form.get('reload_model', False):
-        device = get_optimal_device()
-        model = load_model(model_name, device)
-        if model is None:
-            flash('モデルのロードに失敗しました')
-            return redirect(url_for('index'))
+    reload_model = bool(request.form.get('reload_model', False))
+    word_timestamps = bool(request.form.get('word_timestamps', False))
+    # 公平配分の単位にする利用者（指定がなければ接続元のアドレス）
+    user = request.form.get('user') or request.remote_addr or ""
+    try:
+        output_formats = parse_output_formats(request.form.getlist('output_format'))
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('index'))
+    try:
+        priority = int(request.form.get('priority', 0))
+    except ValueError:
+        flash('優先度には整数を指定してください')
+        return redirect(url_for('index'))
+    try:
+        timeout_minutes = float(request.form.get('timeout_minutes') or JOB_TIMEOUT_MINUTES)
+        if timeout_minutes < 0:
+            raise ValueError
+    except ValueError:
+        flash('処理時間の上限には0以上の分数を指定してください')
+        return redirect(url_for('index'))
     
     # 処理対象のファイル
     selected_file = request.form.get('selected_file')
@@ -337,13 +1226,18 @@ def transcribe():
         flash(f'ファイル {selected_file} が見つかりません')
         return redirect(url_for('index'))
     
-    # 別スレッドで処理を実行
-    threading.Thread(
-        target=process_transcription, 
-        args=(selected_file, model_name, language, compute_type)
-    ).start()
+    # 同じファイルが既にキューにある場合は二重登録しない
+    if is_file_in_queue(selected_file):
+        flash(f'ファイル {selected_file} は既に処理待ちまたは処理中です')
+        return redirect(url_for('index'))
+    
+    # ジョブをキューに追加し、ワーカーで処理する
+    start_workers()
+    job_id = create_job(selected_file, model_name, language, compute_type, reload_model,
+                        output_formats, word_timestamps, user=user, priority=priority,
+                        timeout_minutes=timeout_minutes)
     
-    flash(f'ファイル {selected_file} の文字起こしを開始しました。進捗状況を確認してください。')
+    flash(f'ファイル {selected_file} をキューに追加しました（ジョブID: {job_id}）。進捗状況を確認してください。')
     return redirect(url_for('index'))
 
 @app.route('/download/<filename>')
@@ -398,6 +1292,11 @@ if __name__ == '__main__':
         # サーバー起動の少し後にブラウザを開く
         Timer(1.5, lambda: open_browser(url)).start()
     
-    # 起動時にはモデルをロードしない（リクエスト時にロードする）
+    # ワーカースレッドを起動して前回中断したジョブを再開し、設定されたモデルをバックグラウンドで事前読み込みする
+    # （事前読み込みの対象外のモデルは最初に必要になった時点でキャッシュに読み込む）
+    start_workers()
+    resume_jobs()
+    start_preload()
+    
     # デバッグモードをオフにして、リロード時に複数ブラウザが開かないようにする
     app.run(debug=False, host='0.0.0.0', port=port) 
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+音声の先読み
+モデルが文字起こしをしている間に、次に処理する数ファイルをスレッドプールでデコード
+（ffmpegで16kHzモノラルに変換）して波形として用意しておき、推論が音声の読み込みを待たないようにする。
+先読みするのは最大 ahead ファイル分で、short_seconds より長い音声は先頭から long_ahead ファイル以内のものだけ、
+max_seconds より長い音声は先読みしないため、保持する波形の量はおよそ
+ahead × short_seconds + long_ahead × max_seconds 秒分に収まる。
+先読みしなかった音声は従来どおり30秒ずつ読み込みながら処理する
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import whisper
+from whisper.audio import CHUNK_LENGTH
+
+from metrics import stage_timer
+from streaming import probe_duration
+
+# デフォルトの先読みファイル数・デコードスレッド数・先読みする音声の最大の長さ（分）
+DEFAULT_PREFETCH_FILES = 2
+DEFAULT_DECODE_THREADS = 1
+DEFAULT_PREFETCH_MAX_MINUTES = 30.0
+
+
+class AudioPrefetcher:
+    """ファイルのリストを先頭から順に先読みし、get() で処理する順に波形を受け取る
+
+    max_seconds より長い音声、先読みを始めた時点で先頭から long_ahead 番目より後ろにある short_seconds より長い音声、
+    should_decode(パス, 長さ（秒）) が偽を返すファイル（結果がキャッシュ済みなど）はデコードせず、get() は None を返す。
+    long_ahead を省略した場合は ahead と同じ。デコードに失敗した場合も None を返すため、
+    呼び出し側はファイルパスで通常どおり処理する（エラーはそこで報告される）
+    """
+
+    def __init__(self, paths, ahead=DEFAULT_PREFETCH_FILES, threads=DEFAULT_DECODE_THREADS,
+                 max_seconds=DEFAULT_PREFETCH_MAX_MINUTES * 60, should_decode=None, long_ahead=None,
+                 short_seconds=CHUNK_LENGTH):
+        self.ahead = ahead
+        self.long_ahead = ahead if long_ahead is None else long_ahead
+        self.short_seconds = short_seconds
+        self.max_seconds = max_seconds
+        self.should_decode = should_decode
+        self.lock = threading.Lock()
+        self.pending = list(paths)
+        self.futures = {}  # パス -> 先読み中または先読み済みの Future（処理する順）
+        self.executor = ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="audio-prefetch")
+        self._fill()
+
+    def _fill(self):
+        with self.lock:
+            while self.pending and len(self.futures) < self.ahead:
+                path = self.pending.pop(0)
+                # 先頭から何番目のファイルとして先読みを始めたか（長い音声を先読みするかの判定に使う）
+                position = len(self.futures)
+                self.futures[path] = self.executor.submit(self._decode, path, position)
+
+    def _decode(self, path, position):
+        try:
+            duration = probe_duration(path)
+            if duration is None or duration > self.max_seconds:
+                return None
+            if duration > self.short_seconds and position >= self.long_ahead:
+                return None
+            if self.should_decode is not None and not self.should_decode(path, duration):
+                return None
+            with stage_timer("audio_decode"):
+                return whisper.load_audio(path)
+        except Exception as e:
+            logging.debug(f"音声を先読みできませんでした: {path}: {e}")
+            return None
+
+    def get(self, path):
+        """path の波形を返す（先読みが終わっていなければ待つ）。先読みしなかった場合は None"""
+        with self.lock:
+            # 飛ばされたファイルの先読みは取り消す
+            for other in list(self.futures):
+                if other == path:
+                    break
+                self.futures.pop(other).cancel()
+            future = self.futures.pop(path, None)
+            if future is None and path in self.pending:
+                self.pending.remove(path)
+        # 受け取ったファイルの分だけ、次のファイルの先読みを始めてから待つ
+        self._fill()
+        if future is None:
+            return None
+        with stage_timer("prefetch_wait"):
+            return future.result()
+
+    def close(self):
+        """まだ始まっていない先読みを取り消し、デコード中のものは終わるのを待つ"""
+        with self.lock:
+            self.pending = []
+            for future in self.futures.values():
+                future.cancel()
+            self.futures = {}
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
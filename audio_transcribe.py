@@ -5,7 +5,23 @@ import torch
 import argparse
 import logging
 import time
+import math
+import signal
+import contextlib
+import multiprocessing
 from tqdm import tqdm
+from result_cache import ResultCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_MB
+from feature_cache import FeatureCache, DEFAULT_FEATURE_CACHE_DIR, DEFAULT_FEATURE_CACHE_MB
+from audio_prefetch import AudioPrefetcher, DEFAULT_PREFETCH_FILES, DEFAULT_DECODE_THREADS, DEFAULT_PREFETCH_MAX_MINUTES
+from long_audio import split_on_silence, merge_chunk_results
+from backends import BACKENDS, DEFAULT_BACKEND, load_backend
+from batching import is_short_audio
+from streaming import probe_duration
+from whisper.audio import CHUNK_LENGTH
+from folder_watch import FolderWatcher
+from job_journal import JobJournal, DEFAULT_JOURNAL_PATH, atomic_write_text, file_signature
+from metrics import REGISTRY, format_summary, stage_timer
+from output_writers import OUTPUT_FORMATS, PartialOutput, parse_output_formats, output_paths, write_outputs
 
 # ロギングの設定
 logging.basicConfig(
@@ -14,15 +30,74 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# デフォルトのフォルダ
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 def setup_parser():
     parser = argparse.ArgumentParser(description="Whisper音声文字起こしツール")
     parser.add_argument("--model", default="turbo", help="使用するWhisperモデル (tiny, base, small, medium, large)")
     parser.add_argument("--language", default="ja", help="文字起こしする言語")
     parser.add_argument("--device", default="cpu", help="使用するデバイス (cpu, cuda, auto)")
-    parser.add_argument("--batch_size", type=int, default=16, help="バッチサイズ")
-    parser.add_argument("--compute_type", default="float32", help="計算タイプ (float16, float32)")
+    parser.add_argument("--batch_size", type=int, default=16,
+                        help="30秒以下の短い音声をまとめてデコードするファイル数 (1 で無効)")
+    parser.add_argument("--compute_type", default="float32", help="計算タイプ (float16, float32, int8)")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=list(BACKENDS),
+                        help="推論バックエンド (whisper: openai-whisper, faster-whisper: CTranslate2)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="並列に文字起こしするワーカープロセス数 (0 で CPU コア数)")
+    parser.add_argument("--result_cache_dir", default=DEFAULT_CACHE_DIR, help="文字起こし結果キャッシュの保存先")
+    parser.add_argument("--result_cache_mb", type=int, default=DEFAULT_MAX_MB,
+                        help="文字起こし結果キャッシュの容量上限 (MB, 0 でキャッシュを無効化)")
+    parser.add_argument("--feature_cache_dir", default=DEFAULT_FEATURE_CACHE_DIR,
+                        help="log-melなどの特徴量キャッシュの保存先")
+    parser.add_argument("--feature_cache_mb", type=int, default=DEFAULT_FEATURE_CACHE_MB,
+                        help="特徴量キャッシュの容量上限 (MB, 0 でキャッシュを無効化)")
+    parser.add_argument("--feature_cache_encoder", action="store_true",
+                        help="log-melに加えてエンコーダ出力も特徴量キャッシュに保存する（モデルごとに保存され容量が大きい）")
+    parser.add_argument("--prefetch_files", type=int, default=DEFAULT_PREFETCH_FILES,
+                        help="文字起こし中に次のファイルをデコードして先読みしておくファイル数 (0 で無効)")
+    parser.add_argument("--decode_threads", type=int, default=DEFAULT_DECODE_THREADS,
+                        help="先読みで音声をデコードするスレッド数")
+    parser.add_argument("--prefetch_max_minutes", type=float, default=DEFAULT_PREFETCH_MAX_MINUTES,
+                        help="先読みする音声の最大の長さ (分)。これより長い音声は30秒ずつ読み込みながら処理する")
+    parser.add_argument("--long_audio_workers", type=int, default=0,
+                        help="長時間音声を無音位置で分割し、チャンクを並列に文字起こしするワーカープロセス数 (0 で無効)")
+    parser.add_argument("--chunk_minutes", type=float, default=5.0,
+                        help="長時間音声を分割する際の目安のチャンク長 (分)")
+    parser.add_argument("--output_format", default="txt",
+                        help=f"出力形式をカンマ区切りで指定 ({', '.join(OUTPUT_FORMATS)}, all)")
+    parser.add_argument("--word_timestamps", action="store_true",
+                        help="単語ごとのタイムスタンプを求める（json に出力され、srt/vtt では単語の時刻で8単語ずつ字幕を区切る）")
+    parser.add_argument("--journal_path", default=DEFAULT_JOURNAL_PATH,
+                        help="処理状況を記録するジョブジャーナルの保存先（空文字で無効）")
+    parser.add_argument("--watch", action="store_true",
+                        help="処理後も入力フォルダを監視し続け、新しく置かれた音声ファイルを自動で文字起こしする")
+    parser.add_argument("--watch_stable_seconds", type=float, default=2.0,
+                        help="ファイルの書き込みが終わったとみなすまでに、サイズと更新時刻が変化しない秒数")
+    parser.add_argument("--watch_interval", type=float, default=2.0,
+                        help="inotifyが使えない場合にフォルダを走査する間隔（秒）")
+    parser.add_argument("--watch_polling", action="store_true", help="inotifyを使わずポーリングでフォルダを監視する")
+    parser.add_argument("--metrics_output", default="",
+                        help="終了時に性能メトリクスをPrometheusのテキスト形式で書き出すファイル")
+    parser.add_argument("--input_dir", default=os.path.join(BASE_DIR, "audiofile"), help="処理対象の音声ファイルのフォルダ")
+    parser.add_argument("--output_dir", default=os.path.join(BASE_DIR, "output"), help="文字起こし結果の出力先フォルダ")
+    parser.add_argument("--processed_dir", default=os.path.join(BASE_DIR, "processed"), help="処理済み音声ファイルの移動先フォルダ")
     return parser
 
+# 処理対象とする音声ファイルの拡張子
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".aac", ".ogg")
+
+# ワーカープロセスごとに保持するモデルと設定
+_worker_model = None
+_worker_settings = None
+_worker_result_cache = None
+
+# プロセスごとに開くジョブジャーナル（ワーカープロセスも同じファイルに記録する）
+_job_journal = None
+
+# プロセスごとに開く特徴量キャッシュ
+_feature_cache = None
+
 def get_optimal_device():
     """最適なデバイスを検出"""
     if torch.cuda.is_available():
@@ -30,11 +105,509 @@ def get_optimal_device():
     # MPS (Apple Silicon) はWhisperと互換性がないため使用しない
     return "cpu"
 
+def load_whisper_model(model_name, device, backend=DEFAULT_BACKEND, compute_type="float32"):
+    """推論バックエンドでモデルをロードし、(モデル, デバイス) を返す。失敗時はCPUにフォールバックする"""
+    try:
+        start_time = time.time()
+        model = load_backend(backend, model_name, device, compute_type)
+        logging.info(f"{model_name}モデルを{device}デバイスで読み込みました（バックエンド: {backend}、所要時間: {time.time() - start_time:.2f}秒）")
+        return model, device
+    except Exception as e:
+        logging.error(f"モデル読み込みエラー: {e}")
+        if device != "cpu":
+            logging.info(f"{device}での読み込みに失敗しました。CPUにフォールバックします。")
+            try:
+                start_time = time.time()
+                model = load_backend(backend, model_name, "cpu", compute_type)
+                logging.info(
+                    f"{model_name}モデルをcpuデバイスで読み込みました（バックエンド: {backend}、所要時間: {time.time() - start_time:.2f}秒）")
+                return model, "cpu"
+            except Exception as e_cpu:
+                logging.error(f"CPUでのモデル読み込みも失敗しました: {e_cpu}")
+        return None, device
+
+def create_result_cache(settings):
+    """設定に応じて結果キャッシュを作成（容量0の場合は無効）"""
+    if settings["result_cache_mb"] <= 0:
+        return None
+    return ResultCache(settings["result_cache_dir"], settings["result_cache_mb"] * 1024 * 1024)
+
+def get_feature_cache(settings):
+    """このプロセスの特徴量キャッシュを返す（容量0の場合は None）"""
+    global _feature_cache
+    if settings["feature_cache_mb"] <= 0:
+        return None
+    if _feature_cache is None:
+        _feature_cache = FeatureCache(settings["feature_cache_dir"], settings["feature_cache_mb"] * 1024 * 1024,
+                                      settings["feature_cache_encoder"])
+    return _feature_cache
+
+def get_job_journal(settings):
+    """このプロセスのジョブジャーナルを返す（無効の場合は None）"""
+    global _job_journal
+    if not settings["journal_path"]:
+        return None
+    if _job_journal is None:
+        _job_journal = JobJournal(settings["journal_path"])
+    return _job_journal
+
+def record_job(audio_file, settings, status, message=""):
+    """ファイルの処理状況をジョブジャーナルに記録する"""
+    journal = get_job_journal(settings)
+    if journal is None:
+        return
+    full_audio_path = os.path.abspath(os.path.join(settings["audio_folder"], audio_file))
+    if status == "processing":
+        journal.add(full_audio_path, "cli", audio_file, {
+            "signature": file_signature(full_audio_path),
+            "output_folder": os.path.abspath(settings["output_folder"]),
+            "output_formats": list(settings["output_formats"]),
+            "processed_folder": os.path.abspath(settings["processed_folder"])
+        }, status=status)
+    else:
+        journal.update(full_audio_path, status, message)
+
+def resume_interrupted_jobs(settings):
+    """前回中断したジョブを確認し、出力済みで音声の移動だけが残っているファイルは移動して完了にする
+
+    文字起こしの途中で中断したファイルは入力フォルダに残っているため、通常どおり再処理される
+    """
+    journal = get_job_journal(settings)
+    if journal is None:
+        return
+    audio_folder = os.path.abspath(settings["audio_folder"])
+    for job in journal.unfinished("cli"):
+        full_audio_path = job["id"]
+        if os.path.dirname(full_audio_path) != audio_folder:
+            continue
+        if not os.path.exists(full_audio_path):
+            # 移動は済んでいる（written の場合）か、ファイルが削除された
+            journal.update(job["id"], "completed" if job["status"] == "written" else "error",
+                           "" if job["status"] == "written" else "音声ファイルが見つかりません")
+            continue
+        outputs = output_paths(job["settings"]["output_folder"], job["file"],
+                               job["settings"].get("output_formats", ["txt"]))
+        if (job["status"] == "written" and all(os.path.exists(path) for path in outputs)
+                and file_signature(full_audio_path) == job["settings"]["signature"]):
+            shutil.move(full_audio_path, os.path.join(job["settings"]["processed_folder"], job["file"]))
+            journal.update(job["id"], "completed")
+            logging.info(f"前回出力済みのファイルを処理済みフォルダに移動しました: {job['file']}")
+        else:
+            logging.info(f"前回中断したファイルを再処理します: {job['file']}")
+
+def result_cache_key(result_cache, full_audio_path, settings):
+    """音声ファイルと文字起こし設定に対応する結果キャッシュのキー"""
+    return result_cache.make_key(full_audio_path, settings["model"], settings["language"],
+                                 settings["compute_type"], settings["backend"], settings["word_timestamps"])
+
+def create_prefetcher(audio_files, settings, result_cache=None, batch_size=1, chunked=False):
+    """audio_files を先頭から先読みするプリフェッチャを返す（無効の場合は何もしないコンテキスト）
+
+    結果がキャッシュ済みのファイルと、log-melがキャッシュ済みでそれを使って処理されるファイルはデコードしない
+    （batch_size: 短い音声をまとめてデコードする数、chunked: 長時間音声を分割して処理する場合）。
+    まとめてデコードする場合はバッチの全ファイルを推論の前に受け取るため、少なくとも1バッチ分を先読みし、
+    あるバッチを推論している間に次のバッチをデコードしておく。
+    ただし1バッチ分まで先読みするのはバッチにまとめる30秒以下の音声だけで、それより長い音声は
+    prefetch_files ファイル以内のものだけを先読みする（メモリ使用量を抑え、その他はストリーミングで処理する）
+    """
+    if settings["prefetch_files"] <= 0:
+        return contextlib.nullcontext()
+    batched = batch_size > 1
+    feature_cache = get_feature_cache(settings) if settings["backend"] == "whisper" and not chunked else None
+
+    def should_decode(full_audio_path, duration):
+        if result_cache is not None and result_cache.contains(result_cache_key(result_cache, full_audio_path, settings)):
+            return False
+        # 特徴量キャッシュを使うのは、ファイルを1つずつ文字起こしする場合だけ
+        uses_features = not batched or duration > CHUNK_LENGTH
+        return not (feature_cache is not None and uses_features and feature_cache.has_mel(full_audio_path))
+
+    return AudioPrefetcher(
+        [os.path.join(settings["audio_folder"], audio_file) for audio_file in audio_files],
+        ahead=max(settings["prefetch_files"], batch_size),
+        long_ahead=settings["prefetch_files"],
+        threads=settings["decode_threads"],
+        max_seconds=settings["prefetch_max_minutes"] * 60,
+        should_decode=should_decode
+    )
+
+def take_prefetched(prefetcher, audio_file, settings):
+    """先読み済みの波形を受け取る（先読みしていない場合は None）"""
+    if prefetcher is None:
+        return None
+    return prefetcher.get(os.path.join(settings["audio_folder"], audio_file))
+
+def run_model(model, audio, settings, segment_callback=None, audio_path=None):
+    """推論バックエンドで文字起こしを実行（audio はファイルパスまたは16kHzの波形）
+
+    ファイルパスの場合（先読み済みの波形では audio_path に元のファイルを指定した場合）は、
+    特徴量キャッシュに保存したlog-melなどを再利用する
+    """
+    source = audio if isinstance(audio, str) else audio_path
+    feature_cache = get_feature_cache(settings) if source is not None else None
+    return model.transcribe(audio, language=settings["language"], word_timestamps=settings["word_timestamps"],
+                            segment_callback=segment_callback, feature_cache=feature_cache, audio_path=audio_path)
+
+def transcribe_in_chunks(full_audio_path, settings, chunk_pool, audio=None):
+    """音声を無音位置で分割し、チャンクをワーカープロセスで並列に文字起こしして結合する"""
+    if audio is None:
+        with stage_timer("audio_decode"):
+            audio = whisper.load_audio(full_audio_path)
+    chunks = split_on_silence(audio, chunk_seconds=settings["chunk_minutes"] * 60)
+    logging.info(f"{len(audio) / whisper.audio.SAMPLE_RATE:.0f}秒の音声を{len(chunks)}個のチャンクに分割しました")
+    results = chunk_pool.map(worker_transcribe_chunk, [audio[start:end] for start, end in chunks], chunksize=1)
+    return merge_chunk_results([merge_worker_metrics(result) for result in results], [start for start, _ in chunks])
+
+def transcribe_file(model, audio_file, settings, result_cache=None, chunk_pool=None, audio=None):
+    """1つの音声ファイルを文字起こしして出力し、処理済みフォルダへ移動する
+
+    chunk_pool を指定した場合は、音声を分割してプール内のワーカーで並列に文字起こしする。
+    audio に先読み済みの波形を指定すると、ファイルを読み込まずにそれを使う
+    """
+    full_audio_path = os.path.join(settings["audio_folder"], audio_file)
+    
+    logging.info(f"処理中: {audio_file}")
+    
+    try:
+        record_job(audio_file, settings, "processing")
+        transcription_start = time.time()
+        
+        # 同じ音声・設定の結果がキャッシュにあれば推論を省略
+        result = None
+        if result_cache is not None:
+            cache_key = result_cache_key(result_cache, full_audio_path, settings)
+            result = result_cache.get(cache_key)
+            if result is not None:
+                logging.info(f"キャッシュ済みの結果を使用します: {audio_file}")
+        
+        if result is None:
+            # Whisperで文字起こし
+            if chunk_pool is not None:
+                result = transcribe_in_chunks(full_audio_path, settings, chunk_pool, audio)
+            else:
+                # 確定したセグメントから途中経過ファイルに書き出す
+                with PartialOutput(settings["output_folder"], audio_file) as partial:
+                    result = run_model(model, audio if audio is not None else full_audio_path, settings,
+                                       segment_callback=partial.write_segments, audio_path=full_audio_path)
+            if result_cache is not None:
+                result_cache.put(cache_key, result)
+        
+        transcription_time = time.time() - transcription_start
+        save_transcription(audio_file, result, settings, transcription_time)
+        return True
+        
+    except Exception as e:
+        logging.error(f"ファイル '{audio_file}' の処理中にエラーが発生しました: {e}")
+        record_job(audio_file, settings, "error", str(e))
+        return False
+
+def save_transcription(audio_file, result, settings, transcription_time):
+    """文字起こし結果を指定の形式で出力し、音声ファイルを処理済みフォルダへ移動する"""
+    # 途中まで書かれた出力が残らないよう、各形式とも一時ファイル経由で書き込む
+    output_files = write_outputs(result, settings["output_folder"], audio_file, settings["output_formats"])
+    record_job(audio_file, settings, "written")
+    
+    # 音声ファイルの長さを取得（概算）
+    audio_info = f"文字起こし完了（処理時間: {transcription_time:.2f}秒）"
+    logging.info(f"{audio_info}")
+    logging.info(f"文字起こし結果は {', '.join(output_files)} に保存されました")
+    
+    # 処理済みファイルを移動
+    shutil.move(os.path.join(settings["audio_folder"], audio_file),
+                os.path.join(settings["processed_folder"], audio_file))
+    record_job(audio_file, settings, "completed")
+    logging.info(f"処理済みファイルを {settings['processed_folder']} に移動しました")
+
+def transcribe_file_batch(model, audio_files, settings, result_cache=None, prefetcher=None):
+    """短い音声（30秒以下）をまとめてバッチデコードし、長い音声は1ファイルずつ文字起こしする
+
+    prefetcher を指定すると、先読み済みの波形を使う。
+    ファイルごとに (成功したか, キャッシュにヒットしたか) のリストを返す
+    """
+    outcomes = {}
+    batch = []  # (ファイル名, キャッシュキー, 波形)
+    for audio_file in audio_files:
+        full_audio_path = os.path.join(settings["audio_folder"], audio_file)
+        prefetched = take_prefetched(prefetcher, audio_file, settings)
+        if prefetched is not None:
+            duration = len(prefetched) / whisper.audio.SAMPLE_RATE
+        else:
+            duration = probe_duration(full_audio_path)
+        if duration is None or duration > CHUNK_LENGTH:
+            # 長い音声は従来どおり30秒ずつ（先読み済みの場合はその波形から）処理する
+            hits_before = result_cache.hits if result_cache else 0
+            ok = transcribe_file(model, audio_file, settings, result_cache, audio=prefetched)
+            outcomes[audio_file] = (ok, (result_cache.hits if result_cache else 0) > hits_before)
+            continue
+        
+        logging.info(f"処理中: {audio_file}")
+        try:
+            record_job(audio_file, settings, "processing")
+            cache_key = None
+            if result_cache is not None:
+                cache_key = result_cache_key(result_cache, full_audio_path, settings)
+                result = result_cache.get(cache_key)
+                if result is not None:
+                    logging.info(f"キャッシュ済みの結果を使用します: {audio_file}")
+                    save_transcription(audio_file, result, settings, 0.0)
+                    outcomes[audio_file] = (True, True)
+                    continue
+            audio = prefetched
+            if audio is None:
+                with stage_timer("audio_decode"):
+                    audio = whisper.load_audio(full_audio_path)
+            batch.append((audio_file, cache_key, audio))
+        except Exception as e:
+            logging.error(f"ファイル '{audio_file}' の処理中にエラーが発生しました: {e}")
+            record_job(audio_file, settings, "error", str(e))
+            outcomes[audio_file] = (False, False)
+    
+    if batch:
+        transcription_start = time.time()
+        # 長さの判定に誤差があった場合に備え、30秒を超えた音声はバッチに含めない
+        short = [i for i, (_, _, audio) in enumerate(batch) if is_short_audio(audio)]
+        results = [None] * len(batch)
+        try:
+            logging.info(f"{len(short)}個の短い音声をまとめてデコードします")
+            batch_results = model.transcribe_batch([batch[i][2] for i in short], language=settings["language"],
+                                                   word_timestamps=settings["word_timestamps"])
+            for i, result in zip(short, batch_results):
+                results[i] = result
+        except Exception as e:
+            logging.error(f"バッチデコード中にエラーが発生しました。1ファイルずつ処理します: {e}")
+        batch_time = (time.time() - transcription_start) / len(batch)
+        
+        for (audio_file, cache_key, audio), result in zip(batch, results):
+            try:
+                transcription_time = batch_time
+                if result is None:
+                    file_start = time.time()
+                    result = run_model(model, audio, settings)
+                    transcription_time += time.time() - file_start
+                if result_cache is not None:
+                    result_cache.put(cache_key, result)
+                save_transcription(audio_file, result, settings, transcription_time)
+                outcomes[audio_file] = (True, False)
+            except Exception as e:
+                logging.error(f"ファイル '{audio_file}' の処理中にエラーが発生しました: {e}")
+                record_job(audio_file, settings, "error", str(e))
+                outcomes[audio_file] = (False, False)
+    
+    return [outcomes[audio_file] for audio_file in audio_files]
+
+def init_worker(model_name, device, num_threads, settings):
+    """ワーカープロセスの初期化：スレッド数を制限し、モデルを一度だけロードする"""
+    global _worker_model, _worker_settings, _worker_result_cache
+    # Ctrl+C は親プロセスだけが受け取り、ワーカーは親がプールを閉じるときに終了させる
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # ワーカー同士でCPUコアを奪い合わないよう、プロセスごとのスレッド数を制限
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    _worker_model, _ = load_whisper_model(model_name, device, settings["backend"], settings["compute_type"])
+    _worker_settings = settings
+    _worker_result_cache = create_result_cache(settings)
+
+def with_worker_metrics(value):
+    """ワーカープロセスの戻り値に、前回以降に計測した性能メトリクスを添える"""
+    return value, REGISTRY.drain()
+
+def merge_worker_metrics(item):
+    """ワーカープロセスの戻り値から性能メトリクスを取り出して合算し、元の戻り値を返す"""
+    value, state = item
+    REGISTRY.merge(state)
+    return value
+
+def worker_transcribe(audio_file):
+    """ワーカープロセス上で1ファイルを処理し、(成功したか, キャッシュにヒットしたか) を返す"""
+    if _worker_model is None:
+        logging.error(f"モデルが読み込まれていないため '{audio_file}' を処理できません")
+        return with_worker_metrics((False, False))
+    hits_before = _worker_result_cache.hits if _worker_result_cache else 0
+    ok = transcribe_file(_worker_model, audio_file, _worker_settings, _worker_result_cache)
+    hits_after = _worker_result_cache.hits if _worker_result_cache else 0
+    return with_worker_metrics((ok, hits_after > hits_before))
+
+def worker_transcribe_batch(audio_files):
+    """ワーカープロセス上で複数ファイルをまとめて処理し、ファイルごとの (成功したか, キャッシュにヒットしたか) を返す"""
+    if _worker_model is None:
+        logging.error(f"モデルが読み込まれていないため {len(audio_files)}個のファイルを処理できません")
+        return with_worker_metrics([(False, False)] * len(audio_files))
+    # ワーカーには次のバッチが分からないため、このバッチ内のファイルだけを先読みする
+    with create_prefetcher(audio_files, _worker_settings, _worker_result_cache,
+                           batch_size=len(audio_files)) as prefetcher:
+        return with_worker_metrics(
+            transcribe_file_batch(_worker_model, audio_files, _worker_settings, _worker_result_cache, prefetcher))
+
+def worker_transcribe_chunk(audio):
+    """ワーカープロセス上で長時間音声の1チャンクを文字起こしする"""
+    if _worker_model is None:
+        raise RuntimeError("モデルが読み込まれていないためチャンクを処理できません")
+    return with_worker_metrics(run_model(_worker_model, audio, _worker_settings))
+
+def make_batches(audio_files, batch_size):
+    """ファイルのリストを batch_size 個ずつに分ける"""
+    return [audio_files[i:i + batch_size] for i in range(0, len(audio_files), batch_size)]
+
+def log_cache_stats(hits, total):
+    """結果キャッシュのヒット率をログに出力"""
+    hit_rate = hits / total if total else 0.0
+    logging.info(f"結果キャッシュ ヒット率: {hit_rate:.0%} ({hits}/{total})")
+
+def create_worker_pool(workers, args, device, settings):
+    """モデルを読み込んだワーカープロセスのプールを作成する"""
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    if device == "cuda":
+        logging.warning("CUDA使用時は各ワーカーがGPUメモリにモデルを読み込みます。メモリ不足に注意してください")
+    logging.info(f"{workers}個のワーカープロセスで処理します（ワーカーあたりのスレッド数: {num_threads}）")
+    
+    # CUDAとOpenMPのスレッドを安全に扱うため spawn でプロセスを生成する
+    context = multiprocessing.get_context("spawn")
+    return context.Pool(
+        processes=workers,
+        initializer=init_worker,
+        initargs=(args.model, device, num_threads, settings)
+    )
+
+def transcribe_with_model(model, audio_files, args, settings, result_cache):
+    """読み込み済みのモデルで音声ファイルを順に文字起こしする
+
+    文字起こしの間に、次に処理するファイルをバックグラウンドでデコードしておく
+    """
+    batched = args.batch_size > 1
+    with create_prefetcher(audio_files, settings, result_cache, batch_size=args.batch_size) as prefetcher:
+        if batched:
+            # 短い音声は batch_size 個ずつまとめてデコードする
+            with tqdm(total=len(audio_files), desc="文字起こし処理") as progress:
+                for batch in make_batches(audio_files, args.batch_size):
+                    transcribe_file_batch(model, batch, settings, result_cache, prefetcher)
+                    progress.update(len(batch))
+        else:
+            for audio_file in tqdm(audio_files, desc="文字起こし処理"):
+                transcribe_file(model, audio_file, settings, result_cache,
+                                audio=take_prefetched(prefetcher, audio_file, settings))
+
+def transcribe_on_pool(pool, workers, audio_files, args):
+    """ワーカープロセスのプールで音声ファイルを文字起こしし、ファイルごとの (成功したか, キャッシュにヒットしたか) を返す"""
+    if args.batch_size > 1:
+        # すべてのワーカーに仕事が行き渡るよう、ファイル数が少ない場合はバッチを小さくする
+        batch_size = min(args.batch_size, math.ceil(len(audio_files) / workers))
+        results = []
+        with tqdm(total=len(audio_files), desc="文字起こし処理") as progress:
+            for item in pool.imap_unordered(worker_transcribe_batch,
+                                            make_batches(audio_files, batch_size), chunksize=1):
+                batch_results = merge_worker_metrics(item)
+                results.extend(batch_results)
+                progress.update(len(batch_results))
+        return results
+    # chunksize=1 で空いたワーカーから順にファイルを取り出す
+    return [merge_worker_metrics(item) for item in tqdm(
+        pool.imap_unordered(worker_transcribe, audio_files, chunksize=1),
+        total=len(audio_files),
+        desc="文字起こし処理"
+    )]
+
+def transcribe_with_workers(audio_files, args, device, settings):
+    """複数のワーカープロセスで音声ファイルを並列に文字起こしする"""
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    workers = min(workers, len(audio_files))
+    with create_worker_pool(workers, args, device, settings) as pool:
+        results = transcribe_on_pool(pool, workers, audio_files, args)
+    logging.info(f"{sum(ok for ok, _ in results)}/{len(audio_files)}個のファイルを処理しました")
+    if settings["result_cache_mb"] > 0:
+        log_cache_stats(sum(hit for _, hit in results), len(results))
+
+def transcribe_long_audio_files(audio_files, args, device, settings):
+    """ファイルを1つずつ分割し、チャンクを複数のワーカープロセスで並列に文字起こしする"""
+    result_cache = create_result_cache(settings)
+    with create_worker_pool(args.long_audio_workers, args, device, settings) as pool, \
+            create_prefetcher(audio_files, settings, result_cache, chunked=True) as prefetcher:
+        for audio_file in tqdm(audio_files, desc="文字起こし処理"):
+            transcribe_file(None, audio_file, settings, result_cache, chunk_pool=pool,
+                            audio=take_prefetched(prefetcher, audio_file, settings))
+    
+    if result_cache is not None:
+        stats = result_cache.stats()
+        log_cache_stats(stats["hits"], stats["hits"] + stats["misses"])
+
+def watch_audio_folder(args, device, settings):
+    """入力フォルダを監視し、書き込みが終わった音声ファイルから順に文字起こしする（Ctrl+C で終了）"""
+    # systemd などからの停止要求も Ctrl+C と同じように扱う
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    watcher = FolderWatcher(
+        settings["audio_folder"],
+        AUDIO_EXTENSIONS,
+        stable_seconds=args.watch_stable_seconds,
+        poll_interval=args.watch_interval,
+        use_inotify=not args.watch_polling
+    )
+    result_cache = create_result_cache(settings)
+    with contextlib.ExitStack() as stack:
+        stack.callback(watcher.close)
+        # モデル（またはワーカープロセス）は最初に一度だけ用意し、監視中は常駐させる
+        if args.long_audio_workers > 0:
+            pool = stack.enter_context(create_worker_pool(args.long_audio_workers, args, device, settings))
+
+            def process(audio_files):
+                with create_prefetcher(audio_files, settings, result_cache, chunked=True) as prefetcher:
+                    for audio_file in tqdm(audio_files, desc="文字起こし処理"):
+                        transcribe_file(None, audio_file, settings, result_cache, chunk_pool=pool,
+                                        audio=take_prefetched(prefetcher, audio_file, settings))
+        elif args.workers != 1:
+            workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+            pool = stack.enter_context(create_worker_pool(workers, args, device, settings))
+
+            def process(audio_files):
+                results = transcribe_on_pool(pool, workers, audio_files, args)
+                logging.info(f"{sum(ok for ok, _ in results)}/{len(audio_files)}個のファイルを処理しました")
+        else:
+            model, device = load_whisper_model(args.model, device, args.backend, args.compute_type)
+            if model is None:
+                return
+
+            def process(audio_files):
+                transcribe_with_model(model, audio_files, args, settings, result_cache)
+
+        logging.info(f"{settings['audio_folder']} の監視を開始しました（{watcher.mode}、終了するには Ctrl+C）")
+        try:
+            while True:
+                audio_files = watcher.scan()
+                if not audio_files:
+                    watcher.wait()
+                    continue
+                logging.info(f"{len(audio_files)}個の新しい音声ファイルを検出しました")
+                process(audio_files)
+                # 失敗してフォルダに残ったファイルは、更新されるまで再処理しない
+                watcher.mark_attempted(audio_files)
+        except KeyboardInterrupt:
+            logging.info("フォルダの監視を終了します")
+    
+    if result_cache is not None:
+        stats = result_cache.stats()
+        log_cache_stats(stats["hits"], stats["hits"] + stats["misses"])
+
+def report_metrics(metrics_output):
+    """性能メトリクスの集計をログに出力し、指定があればPrometheusのテキスト形式で書き出す"""
+    logging.info(format_summary())
+    if metrics_output:
+        atomic_write_text(metrics_output, REGISTRY.render())
+        logging.info(f"性能メトリクスを {metrics_output} に保存しました")
+
 def transcribe_audio_files():
     # コマンドラインパラメータの解析
     parser = setup_parser()
     args = parser.parse_args()
+    try:
+        output_formats = parse_output_formats(args.output_format)
+    except ValueError as e:
+        parser.error(str(e))
     
+    try:
+        run_transcription(args, output_formats)
+    finally:
+        report_metrics(args.metrics_output)
+
+def run_transcription(args, output_formats):
+    """指定された設定で入力フォルダの音声ファイルを文字起こしする"""
     # デバイスの選択
     if args.device == "auto":
         device = get_optimal_device()
@@ -48,101 +621,86 @@ def transcribe_audio_files():
         logging.info(f"CUDA デバイス: {torch.cuda.get_device_name(0)}")
         logging.info(f"利用可能なGPUメモリ: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
     
-    # モデルのロード
-    try:
-        # 警告を避けるためweights_only=Trueを追加
-        start_time = time.time()
-        model = whisper.load_model(
-            args.model,
-            device=device,
-            download_root=os.path.join(os.path.expanduser("~"), ".cache", "whisper")
-        )
-        logging.info(f"{args.model}モデルを{device}デバイスで読み込みました（所要時間: {time.time() - start_time:.2f}秒）")
-        
-        # システム情報を表示
-        system_info = "RAM 16GB"
-        if torch.cuda.is_available():
-            system_info += f", GPU: {torch.cuda.get_device_name(0)}"
-        else:
-            system_info += ", CPU のみ"
-        logging.info(f"システム情報: {system_info}")
-        logging.info(f"計算タイプ: {args.compute_type}")
-    except Exception as e:
-        logging.error(f"モデル読み込みエラー: {e}")
-        if device != "cpu":
-            logging.info(f"{device}での読み込みに失敗しました。CPUにフォールバックします。")
-            try:
-                start_time = time.time()
-                model = whisper.load_model(
-                    args.model,
-                    device="cpu",
-                    download_root=os.path.join(os.path.expanduser("~"), ".cache", "whisper")
-                )
-                device = "cpu"
-                logging.info(
-                    f"{args.model}モデルをcpuデバイスで読み込みました（所要時間: {time.time() - start_time:.2f}秒）")
-            except Exception as e_cpu:
-                logging.error(f"CPUでのモデル読み込みも失敗しました: {e_cpu}")
-                return
-        else:
-            return
-
     # 処理対象フォルダと出力フォルダを指定
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    audio_folder = os.path.join(base_dir, "audiofile")
-    output_folder = os.path.join(base_dir, "output")
-    processed_folder = os.path.join(base_dir, "processed")
+    audio_folder = args.input_dir
+    output_folder = args.output_dir
+    processed_folder = args.processed_dir
 
     # 必要なフォルダが存在しない場合は作成
     for folder in [audio_folder, output_folder, processed_folder]:
         os.makedirs(folder, exist_ok=True)
 
+    settings = {
+        "audio_folder": audio_folder,
+        "output_folder": output_folder,
+        "processed_folder": processed_folder,
+        "model": args.model,
+        "language": args.language,
+        "compute_type": args.compute_type,
+        "backend": args.backend,
+        "result_cache_dir": args.result_cache_dir,
+        "result_cache_mb": args.result_cache_mb,
+        "feature_cache_dir": args.feature_cache_dir,
+        "feature_cache_mb": args.feature_cache_mb,
+        "feature_cache_encoder": args.feature_cache_encoder,
+        "chunk_minutes": args.chunk_minutes,
+        "prefetch_files": args.prefetch_files,
+        "decode_threads": args.decode_threads,
+        "prefetch_max_minutes": args.prefetch_max_minutes,
+        "output_formats": output_formats,
+        "word_timestamps": args.word_timestamps,
+        "journal_path": args.journal_path
+    }
+
+    # 前回の実行が途中で終了していた場合は、中断したジョブの後始末をする
+    resume_interrupted_jobs(settings)
+
+    if args.watch:
+        logging.info(f"計算タイプ: {args.compute_type}、推論バックエンド: {args.backend}")
+        watch_audio_folder(args, device, settings)
+        return
+
     # フォルダ内の音声ファイルを取得
-    audio_files = [f for f in os.listdir(audio_folder) if f.lower().endswith((".mp3", ".wav", ".m4a", ".flac", ".aac", ".ogg"))]
+    audio_files = [f for f in os.listdir(audio_folder) if f.lower().endswith(AUDIO_EXTENSIONS)]
 
-    if audio_files:
-        logging.info(f"{len(audio_files)}個の音声ファイルが見つかりました")
-        
-        # プログレスバーでの処理表示
-        for audio_file in tqdm(audio_files, desc="文字起こし処理"):
-            full_audio_path = os.path.join(audio_folder, audio_file)
-            
-            logging.info(f"処理中: {audio_file}")
-            
-            try:
-                # Whisperで文字起こし
-                transcription_start = time.time()
-                
-                result = model.transcribe(
-                    full_audio_path, 
-                    language=args.language,
-                    fp16=(args.compute_type == "float16"),
-                    verbose=False
-                )
-                
-                transcription_time = time.time() - transcription_start
-                
-                # 出力ファイルの作成
-                base_name = os.path.splitext(audio_file)[0]
-                output_file = os.path.join(output_folder, f"{base_name}.txt")
-                
-                with open(output_file, "w", encoding="utf-8") as f:
-                    f.write(result["text"])
-                
-                # 音声ファイルの長さを取得（概算）
-                audio_info = f"文字起こし完了（処理時間: {transcription_time:.2f}秒）"
-                logging.info(f"{audio_info}")
-                logging.info(f"テキストは {output_file} に保存されました")
-                
-                # 処理済みファイルを移動
-                shutil.move(full_audio_path, os.path.join(processed_folder, audio_file))
-                logging.info(f"処理済みファイルを {processed_folder} に移動しました")
-                
-            except Exception as e:
-                logging.error(f"ファイル '{audio_file}' の処理中にエラーが発生しました: {e}")
-    else:
+    if not audio_files:
         logging.warning("フォルダに音声ファイルが見つかりませんでした")
         print("フォルダに音声ファイルが見つかりませんでした。audiofileディレクトリに音声ファイルを配置してください。")
+        return
+    
+    logging.info(f"{len(audio_files)}個の音声ファイルが見つかりました")
+    logging.info(f"計算タイプ: {args.compute_type}、推論バックエンド: {args.backend}")
+    
+    # 長時間音声モードでは各ファイルを分割し、チャンク単位で並列処理
+    if args.long_audio_workers > 0:
+        transcribe_long_audio_files(audio_files, args, device, settings)
+        return
+    
+    # 複数ワーカー指定時はプロセスプールで並列処理
+    if args.workers != 1 and len(audio_files) > 1:
+        transcribe_with_workers(audio_files, args, device, settings)
+        return
+    
+    # モデルのロード
+    model, device = load_whisper_model(args.model, device, args.backend, args.compute_type)
+    if model is None:
+        return
+    
+    # システム情報を表示
+    system_info = "RAM 16GB"
+    if torch.cuda.is_available():
+        system_info += f", GPU: {torch.cuda.get_device_name(0)}"
+    else:
+        system_info += ", CPU のみ"
+    logging.info(f"システム情報: {system_info}")
+    
+    # プログレスバーでの処理表示
+    result_cache = create_result_cache(settings)
+    transcribe_with_model(model, audio_files, args, settings, result_cache)
+    
+    if result_cache is not None:
+        stats = result_cache.stats()
+        log_cache_stats(stats["hits"], stats["hits"] + stats["misses"])
 
 if __name__ == "__main__":
     start_time = time.time()
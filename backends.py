@@ -0,0 +1,265 @@
+"""
+推論バックエンド
+文字起こしエンジンの違いを吸収し、アプリ・CLI・デモから同じ方法で呼び出せるようにする。
+  - whisper: openai-whisper（PyTorch）。音声を30秒ずつ読み込みながら文字起こしする。
+    計算タイプに int8 を指定すると、Linear層を動的量子化してCPUで推論する
+  - faster-whisper: CTranslate2 による実装。CPUでもint8で高速に推論できる（要 pip install faster-whisper）
+どのバックエンドも transcribe の戻り値は whisper.transcribe と同じ形式の辞書
+{"text", "segments", "language"} になり、transcribe_batch はその辞書のリストを返す
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import SAMPLE_RATE, HOP_LENGTH
+
+from batching import transcribe_batch
+from metrics import record_transcription, stage_timer
+from model_cache import estimate_model_bytes
+from streaming import transcribe_stream
+
+DEFAULT_BACKEND = "whisper"
+
+# モデルのダウンロード先（openai-whisper）
+DOWNLOAD_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "whisper")
+
+# int8量子化したモデルの保存先（2回目以降は量子化を省略して読み込む）
+QUANTIZED_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "quantized")
+
+# モデルサイズごとのおおよそのパラメータ数（CTranslate2のモデルはメモリ量を取得できないため概算に使う）
+MODEL_PARAMETERS = {
+    "tiny": 39_000_000,
+    "base": 74_000_000,
+    "small": 244_000_000,
+    "medium": 769_000_000,
+    "large": 1_550_000_000,
+    "turbo": 809_000_000
+}
+
+# 計算タイプごとの1パラメータあたりのバイト数
+BYTES_PER_PARAMETER = {"int8": 1, "int8_float16": 1, "int8_float32": 1, "float16": 2, "float32": 4}
+
+
+def quantize_model(model):
+    """WhisperモデルのLinear層をPyTorchの動的量子化でint8に変換する（CPU専用）"""
+    for module in model.modules():
+        if type(module) is whisper.model.Linear:
+            # Whisper独自のLinearは重みを入力の型に合わせるだけなので、標準のLinearとして量子化する
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_quantized_model(model_name, cache_dir=None):
+    """int8量子化したWhisperモデルを読み込む。保存済みのものがあれば元のモデルの読み込みと量子化を省略する"""
+    cache_dir = cache_dir or QUANTIZED_CACHE_DIR
+    # 量子化済みの重みの形式はPyTorchのバージョンに依存するため、ファイル名に含める
+    file_name = re.sub(r"[^\w.-]", "_", f"{model_name}-int8-torch{torch.__version__}")
+    path = os.path.join(cache_dir, f"{file_name}.pt")
+    if os.path.exists(path):
+        try:
+            # 自分で保存したファイルのみを読み込むため、モジュールごと復元する
+            return torch.load(path, map_location="cpu", weights_only=False)
+        except Exception as e:
+            logging.warning(f"量子化済みモデルを読み込めませんでした。再度量子化します: {e}")
+
+    start_time = time.time()
+    model = quantize_model(whisper.load_model(model_name, device="cpu", download_root=DOWNLOAD_ROOT))
+    logging.info(f"{model_name}モデルをint8に量子化しました（所要時間: {time.time() - start_time:.2f}秒）")
+
+    temp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        torch.save(model, temp_path)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.warning(f"量子化済みモデルを保存できませんでした: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return model
+
+
+class WhisperBackend:
+    """openai-whisper によるバックエンド"""
+
+    name = "whisper"
+
+    def __init__(self, model, compute_type="float32", model_name=None):
+        self.model = model
+        self.compute_type = compute_type
+        self.model_name = model_name
+
+    @classmethod
+    def load(cls, model_name, device, compute_type="float32"):
+        if compute_type == "int8":
+            if device == "cpu":
+                return cls(load_quantized_model(model_name), compute_type, model_name)
+            logging.warning(f"int8量子化はCPUのみ対応のため、{device}ではfloat32で実行します")
+            compute_type = "float32"
+        model = whisper.load_model(model_name, device=device, download_root=DOWNLOAD_ROOT)
+        return cls(model, compute_type, model_name)
+
+    @property
+    def device(self):
+        return self.model.device.type
+
+    def memory_bytes(self):
+        """モデルの重み（量子化済みの重みを含む）が占めるメモリ量（バイト）"""
+        return estimate_model_bytes(self.model)
+
+    def transcribe(self, audio, language=None, word_timestamps=False, progress_callback=None, segment_callback=None,
+                   feature_cache=None, audio_path=None):
+        """音声を文字起こしする（audio はファイルパスまたは16kHzの波形）
+
+        word_timestamps を指定すると各セグメントに単語ごとのタイムスタンプを付ける。
+        progress_callback(処理済みフレーム数, 総フレーム数) で進捗を、
+        segment_callback(セグメントのリスト) で30秒のウィンドウごとに確定したセグメントを通知する。
+        feature_cache（feature_cache.FeatureCache）を指定すると、ファイルのlog-mel・エンコーダ出力を保存・再利用する
+        （先読み済みの波形を渡す場合は、キャッシュのキーにする元のファイルを audio_path に指定する）
+        """
+        features = None
+        source = audio if isinstance(audio, str) else audio_path
+        if feature_cache is not None and source is not None and self.model_name is not None:
+            features = feature_cache.entry(source, self.model_name, self.compute_type, self.model.dims.n_mels)
+        return transcribe_stream(
+            self.model,
+            audio,
+            language=language,
+            fp16=(self.compute_type == "float16"),
+            word_timestamps=word_timestamps,
+            progress_callback=progress_callback,
+            segment_callback=segment_callback,
+            features=features
+        )
+
+    def transcribe_batch(self, audios, language=None, word_timestamps=False):
+        """30秒以下の波形のリストをまとめてデコードする
+
+        1回のバッチデコードで結果が確定しなかった音声だけ、個別に文字起こしし直す。
+        単語ごとのタイムスタンプはバッチデコードでは求めないため、指定時は1つずつ文字起こしする
+        """
+        if word_timestamps:
+            return [self.transcribe(audio, language=language, word_timestamps=True) for audio in audios]
+        results = transcribe_batch(self.model, audios, language=language,
+                                   fp16=(self.compute_type == "float16"))
+        return [result if result is not None else self.transcribe(audio, language=language)
+                for audio, result in zip(audios, results)]
+
+    def warm_up(self):
+        """無音の短い音声を1回デコードし、初回推論時の初期化コストを事前に済ませる"""
+        silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(silence), n_mels=self.model.dims.n_mels)
+        options = whisper.DecodingOptions(
+            language="ja" if self.model.is_multilingual else "en",
+            without_timestamps=True,
+            sample_len=16,
+            fp16=(self.compute_type == "float16" and self.device == "cuda")
+        )
+        whisper.decode(self.model, mel.to(self.model.device), options)
+
+
+class FasterWhisperBackend:
+    """faster-whisper（CTranslate2）によるバックエンド"""
+
+    name = "faster-whisper"
+
+    def __init__(self, model, model_name, device, compute_type):
+        self.model = model
+        self.model_name = model_name
+        self.device = device
+        self.compute_type = compute_type
+
+    @classmethod
+    def load(cls, model_name, device, compute_type="int8"):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("faster-whisper バックエンドを使うには pip install faster-whisper を実行してください")
+        if device == "cpu" and compute_type == "float16":
+            # CTranslate2はCPUでのfloat16計算に対応していない
+            compute_type = "float32"
+        # ワーカーごとに分配したPyTorchのスレッド数に合わせ、CTranslate2のスレッド数も制限する
+        model = WhisperModel(model_name, device=device, compute_type=compute_type,
+                             cpu_threads=torch.get_num_threads())
+        return cls(model, model_name, device, compute_type)
+
+    def memory_bytes(self):
+        """パラメータ数と計算タイプから概算したメモリ量（バイト）"""
+        parameters = MODEL_PARAMETERS.get(self.model_name.split(".")[0].split("-")[0], MODEL_PARAMETERS["large"])
+        return parameters * BYTES_PER_PARAMETER.get(self.compute_type, 4)
+
+    def transcribe(self, audio, language=None, word_timestamps=False, progress_callback=None, segment_callback=None,
+                   feature_cache=None, audio_path=None):
+        """音声を文字起こしする（audio はファイルパスまたは16kHzの波形）
+
+        セグメントが1つ確定するごとに progress_callback(処理済みフレーム数, 総フレーム数) と
+        segment_callback(セグメントのリスト) を呼ぶ。
+        特徴量はCTranslate2の内部で計算されるため、feature_cache と audio_path は使わない
+        """
+        if language == "auto":
+            language = None
+        start_time = time.perf_counter()
+        segments, info = self.model.transcribe(audio, language=language, word_timestamps=word_timestamps)
+        total_frames = int(info.duration * SAMPLE_RATE) // HOP_LENGTH
+
+        results = []
+        for segment in segments:
+            results.append({
+                "id": len(results),
+                "seek": segment.seek,
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text,
+                "tokens": list(segment.tokens),
+                "temperature": segment.temperature,
+                "avg_logprob": segment.avg_logprob,
+                "compression_ratio": segment.compression_ratio,
+                "no_speech_prob": segment.no_speech_prob
+            })
+            if segment.words is not None:
+                results[-1]["words"] = [
+                    {"word": word.word, "start": word.start, "end": word.end, "probability": word.probability}
+                    for word in segment.words
+                ]
+            if segment_callback is not None:
+                segment_callback([results[-1]])
+            if progress_callback is not None:
+                progress_callback(min(int(segment.end * SAMPLE_RATE) // HOP_LENGTH, total_frames), total_frames)
+        if progress_callback is not None:
+            progress_callback(total_frames, total_frames)
+        # CTranslate2は内部でデコードから推論までを行うため、全体の実時間比だけを記録する
+        record_transcription(info.duration, time.perf_counter() - start_time)
+
+        return {
+            "text": "".join(segment["text"] for segment in results),
+            "segments": results,
+            "language": info.language
+        }
+
+    def transcribe_batch(self, audios, language=None, word_timestamps=False):
+        """波形のリストを順に文字起こしする（CTranslate2は1ファイル内のウィンドウ単位でバッチ処理する）"""
+        return [self.transcribe(audio, language=language, word_timestamps=word_timestamps) for audio in audios]
+
+    def warm_up(self):
+        """無音の短い音声を1回文字起こしし、初回推論時の初期化コストを事前に済ませる"""
+        segments, _ = self.model.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), language="ja")
+        list(segments)
+
+
+BACKENDS = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend
+}
+
+
+def load_backend(backend_name, model_name, device, compute_type="float32"):
+    """指定したバックエンドでモデルを読み込む"""
+    if backend_name not in BACKENDS:
+        raise ValueError(f"不明なバックエンドです: {backend_name}（{', '.join(BACKENDS)} から選択してください）")
+    with stage_timer("model_load"):
+        return BACKENDS[backend_name].load(model_name, device, compute_type)
@@ -0,0 +1,147 @@
+"""
+短い音声のバッチ文字起こし
+30秒以下の音声を複数まとめてlog-melを計算し、エンコーダとデコーダを1回のバッチで実行する。
+デコーダは1トークンずつ進むため、バッチにまとめることでCPU/GPUを効率よく使える。
+whisper.transcribe が温度を上げて再デコードしたり、続きをデコードしたりする結果になった音声は
+None を返し、呼び出し側で通常の文字起こしに回す
+"""
+
+import time
+
+import torch
+from whisper.audio import SAMPLE_RATE, HOP_LENGTH, N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+from whisper.decoding import DecodingOptions
+from whisper.tokenizer import get_tokenizer
+
+from metrics import record_transcription, stage_timer
+
+
+def is_short_audio(audio):
+    """1回のデコードで処理できる長さ（30秒以下）か判定"""
+    return len(audio) <= N_SAMPLES
+
+
+def build_segments(tokens, tokenizer, result, duration, time_precision):
+    """1ウィンドウ分のトークン列をタイムスタンプでセグメントに分割する
+
+    最後のセグメントが途中で終わっている場合（続きのデコードが必要な場合）は None を返す
+    """
+    def new_segment(start, end, segment_tokens):
+        segment_tokens = segment_tokens.tolist()
+        return {
+            "seek": 0,
+            "start": start,
+            "end": end,
+            "text": tokenizer.decode([token for token in segment_tokens if token < tokenizer.eot]),
+            "tokens": segment_tokens,
+            "temperature": result.temperature,
+            "avg_logprob": result.avg_logprob,
+            "compression_ratio": result.compression_ratio,
+            "no_speech_prob": result.no_speech_prob
+        }
+
+    timestamp_tokens = tokens.ge(tokenizer.timestamp_begin)
+    single_timestamp_ending = timestamp_tokens[-2:].tolist() == [False, True]
+    consecutive = torch.where(timestamp_tokens[:-1] & timestamp_tokens[1:])[0]
+    consecutive.add_(1)
+
+    segments = []
+    if len(consecutive) > 0:
+        if not single_timestamp_ending:
+            return None
+        last_slice = 0
+        for current_slice in consecutive.tolist() + [len(tokens)]:
+            sliced_tokens = tokens[last_slice:current_slice]
+            start_pos = sliced_tokens[0].item() - tokenizer.timestamp_begin
+            end_pos = sliced_tokens[-1].item() - tokenizer.timestamp_begin
+            segments.append(new_segment(start_pos * time_precision, end_pos * time_precision, sliced_tokens))
+            last_slice = current_slice
+    else:
+        timestamps = tokens[timestamp_tokens.nonzero().flatten()]
+        if len(timestamps) > 0 and timestamps[-1].item() != tokenizer.timestamp_begin:
+            duration = (timestamps[-1].item() - tokenizer.timestamp_begin) * time_precision
+        segments.append(new_segment(0.0, duration, tokens))
+
+    segments = [segment for segment in segments if segment["start"] != segment["end"] and segment["text"].strip()]
+    for i, segment in enumerate(segments):
+        segment["id"] = i
+    return segments
+
+
+def transcribe_batch(
+    model,
+    audios,
+    language=None,
+    task="transcribe",
+    fp16=False,
+    compression_ratio_threshold=2.4,
+    logprob_threshold=-1.0,
+    no_speech_threshold=0.6
+):
+    """30秒以下の波形のリストをまとめて貪欲法でデコードし、音声ごとの結果のリストを返す
+
+    各結果は whisper.transcribe と同じ形式の辞書。温度フォールバックが必要な音声や、
+    1回のデコードで終わらなかった音声は None になる
+    """
+    if language == "auto":
+        language = None
+    if model.device.type == "cpu":
+        # CPUではfp16に対応していないため常にfp32で計算する
+        fp16 = False
+    dtype = torch.float16 if fp16 else torch.float32
+
+    start_time = time.perf_counter()
+    with stage_timer("mel"):
+        mel = torch.stack([log_mel_spectrogram(pad_or_trim(audio), model.dims.n_mels) for audio in audios])
+        mel = mel.to(model.device).to(dtype)
+    with stage_timer("encoder"), torch.no_grad():
+        audio_features = model.embed_audio(mel)
+        if audio_features.is_cuda:
+            torch.cuda.synchronize()
+    options = DecodingOptions(task=task, language=language, temperature=0.0, fp16=fp16)
+    with stage_timer("decoder"):
+        decoded = model.decode(audio_features, options)
+    elapsed = time.perf_counter() - start_time
+
+    input_stride = N_FRAMES // model.dims.n_audio_ctx
+    time_precision = input_stride * HOP_LENGTH / SAMPLE_RATE
+    tokenizers = {}
+    results = []
+    for audio, result in zip(audios, decoded):
+        if no_speech_threshold is not None and result.no_speech_prob > no_speech_threshold and (
+                logprob_threshold is None or result.avg_logprob <= logprob_threshold):
+            # 無音と判定された音声は空の結果にする
+            results.append({"text": "", "segments": [], "language": result.language})
+            continue
+        if ((compression_ratio_threshold is not None and result.compression_ratio > compression_ratio_threshold)
+                or (logprob_threshold is not None and result.avg_logprob < logprob_threshold)):
+            results.append(None)
+            continue
+
+        if result.language not in tokenizers:
+            tokenizers[result.language] = get_tokenizer(
+                model.is_multilingual,
+                num_languages=model.num_languages,
+                language=result.language,
+                task=task
+            )
+        tokenizer = tokenizers[result.language]
+        segments = build_segments(torch.tensor(result.tokens), tokenizer, result,
+                                  len(audio) / SAMPLE_RATE, time_precision)
+        if segments is None:
+            results.append(None)
+            continue
+        all_tokens = [token for segment in segments for token in segment["tokens"]]
+        results.append({
+            "text": tokenizer.decode(all_tokens),
+            "segments": segments,
+            "language": result.language
+        })
+
+    # None の音声は呼び出し側で文字起こしし直すため、ここでは確定した音声だけを記録する
+    total_seconds = sum(len(audio) for audio in audios) / SAMPLE_RATE
+    done_seconds = sum(len(audio) for audio, result in zip(audios, results) if result is not None) / SAMPLE_RATE
+    if total_seconds > 0:
+        record_transcription(done_seconds, elapsed * done_seconds / total_seconds,
+                             count=sum(result is not None for result in results))
+    return results
@@ -0,0 +1,107 @@
+"""
+ベンチマーク共通の補助関数
+合成音声の生成、ピークRSSの取得、パーセンタイル計算、オフライン用のスタブモデルを提供する
+"""
+
+import os
+import sys
+import wave
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+SAMPLE_RATE = 16000
+
+# 生成できる合成音声の種類
+FIXTURE_KINDS = ("speech", "tone", "noise")
+
+
+def synthesize(kind, t, rng):
+    """合成信号を生成（speech: 振幅変調した倍音と無音区間、tone: 正弦波、noise: ホワイトノイズ）"""
+    if kind == "tone":
+        return 0.3 * np.sin(2 * np.pi * 440 * t)
+    if kind == "noise":
+        return 0.1 * rng.standard_normal(len(t))
+    # 音節のような振幅変調と、ときどき入る無音区間を持つ音声風の信号
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t)) * (np.sin(2 * np.pi * 0.2 * t) > -0.3)
+    pitch = 150 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    signal = sum(np.sin((i + 1) * phase) / (i + 1) for i in range(4))
+    return 0.2 * envelope * signal + 0.01 * rng.standard_normal(len(t))
+
+
+def generate_wav(path, duration, kind="speech", sample_rate=SAMPLE_RATE, seed=0):
+    """合成音声のWAV（16bit モノラル）を1分ずつ書き出して生成"""
+    rng = np.random.default_rng(seed)
+    block = 60 * sample_rate
+    total = int(duration * sample_rate)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        for start in range(0, total, block):
+            n = min(block, total - start)
+            t = (start + np.arange(n)) / sample_rate
+            signal = synthesize(kind, t, rng)
+            f.writeframes((np.clip(signal, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+def peak_rss_mb():
+    """このプロセスのピークRSS（MB）"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linuxは KB、macOSは バイト単位
+        return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return getattr(memory, "peak_wset", memory.rss) / 1024**2
+
+
+def percentile(values, q):
+    """パーセンタイル（値がない場合は None）"""
+    return float(np.percentile(values, q)) if values else None
+
+
+def install_stub_model():
+    """whisper.load_model を、tinyと同じ構造でランダム重みの小さなモデルを返す関数に置き換える
+
+    モデルのダウンロードができないオフライン環境でも、パイプライン全体の処理時間を計測できる。
+    出力されるテキストは意味を持たない
+    """
+    import torch
+    import whisper
+    from whisper.model import Whisper, ModelDimensions
+
+    dims = ModelDimensions(
+        n_mels=80, n_audio_ctx=1500, n_audio_state=384, n_audio_head=6, n_audio_layer=4,
+        n_vocab=51865, n_text_ctx=448, n_text_state=384, n_text_head=6, n_text_layer=4
+    )
+
+    def load_stub_model(name, device="cpu", download_root=None, in_memory=False):
+        torch.manual_seed(0)
+        model = Whisper(dims)
+        with torch.no_grad():
+            # 位置埋め込みは初期化されないため明示的に初期化する
+            model.decoder.positional_embedding.normal_(0, 0.02)
+        return model.to(device)
+
+    whisper.load_model = load_stub_model
+
+
+def character_error_rate(reference, hypothesis):
+    """文字誤り率（編集距離 ÷ 基準テキストの文字数）。日本語のように単語で区切らない言語向け"""
+    reference, hypothesis = reference.strip(), hypothesis.strip()
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_char != hyp_char)))
+        previous = current
+    return previous[-1] / len(reference)
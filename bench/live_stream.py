@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+リアルタイム文字起こしのクライアント兼遅延ベンチマーク
+音声ファイル（省略時は合成音声）を実時間のペースで /live エンドポイントに送り、
+確定したセグメントが届くまでの遅延（セグメントの終わりを送信してから受け取るまでの時間）を計測する。
+--local を指定すると、サーバーを起動せずにプロセス内のFlaskアプリに対して実行する
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from bench_utils import SAMPLE_RATE, generate_wav, install_stub_model, percentile
+
+
+class HttpClient:
+    """起動中のウェブアプリにHTTPでアクセスする"""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def request(self, method, path, data=None, content_type="application/octet-stream"):
+        if isinstance(data, dict):
+            data = json.dumps(data).encode("utf-8")
+            content_type = "application/json"
+        req = urllib.request.Request(self.url + path, data=data, method=method)
+        if data is not None:
+            req.add_header("Content-Type", content_type)
+        with urllib.request.urlopen(req, timeout=120) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+
+class LocalClient:
+    """プロセス内のFlaskアプリにテストクライアントでアクセスする"""
+
+    def __init__(self):
+        import app as webapp
+        self.app = webapp.app
+
+    def request(self, method, path, data=None, content_type="application/octet-stream"):
+        # テストクライアントはスレッドごとに作成する
+        client = self.app.test_client()
+        if isinstance(data, dict):
+            response = client.open(path, method=method, json=data)
+        else:
+            response = client.open(path, method=method, data=data, content_type=content_type)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} が失敗しました: {response.status_code} {response.get_data(as_text=True)}")
+        return response.get_json()
+
+
+def load_pcm(path):
+    """音声ファイルを16kHzモノラルの16bit PCMに変換する"""
+    import whisper
+    audio = whisper.load_audio(path)
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+def stream_file(client, pcm, args):
+    """PCMを実時間のペースで送り、確定セグメントごとの遅延を計測する"""
+    session = client.request("POST", "/live/start", {
+        "model": args.model,
+        "language": args.language,
+        "compute_type": args.compute_type,
+        "format": "pcm",
+        "sample_rate": SAMPLE_RATE
+    })
+    session_id = session["session_id"]
+    chunk_bytes = int(args.chunk_seconds * SAMPLE_RATE) * 2
+    chunks = [pcm[i:i + chunk_bytes] for i in range(0, len(pcm), chunk_bytes)]
+    stream_start = time.monotonic()
+    send_errors = []
+
+    def send():
+        try:
+            sent_seconds = 0.0
+            for chunk in chunks:
+                # 音声の再生時刻に合わせて送る（--speed で早送り）
+                delay = stream_start + sent_seconds / args.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                client.request("PUT", f"/live/{session_id}", chunk)
+                sent_seconds += len(chunk) / 2 / SAMPLE_RATE
+            client.request("POST", f"/live/{session_id}/finish")
+        except Exception as e:
+            send_errors.append(e)
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+
+    audio_seconds = len(pcm) / 2 / SAMPLE_RATE
+    final_segments = []
+    lags = []
+    first_text = None
+    updates = 0
+    version = -1
+    while True:
+        status = client.request("GET", f"/live/{session_id}?start={len(final_segments)}&since={version}&timeout=10")
+        received_at = (time.monotonic() - stream_start) * args.speed
+        if status["version"] != version:
+            updates += 1
+        version = status["version"]
+        if first_text is None and (status["final"] or status["partial_text"].strip()):
+            first_text = received_at
+        for segment in status["final"]:
+            # セグメントの終わりの音声を送った時刻から、確定結果を受け取るまでの時間
+            lags.append(max(received_at - min(segment["end"], audio_seconds), 0.0))
+            final_segments.append(segment)
+            if args.verbose:
+                print(f"[{segment['start']:7.2f} - {segment['end']:7.2f}] (遅延 {lags[-1]:.2f}秒) {segment['text']}")
+        if status["status"] != "running" or send_errors:
+            break
+    sender.join()
+    if send_errors:
+        raise send_errors[0]
+    if status["status"] == "error":
+        raise RuntimeError(f"リアルタイム文字起こしでエラーが発生しました: {status['error']}")
+
+    def seconds(value):
+        return round(value, 3) if value is not None else None
+
+    return {
+        "audio_seconds": round(audio_seconds, 2),
+        "elapsed_seconds": round(time.monotonic() - stream_start, 2),
+        "segments": len(final_segments),
+        "updates": updates,
+        "first_text_seconds": round(first_text, 2) if first_text is not None else None,
+        "final_lag_mean": seconds(float(np.mean(lags)) if lags else None),
+        "final_lag_p50": seconds(percentile(lags, 50)),
+        "final_lag_p95": seconds(percentile(lags, 95)),
+        "final_lag_max": seconds(max(lags) if lags else None),
+        "text": "".join(segment["text"] for segment in final_segments)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="リアルタイム文字起こしのクライアント（遅延の計測）")
+    parser.add_argument("audio", nargs="?", help="送信する音声ファイル（省略時は合成音声を生成）")
+    parser.add_argument("--duration", type=float, default=60, help="合成音声の長さ（秒）")
+    parser.add_argument("--url", default="http://localhost:8080", help="ウェブアプリのURL")
+    parser.add_argument("--local", action="store_true", help="サーバーを起動せずプロセス内のアプリで実行する")
+    parser.add_argument("--stub", action="store_true",
+                        help="--local 時にランダム重みのモデルを使う（モデルをダウンロードできない環境向け）")
+    parser.add_argument("--model", default="tiny", help="使用するWhisperモデル")
+    parser.add_argument("--language", default="ja", help="文字起こしする言語")
+    parser.add_argument("--compute_type", default="float32", help="計算タイプ (float16, float32, int8)")
+    parser.add_argument("--chunk_seconds", type=float, default=0.5, help="1回に送る音声の長さ（秒）")
+    parser.add_argument("--speed", type=float, default=1.0, help="送信速度の倍率（1.0 で実時間）")
+    parser.add_argument("--verbose", action="store_true", help="確定したセグメントを表示する")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = args.audio
+        if path is None:
+            path = os.path.join(work_dir, "live.wav")
+            generate_wav(path, args.duration)
+        pcm = load_pcm(path)
+
+        if args.local:
+            if args.stub:
+                install_stub_model()
+            client = LocalClient()
+        else:
+            client = HttpClient(args.url)
+        result = stream_file(client, pcm, args)
+
+    print(json.dumps({key: value for key, value in result.items() if key != "text"}, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ストリーミング読み込みのメモリベンチマーク
+合成音声（WAV）を複数の長さで生成し、音声の読み込みとlog-mel計算を
+  - full: whisper.load_audio で全体を展開してから計算（model.transcribe と同じ）
+  - streaming: streaming.stream_audio で30秒ずつ読み込んで計算
+の2通りで実行し、それぞれのピークRSSを比較する。
+--model を指定した場合は、ストリーミング文字起こし全体のピークRSSも測定する
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_utils import generate_wav, peak_rss_mb
+
+
+def measure(mode, path, model_name=None):
+    """子プロセスで指定モードを実行し、ピークRSS（MB）を返す"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, path, "--model", model_name or ""],
+        capture_output=True, check=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])["peak_rss_mb"]
+
+
+def run_child(mode, path, model_name):
+    """計測対象の処理を実行し、ピークRSSをJSONで出力（子プロセス側）"""
+    import whisper
+    from streaming import iter_log_mel, stream_audio, transcribe_stream
+
+    if mode == "full":
+        audio = whisper.load_audio(path)
+        whisper.log_mel_spectrogram(audio)
+    elif mode == "streaming":
+        for _ in iter_log_mel(stream_audio(path), 80):
+            pass
+    elif mode == "transcribe":
+        model = whisper.load_model(model_name, device="cpu")
+        transcribe_stream(model, path)
+    print(json.dumps({"peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ストリーミング読み込みのメモリベンチマーク")
+    parser.add_argument("--durations", default="60,600,1800,3600",
+                        help="生成する音声の長さ（秒、カンマ区切り）")
+    parser.add_argument("--model", default="", help="指定した場合はストリーミング文字起こし全体も計測 (例: tiny)")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.model)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for duration in [float(d) for d in args.durations.split(",")]:
+            path = os.path.join(temp_dir, f"synthetic_{int(duration)}s.wav")
+            generate_wav(path, duration)
+            row = {
+                "duration_s": duration,
+                "full_peak_rss_mb": measure("full", path),
+                "streaming_peak_rss_mb": measure("streaming", path)
+            }
+            if args.model:
+                row["transcribe_streaming_peak_rss_mb"] = measure("transcribe", path, args.model)
+            os.remove(path)
+            results.append(row)
+            print(f"{duration:>8.0f}秒: full {row['full_peak_rss_mb']:8.1f} MB / "
+                  f"streaming {row['streaming_peak_rss_mb']:8.1f} MB"
+                  + (f" / 文字起こし {row['transcribe_streaming_peak_rss_mb']:8.1f} MB" if args.model else ""))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文字起こしのエンドツーエンドベンチマーク
+合成音声（tone/noise/speech）を指定した長さで生成し、
+  - cli: audio_transcribe.py と同じ処理（モデル読み込み → transcribe_file）
+  - app: Flaskアプリの /transcribe にジョブを投入し、ワーカーで処理
+の経路で文字起こしして、実時間比（RTF）・時間あたり処理ファイル数・
+レイテンシのp50/p95・ピークRSS・モデル読み込み時間をJSONで出力する。
+各経路は別プロセスで実行するため、ピークRSSは互いに影響しない。
+--compare_int8 を指定すると、同じ音声を int8 量子化モデルでも文字起こしし、
+速度比と文字誤り率（基準の計算タイプの出力に対するCER）を併せて出力する。
+--baseline に以前の結果を指定すると、RTFとp95レイテンシの悪化を検出して終了コード1を返す
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_utils import (FIXTURE_KINDS, character_error_rate, generate_wav, install_stub_model,
+                         peak_rss_mb, percentile)
+import backends
+from backends import BACKENDS, DEFAULT_BACKEND
+
+PATHS = ("cli", "app")
+
+# ベースラインとの比較対象（値が大きいほど悪い指標）
+REGRESSION_METRICS = ("rtf", "latency_p95_s")
+REGRESSION_SECTIONS = ("paths", "int8")
+
+
+def create_fixtures(folder, durations, count, kinds):
+    """長さごとに count 個の合成音声を作成し、(ファイル名, 長さ) のリストを返す"""
+    fixtures = []
+    for duration in durations:
+        for i in range(count):
+            kind = kinds[i % len(kinds)]
+            name = f"{kind}_{int(duration)}s_{i}.wav"
+            # 内容が同じだと結果キャッシュに当たるため、ファイルごとに乱数のシードを変える
+            generate_wav(os.path.join(folder, name), duration, kind=kind, seed=len(fixtures))
+            fixtures.append((name, duration))
+    return fixtures
+
+
+def summarize(latencies, durations, wall_time, model_load_s):
+    """個々の処理時間と全体の経過時間から指標をまとめる"""
+    audio_seconds = sum(durations)
+    return {
+        "files": len(latencies),
+        "audio_seconds": audio_seconds,
+        "wall_time_s": wall_time,
+        "rtf": wall_time / audio_seconds if audio_seconds else None,
+        "files_per_hour": len(latencies) / wall_time * 3600 if wall_time else None,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "peak_rss_mb": peak_rss_mb(),
+        "model_load_s": model_load_s
+    }
+
+
+def read_texts(output_folder, fixtures):
+    """出力されたテキストをファイル名ごとに読み込む（計算タイプ間の精度比較に使う）"""
+    texts = {}
+    for name, _ in fixtures:
+        with open(os.path.join(output_folder, f"{os.path.splitext(name)[0]}.txt"), "r", encoding="utf-8") as f:
+            texts[name] = f.read()
+    return texts
+
+
+def bench_cli(work_dir, fixtures, args):
+    """audio_transcribe.py と同じ関数でファイルを1つずつ文字起こしする"""
+    import audio_transcribe
+
+    settings = {
+        "audio_folder": os.path.join(work_dir, "audiofile"),
+        "output_folder": os.path.join(work_dir, "output"),
+        "processed_folder": os.path.join(work_dir, "processed"),
+        "model": args.model,
+        "language": args.language,
+        "compute_type": args.compute_type,
+        "backend": args.backend,
+        "result_cache_dir": os.path.join(work_dir, "cache"),
+        "result_cache_mb": 0,
+        "feature_cache_dir": os.path.join(work_dir, "features"),
+        "feature_cache_mb": 0,
+        "feature_cache_encoder": False,
+        "chunk_minutes": 5.0,
+        "prefetch_files": args.prefetch_files,
+        "decode_threads": 1,
+        "prefetch_max_minutes": 30.0,
+        "output_formats": ("txt",),
+        "word_timestamps": False,
+        "journal_path": os.path.join(work_dir, "jobs.sqlite3")
+    }
+    for folder in ("output_folder", "processed_folder"):
+        os.makedirs(settings[folder], exist_ok=True)
+
+    load_start = time.time()
+    model, _ = audio_transcribe.load_whisper_model(args.model, "cpu", args.backend, args.compute_type)
+    model_load_s = time.time() - load_start
+    if model is None:
+        raise RuntimeError(f"{args.model}モデルを読み込めませんでした")
+    model_load_cached_s = None
+    if args.compute_type == "int8":
+        # 2回目は保存済みの量子化モデルから読み込まれる
+        load_start = time.time()
+        audio_transcribe.load_whisper_model(args.model, "cpu", args.backend, args.compute_type)
+        model_load_cached_s = time.time() - load_start
+
+    latencies = []
+    start = time.time()
+    names = [name for name, _ in fixtures]
+    with audio_transcribe.create_prefetcher(names, settings, batch_size=args.batch_size) as prefetcher:
+        if args.batch_size > 1:
+            # 短い音声をまとめてデコードする場合、バッチ内のファイルはバッチ全体の完了時に出力される
+            for batch in audio_transcribe.make_batches(names, args.batch_size):
+                batch_start = time.time()
+                outcomes = audio_transcribe.transcribe_file_batch(model, batch, settings, prefetcher=prefetcher)
+                failed = [name for name, (ok, _) in zip(batch, outcomes) if not ok]
+                if failed:
+                    raise RuntimeError(f"{', '.join(failed)} の文字起こしに失敗しました")
+                latencies.extend([time.time() - batch_start] * len(batch))
+        else:
+            for name in names:
+                file_start = time.time()
+                audio = audio_transcribe.take_prefetched(prefetcher, name, settings)
+                if not audio_transcribe.transcribe_file(model, name, settings, audio=audio):
+                    raise RuntimeError(f"{name} の文字起こしに失敗しました")
+                latencies.append(time.time() - file_start)
+    wall_time = time.time() - start
+    metrics = summarize(latencies, [duration for _, duration in fixtures], wall_time, model_load_s)
+    if model_load_cached_s is not None:
+        metrics["model_load_cached_s"] = model_load_cached_s
+    return metrics, read_texts(settings["output_folder"], fixtures)
+
+
+def bench_app(work_dir, fixtures, args):
+    """Flaskアプリにジョブをまとめて投入し、すべて完了するまで待つ"""
+    os.environ["WHISPER_WORKERS"] = str(args.workers)
+    os.environ["WHISPER_BACKEND"] = args.backend
+    os.environ["WHISPER_RESULT_CACHE_DIR"] = os.path.join(work_dir, "cache")
+    os.environ["WHISPER_RESULT_CACHE_MB"] = "0"
+    os.environ["WHISPER_FEATURE_CACHE_MB"] = "0"
+    os.environ["WHISPER_JOURNAL_PATH"] = os.path.join(work_dir, "jobs.sqlite3")
+    # ベンチマークの処理時間（スタブモデルを含む）で実際の処理時間の見積もりを変えないよう、学習結果も一時フォルダに保存する
+    os.environ["WHISPER_RTF_MODEL_PATH"] = os.path.join(work_dir, "rtf_model.json")
+    import app as webapp
+
+    webapp.UPLOAD_FOLDER = os.path.join(work_dir, "audiofile")
+    webapp.OUTPUT_FOLDER = os.path.join(work_dir, "output")
+    webapp.PROCESSED_FOLDER = os.path.join(work_dir, "processed")
+    for folder in (webapp.OUTPUT_FOLDER, webapp.PROCESSED_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+
+    client = webapp.app.test_client()
+    start = time.time()
+    for name, _ in fixtures:
+        client.post("/transcribe", data={
+            "selected_file": name,
+            "model": args.model,
+            "language": args.language,
+            "compute_type": args.compute_type
+        })
+
+    # 全ジョブが完了するまで進捗の変化を待つ
+    version = 0
+    while True:
+        snapshot = client.get(f"/progress?since={version}&timeout=5").get_json()
+        version = snapshot["version"]
+        jobs = snapshot["jobs"]
+        if len(jobs) == len(fixtures) and all(job["status"] not in webapp.ACTIVE_STATUSES for job in jobs):
+            break
+    wall_time = time.time() - start
+
+    failed = [job["file"] for job in jobs if job["status"] != "completed"]
+    if failed:
+        raise RuntimeError(f"文字起こしに失敗したファイルがあります: {', '.join(failed)}")
+    # キュー待ちを含めた、投入から完了までの時間をレイテンシとする
+    latencies = [job["finished_at"] - job["created_at"] for job in jobs]
+    models = client.get("/models").get_json()["models"]
+    model_load_s = max((stats["average_load_time"] for stats in models), default=None)
+    metrics = summarize(latencies, [duration for _, duration in fixtures], wall_time, model_load_s)
+    return metrics, read_texts(webapp.OUTPUT_FOLDER, fixtures)
+
+
+def run_child(path, args):
+    """指定経路のベンチマークを実行し、結果をJSONで出力（子プロセス側）"""
+    durations = [float(d) for d in args.durations.split(",")]
+    kinds = args.kinds.split(",")
+    work_dir = tempfile.mkdtemp(prefix="whisper-bench-")
+    if args.stub:
+        install_stub_model()
+        # ランダム重みのモデルを量子化済みモデルとして保存しないよう、保存先を一時フォルダにする
+        backends.QUANTIZED_CACHE_DIR = os.path.join(work_dir, "quantized")
+    try:
+        audio_folder = os.path.join(work_dir, "audiofile")
+        os.makedirs(audio_folder)
+        fixtures = create_fixtures(audio_folder, durations, args.count, kinds)
+        bench = bench_cli if path == "cli" else bench_app
+        metrics, texts = bench(work_dir, fixtures, args)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps({"metrics": metrics, "texts": texts}, ensure_ascii=False))
+
+
+def measure(path, args, compute_type):
+    """子プロセスで1つの経路を計測し、(指標, ファイル名ごとの出力テキスト) を返す"""
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--child", path,
+        "--model", args.model, "--language", args.language,
+        "--backend", args.backend, "--compute_type", compute_type,
+        "--durations", args.durations, "--count", str(args.count),
+        "--kinds", args.kinds, "--workers", str(args.workers), "--batch_size", str(args.batch_size),
+        "--prefetch_files", str(args.prefetch_files)
+    ]
+    if args.stub:
+        cmd.append("--stub")
+    process = subprocess.run(cmd, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"{path} のベンチマークに失敗しました:\n{process.stderr}")
+    output = json.loads(process.stdout.strip().splitlines()[-1])
+    return output["metrics"], output["texts"]
+
+
+def compare_int8(metrics, texts, int8_metrics, int8_texts):
+    """基準の計算タイプに対するint8の速度比と文字誤り率を求める"""
+    errors = [character_error_rate(texts[name], int8_texts[name]) for name in texts]
+    return {
+        **int8_metrics,
+        "speedup": metrics["wall_time_s"] / int8_metrics["wall_time_s"],
+        "cer_vs_reference": sum(errors) / len(errors) if errors else None
+    }
+
+
+def print_metrics(label, metrics):
+    """指標を1行で表示"""
+    print(f"{label:>9}: RTF {metrics['rtf']:.3f} / {metrics['files_per_hour']:.0f} ファイル/時 / "
+          f"p50 {metrics['latency_p50_s']:.2f}秒 / p95 {metrics['latency_p95_s']:.2f}秒 / "
+          f"ピークRSS {metrics['peak_rss_mb']:.0f} MB / モデル読み込み {metrics['model_load_s'] or 0:.2f}秒")
+
+
+def find_regressions(results, baseline, tolerance):
+    """ベースラインより tolerance の割合を超えて悪化した指標を列挙する"""
+    regressions = []
+    for section in REGRESSION_SECTIONS:
+        for path, metrics in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(path)
+            if previous is None:
+                continue
+            for metric in REGRESSION_METRICS:
+                old, new = previous.get(metric), metrics.get(metric)
+                if old and new is not None and new > old * (1 + tolerance):
+                    regressions.append(f"{section}.{path}.{metric}: {old:.3f} → {new:.3f} (+{new / old - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文字起こしのエンドツーエンドベンチマーク")
+    parser.add_argument("--durations", default="10,30,120", help="生成する音声の長さ（秒、カンマ区切り）")
+    parser.add_argument("--count", type=int, default=2, help="長さごとに生成するファイル数")
+    parser.add_argument("--kinds", default="speech", help=f"合成音声の種類（{', '.join(FIXTURE_KINDS)} からカンマ区切り）")
+    parser.add_argument("--model", default="tiny", help="使用するWhisperモデル")
+    parser.add_argument("--language", default="ja", help="文字起こしする言語")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=list(BACKENDS), help="推論バックエンド")
+    parser.add_argument("--compute_type", default="float32", help="計算タイプ (float16, float32, int8)")
+    parser.add_argument("--compare_int8", action="store_true",
+                        help="int8量子化モデルでも計測し、速度比と文字誤り率を出力")
+    parser.add_argument("--stub", action="store_true",
+                        help="モデルをダウンロードせず、tinyと同じ構造のランダム重みモデルを使用")
+    parser.add_argument("--workers", type=int, default=1, help="appの経路で使う文字起こしワーカー数")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="cliの経路で30秒以下の音声をまとめてデコードするファイル数 (1 で無効)")
+    parser.add_argument("--prefetch_files", type=int, default=2,
+                        help="cliの経路で文字起こし中に先読みしておくファイル数 (0 で無効)")
+    parser.add_argument("--paths", default=",".join(PATHS), help="計測する経路（cli, app からカンマ区切り）")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較対象とする以前の結果のJSONファイル")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="悪化とみなす割合（0.2 = 20%%）")
+    parser.add_argument("--child", choices=PATHS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown = set(args.kinds.split(",")) - set(FIXTURE_KINDS)
+    if unknown:
+        parser.error(f"不明な音声の種類です: {', '.join(sorted(unknown))}")
+
+    if args.child:
+        run_child(args.child, args)
+        return
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "model": "stub" if args.stub else args.model,
+            "language": args.language,
+            "backend": args.backend,
+            "compute_type": args.compute_type,
+            "durations": [float(d) for d in args.durations.split(",")],
+            "count": args.count,
+            "kinds": args.kinds.split(","),
+            "workers": args.workers,
+            "batch_size": args.batch_size
+        },
+        "paths": {}
+    }
+    compare = args.compare_int8 and args.compute_type != "int8"
+    if compare:
+        results["int8"] = {}
+    for path in args.paths.split(","):
+        metrics, texts = measure(path, args, args.compute_type)
+        results["paths"][path] = metrics
+        print_metrics(path, metrics)
+        if compare:
+            int8_metrics, int8_texts = measure(path, args, "int8")
+            results["int8"][path] = compare_int8(metrics, texts, int8_metrics, int8_texts)
+            print_metrics(f"{path}/int8", int8_metrics)
+            print(f"{'':>9}  速度比 {results['int8'][path]['speedup']:.2f}倍 / "
+                  f"文字誤り率 {results['int8'][path]['cer_vs_reference']:.1%}（{args.compute_type} の出力に対して）")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("ベースラインから悪化した指標があります:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("ベースラインからの悪化はありません")
+
+
+if __name__ == "__main__":
+    main()
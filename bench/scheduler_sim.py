@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ジョブスケジューラのシミュレーション
+短い音声が利用者から次々に届く中に、一括取り込みの長い音声（数時間）が混ざる状況を仮想時刻で再現し、
+スケジューリング方式（fifo / sjf / fair）ごとのキュー待ち時間のパーセンタイルを比較する。
+処理時間は 音声の長さ × --rtf + --overhead 秒とみなすため、モデルは読み込まない
+"""
+
+import argparse
+import heapq
+import json
+
+import numpy as np
+
+from bench_utils import percentile
+from scheduler import JobScheduler, POLICIES, DEFAULT_AGING_RATE, DEFAULT_USAGE_HALF_LIFE
+
+# 短い音声とみなす長さ（秒）
+SHORT_SECONDS = 300
+
+
+def generate_workload(args):
+    """(到着時刻, 音声の長さ, 利用者, 優先度) のリストを到着順に生成する"""
+    rng = np.random.default_rng(args.seed)
+    horizon = args.hours * 3600
+    jobs = []
+    # 利用者ごとの短い音声（ポアソン到着、長さは対数正規分布）
+    t = 0.0
+    while True:
+        t += rng.exponential(60 / args.short_per_minute)
+        if t >= horizon:
+            break
+        duration = float(np.clip(rng.lognormal(np.log(args.short_seconds), 0.8), 3, SHORT_SECONDS))
+        priority = 1 if rng.random() < args.high_priority else 0
+        jobs.append((t, duration, f"user{rng.integers(args.users)}", priority))
+    # 一括取り込みの長い音声（前半にまとめて届く）
+    for _ in range(args.long_count):
+        arrival = float(rng.uniform(0, horizon / 2))
+        duration = float(rng.uniform(args.long_minutes[0], args.long_minutes[1]) * 60)
+        jobs.append((arrival, duration, "batch", 0))
+    return sorted(jobs)
+
+
+def simulate(policy, workload, args):
+    """workload を指定の方式で処理し、ジョブごとの (音声の長さ, 優先度, 待ち時間) を返す"""
+    now = 0.0
+    scheduler = JobScheduler(policy, args.aging, args.half_life, args.workers, args.reserved, clock=lambda: now)
+    events = [(arrival, i, "arrive") for i, (arrival, _, _, _) in enumerate(workload)]
+    heapq.heapify(events)
+    free_workers = args.workers
+    started = {}
+    while events:
+        now, job_id, kind = heapq.heappop(events)
+        if kind == "arrive":
+            _, duration, user, priority = workload[job_id]
+            scheduler.put(job_id, duration, user, priority)
+        else:
+            scheduler.done(job_id)
+            free_workers += 1
+        # 同じ時刻の他のイベントを先に処理してから、空いたワーカーに割り当てる
+        if events and events[0][0] == now:
+            continue
+        while free_workers:
+            next_id = scheduler.pop()
+            if next_id is None:
+                break
+            started[next_id] = now
+            free_workers -= 1
+            heapq.heappush(events, (now + workload[next_id][1] * args.rtf + args.overhead, next_id, "finish"))
+    return [(duration, priority, started[i] - arrival) for i, (arrival, duration, _, priority) in enumerate(workload)]
+
+
+def summarize(outcomes):
+    """待ち時間のパーセンタイル（全体・短い音声・長い音声・優先度の高いジョブ）"""
+    def stats(waits):
+        if not waits:
+            return None
+        return {
+            "count": len(waits),
+            "p50": round(percentile(waits, 50), 1),
+            "p95": round(percentile(waits, 95), 1),
+            "p99": round(percentile(waits, 99), 1),
+            "max": round(max(waits), 1)
+        }
+
+    return {
+        "all": stats([wait for _, _, wait in outcomes]),
+        "short": stats([wait for duration, _, wait in outcomes if duration <= SHORT_SECONDS]),
+        "long": stats([wait for duration, _, wait in outcomes if duration > SHORT_SECONDS]),
+        "high_priority": stats([wait for _, priority, wait in outcomes if priority > 0])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ジョブスケジューラのシミュレーション（キュー待ち時間の比較）")
+    parser.add_argument("--policies", default=",".join(POLICIES), help="比較する方式（カンマ区切り）")
+    parser.add_argument("--hours", type=float, default=4, help="ジョブが届く時間の長さ（時間）")
+    parser.add_argument("--workers", type=int, default=1, help="文字起こしワーカー数")
+    parser.add_argument("--reserved", type=int, default=0, help="長い音声を割り当てないワーカー数")
+    parser.add_argument("--rtf", type=float, default=0.3, help="実時間比（処理時間 ÷ 音声の長さ）")
+    parser.add_argument("--overhead", type=float, default=2.0, help="ジョブごとの固定の処理時間（秒）")
+    parser.add_argument("--users", type=int, default=5, help="短い音声を送る利用者の数")
+    parser.add_argument("--short_per_minute", type=float, default=1.0, help="短い音声が届く頻度（件/分）")
+    parser.add_argument("--short_seconds", type=float, default=40, help="短い音声の長さの中央値（秒）")
+    parser.add_argument("--long_count", type=int, default=3, help="一括取り込みの長い音声の数")
+    parser.add_argument("--long_minutes", type=float, nargs=2, default=(60, 180), metavar=("MIN", "MAX"),
+                        help="長い音声の長さの範囲（分）")
+    parser.add_argument("--high_priority", type=float, default=0.05, help="優先度を上げて登録するジョブの割合")
+    parser.add_argument("--aging", type=float, default=DEFAULT_AGING_RATE,
+                        help="待ち時間1秒あたりに順位を上げる音声の秒数")
+    parser.add_argument("--half_life", type=float, default=DEFAULT_USAGE_HALF_LIFE,
+                        help="fair で利用者の処理量を半分に減らすまでの秒数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    workload = generate_workload(args)
+    busy = sum(duration * args.rtf + args.overhead for _, duration, _, _ in workload) / (args.hours * 3600 * args.workers)
+    print(f"ジョブ数: {len(workload)}（長い音声: {args.long_count}件）、ワーカーの稼働率: {busy:.0%}")
+
+    results = {}
+    print(f"{'方式':<6}{'対象':<14}{'件数':>6}{'p50(秒)':>10}{'p95(秒)':>10}{'p99(秒)':>10}{'最大(秒)':>10}")
+    for policy in args.policies.split(","):
+        results[policy] = summarize(simulate(policy, workload, args))
+        for group, stats in results[policy].items():
+            if stats is None:
+                continue
+            print(f"{policy:<8}{group:<16}{stats['count']:>6}{stats['p50']:>10.1f}{stats['p95']:>10.1f}"
+                  f"{stats['p99']:>10.1f}{stats['max']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
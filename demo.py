@@ -8,13 +8,13 @@ Whisper デモスクリプト
 import os
 import sys
 import torch
-import whisper
 import argparse
 import time
 from urllib.request import urlretrieve
 from tqdm import tqdm
 import shutil
 import logging
+from backends import BACKENDS, DEFAULT_BACKEND, load_backend
 
 # ロギングの設定
 logging.basicConfig(
@@ -52,7 +52,9 @@ def setup_parser():
     parser.add_argument("--model", default="tiny", help="使用するWhisperモデル (tiny, base, small, medium, large)")
     parser.add_argument("--language", default="en", help="文字起こしする言語 (デモ音声は英語)")
     parser.add_argument("--device", default="auto", help="使用するデバイス (cpu, cuda, auto)")
-    parser.add_argument("--compute_type", default="float32", help="計算タイプ (float16, float32)")
+    parser.add_argument("--compute_type", default="float32", help="計算タイプ (float16, float32, int8)")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=list(BACKENDS),
+                        help="推論バックエンド (whisper: openai-whisper, faster-whisper: CTranslate2)")
     return parser
 
 def get_optimal_device():
@@ -84,15 +86,11 @@ def main():
     sample_audio_path = download_sample_audio(audio_folder)
     
     # モデルのロード
-    logging.info(f"{args.model} モデルを {device} デバイスで読み込み中...")
+    logging.info(f"{args.model} モデルを {device} デバイスで読み込み中（バックエンド: {args.backend}）...")
     start_time = time.time()
     
     try:
-        model = whisper.load_model(
-            args.model,
-            device=device,
-            download_root=os.path.join(os.path.expanduser("~"), ".cache", "whisper")
-        )
+        model = load_backend(args.backend, args.model, device, args.compute_type)
         logging.info(f"モデル読み込み完了（所要時間: {time.time() - start_time:.2f}秒）")
     except Exception as e:
         logging.error(f"モデル読み込みエラー: {e}")
@@ -109,12 +107,7 @@ def main():
     transcription_start = time.time()
     
     try:
-        result = model.transcribe(
-            sample_audio_path,
-            language=args.language,
-            fp16=(args.compute_type == "float16"),
-            verbose=False
-        )
+        result = model.transcribe(sample_audio_path, language=args.language)
         
         transcription_time = time.time() - transcription_start
         logging.info(f"文字起こし完了（処理時間: {transcription_time:.2f}秒）")
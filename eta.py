@@ -0,0 +1,110 @@
+"""
+処理時間の見積もり
+(推論バックエンド, モデル, デバイス, 計算タイプ) ごとに、過去のジョブの処理時間と音声の長さから
+実時間比（処理時間 ÷ 音声の長さ）を学習してファイルに保存し、音声の長さから処理にかかる時間と
+残り時間（ETA）を見積もる。古いジョブほど重みを小さくするため、環境の変化にも追従する
+"""
+
+import json
+import logging
+import os
+import threading
+
+from job_journal import atomic_write_text
+
+DEFAULT_RTF_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "rtf_model.json")
+
+# 新しいジョブ1件ごとに、それまでの学習結果の重みに掛ける値
+DECAY = 0.8
+
+
+def make_key(backend, model_name, device, compute_type):
+    """見積もりを学習する単位のキー"""
+    return f"{backend}/{model_name}/{device}/{compute_type}"
+
+
+class RtfModel:
+    """実行環境ごとの実時間比の学習結果（音声の長さで重み付けし、古いジョブほど重みを減らす）"""
+
+    def __init__(self, path=DEFAULT_RTF_MODEL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}  # キー -> {"audio_seconds", "elapsed_seconds", "jobs"}（減衰させた合計）
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"処理時間の学習結果を読み込めませんでした: {e}")
+
+    def estimate(self, key):
+        """実時間比の見積もり。まだ学習していない場合は None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry["audio_seconds"] <= 0:
+                return None
+            return entry["elapsed_seconds"] / entry["audio_seconds"]
+
+    def update(self, key, audio_seconds, elapsed_seconds):
+        """完了したジョブの音声の長さと処理時間を学習し、ファイルに保存する"""
+        if not audio_seconds or audio_seconds <= 0:
+            return
+        with self.lock:
+            entry = self.entries.get(key, {"audio_seconds": 0.0, "elapsed_seconds": 0.0, "jobs": 0})
+            self.entries[key] = {
+                "audio_seconds": entry["audio_seconds"] * DECAY + audio_seconds,
+                "elapsed_seconds": entry["elapsed_seconds"] * DECAY + elapsed_seconds,
+                "jobs": entry["jobs"] + 1
+            }
+            data = json.dumps(self.entries, ensure_ascii=False, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_write_text(self.path, data)
+        except OSError as e:
+            logging.warning(f"処理時間の学習結果を保存できませんでした: {e}")
+
+    def stats(self):
+        """キーごとの実時間比と学習したジョブ数"""
+        with self.lock:
+            return {
+                key: {"rtf": entry["elapsed_seconds"] / entry["audio_seconds"], "jobs": entry["jobs"]}
+                for key, entry in self.entries.items() if entry["audio_seconds"] > 0
+            }
+
+
+def blend_rtf(learned, elapsed_seconds, processed_seconds, duration):
+    """処理中のジョブの実時間比を見積もる
+
+    学習済みの値と、このジョブでここまでに観測した値（経過時間 ÷ 処理済みの音声の長さ）を、
+    処理が進むほど観測した値を重く混ぜる。どちらもない場合は None
+    """
+    observed = elapsed_seconds / processed_seconds if processed_seconds > 0 else None
+    if observed is None or not duration:
+        return learned if learned is not None else observed
+    if learned is None:
+        return observed
+    weight = min(processed_seconds / duration, 1.0)
+    return weight * observed + (1 - weight) * learned
+
+
+def schedule_eta(busy_seconds, job_seconds):
+    """処理待ちのジョブが順に空いたワーカーへ割り当てられるとして、ジョブごとの (開始までの秒数, 完了までの秒数) を返す
+
+    busy_seconds はワーカーごとの空くまでの秒数（不明な場合は None）、job_seconds は処理する順に並べた
+    各ジョブの処理時間の見積もり（不明な場合は None）。見積もれないジョブは (None, None) になる
+    """
+    slots = list(busy_seconds)
+    results = []
+    for seconds in job_seconds:
+        known = [i for i, free_at in enumerate(slots) if free_at is not None]
+        if not known:
+            results.append((None, None))
+            continue
+        i = min(known, key=lambda i: slots[i])
+        start = slots[i]
+        finish = start + seconds if seconds is not None else None
+        # 処理時間が分からないジョブを割り当てたワーカーは、それ以降いつ空くか分からない
+        slots[i] = finish
+        results.append((start, finish))
+    return results
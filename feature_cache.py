@@ -0,0 +1,200 @@
+"""
+特徴量キャッシュ
+音声ファイルの内容のハッシュごとに、ファイル全体の正規化前のlog-melスペクトログラムと、
+指定した場合はモデルごとのエンコーダ出力（30秒のウィンドウごと）をNumPy配列としてディスクに保存する。
+保存した配列はメモリマップで読み込むため、長い音声でもメモリ使用量は増えない。
+言語を変えて同じ音声を文字起こしし直す場合などに、音声のデコードとlog-melの計算
+（エンコーダ出力も保存している場合は、同じ位置のウィンドウのエンコーダの実行）を省略できる
+"""
+
+import contextlib
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+
+from metrics import CACHE_REQUESTS
+from result_cache import hash_file
+
+# デフォルトのキャッシュ保存先と容量上限
+DEFAULT_FEATURE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "features")
+DEFAULT_FEATURE_CACHE_MB = 2000
+
+# log-melは (フレーム数, メルの数) の float32 をヘッダなしで保存し、ファイルサイズからフレーム数を求める
+MEL_SUFFIX = ".f32"
+ENCODER_SUFFIX = ".npy"
+
+
+class MelWriter:
+    """計算したlog-melを一時ファイルに追記し、最後まで書けた場合だけキャッシュに登録する"""
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        self.file = open(self.temp_path, "wb")
+        self.failed = False
+        self.committed = False
+
+    def write(self, frames):
+        # ディスクがいっぱいの場合なども、文字起こしは止めずに保存だけをあきらめる
+        if self.failed:
+            return
+        try:
+            self.file.write(np.ascontiguousarray(frames, dtype=np.float32).tobytes())
+        except OSError as e:
+            logging.warning(f"log-melをキャッシュに保存できませんでした: {e}")
+            self.failed = True
+
+    def commit(self):
+        if self.failed:
+            return
+        try:
+            self.file.close()
+            os.replace(self.temp_path, self.path)
+            self.committed = True
+        except OSError as e:
+            logging.warning(f"log-melをキャッシュに保存できませんでした: {e}")
+
+    def close(self):
+        """登録されなかった一時ファイル（途中で失敗した場合など）を削除する"""
+        if not self.file.closed:
+            self.file.close()
+        if not self.committed:
+            with contextlib.suppress(OSError):
+                os.remove(self.temp_path)
+
+
+class FeatureEntry:
+    """1つの音声ファイルとモデルの組み合わせに対するキャッシュの読み書き"""
+
+    def __init__(self, cache, audio_hash, model_name, compute_type, n_mels):
+        self.cache = cache
+        self.mel_path = os.path.join(cache.cache_dir, f"{audio_hash}.mel{n_mels}{MEL_SUFFIX}")
+        # エンコーダ出力はモデルの重みと計算精度で変わるため、モデルごとに保存する
+        model_key = re.sub(r"[^\w.-]", "_", f"{model_name}-{compute_type}")
+        self.encoder_prefix = os.path.join(cache.cache_dir, f"{audio_hash}.{model_key}.")
+        self.n_mels = n_mels
+        self.writers = []
+        self.written = False
+
+    def load_mel(self):
+        """保存済みのlog-mel（フレーム数, メルの数）をメモリマップで返す。ない場合は None"""
+        try:
+            size = os.path.getsize(self.mel_path)
+            mel = np.memmap(self.mel_path, dtype=np.float32, mode="r",
+                            shape=(size // (4 * self.n_mels), self.n_mels))
+            # 最終利用時刻を更新してLRUの順序に反映する
+            os.utime(self.mel_path)
+        except (OSError, ValueError):
+            CACHE_REQUESTS.inc(cache="mel", result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache="mel", result="hit")
+        return mel
+
+    def mel_writer(self):
+        """計算したlog-melを保存するライターを返す（書き込めない場合は None）"""
+        try:
+            writer = MelWriter(self.mel_path)
+        except OSError as e:
+            logging.warning(f"log-melをキャッシュに保存できません: {e}")
+            return None
+        self.writers.append(writer)
+        self.written = True
+        return writer
+
+    def _encoder_path(self, seek_frame):
+        return f"{self.encoder_prefix}{seek_frame}{ENCODER_SUFFIX}"
+
+    def load_encoder_output(self, seek_frame):
+        """seek_frame から始まるウィンドウのエンコーダ出力を返す。保存しない設定か、ない場合は None"""
+        if not self.cache.store_encoder:
+            return None
+        path = self._encoder_path(seek_frame)
+        try:
+            output = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError):
+            CACHE_REQUESTS.inc(cache="encoder", result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache="encoder", result="hit")
+        return output
+
+    def save_encoder_output(self, seek_frame, output):
+        """エンコーダ出力を保存する（保存しない設定の場合は何もしない）"""
+        if not self.cache.store_encoder:
+            return
+        path = self._encoder_path(seek_frame)
+        temp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(temp_path, "wb") as f:
+                np.save(f, output)
+            os.replace(temp_path, path)
+            self.written = True
+        except OSError as e:
+            logging.warning(f"エンコーダ出力をキャッシュに保存できませんでした: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+
+    def close(self):
+        """書きかけの一時ファイルを削除し、保存した場合は容量上限に収まるよう古いものから削除する"""
+        for writer in self.writers:
+            writer.close()
+        if self.written:
+            self.cache._evict()
+
+
+class FeatureCache:
+    """ディスク上の特徴量キャッシュ（容量上限を超えたら最終利用が古いものから削除）"""
+
+    def __init__(self, cache_dir=DEFAULT_FEATURE_CACHE_DIR, max_bytes=DEFAULT_FEATURE_CACHE_MB * 1024 * 1024,
+                 store_encoder=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.store_encoder = store_encoder
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry(self, audio_path, model_name, compute_type, n_mels):
+        """音声ファイルとモデルに対応するエントリを返す"""
+        return FeatureEntry(self, hash_file(audio_path), model_name, compute_type, n_mels)
+
+    def has_mel(self, audio_path):
+        """音声ファイルのlog-melが保存済みか（メルの数を問わない。ヒット数には数えない）"""
+        prefix = f"{hash_file(audio_path)}.mel"
+        try:
+            return any(name.startswith(prefix) and name.endswith(MEL_SUFFIX) for name in os.listdir(self.cache_dir))
+        except OSError:
+            return False
+
+    def has_features(self, audio_path):
+        """音声ファイルのlog-melかエンコーダ出力のどちらかが保存済みか（モデルを問わない。ヒット数には数えない）"""
+        prefix = f"{hash_file(audio_path)}."
+        try:
+            return any(name.startswith(prefix) and name.endswith((MEL_SUFFIX, ENCODER_SUFFIX))
+                       for name in os.listdir(self.cache_dir))
+        except OSError:
+            return False
+
+    def _evict(self):
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith((MEL_SUFFIX, ENCODER_SUFFIX)):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
@@ -0,0 +1,139 @@
+"""
+フォルダの監視
+新しく置かれた音声ファイルを検出する。Linuxでは inotify でフォルダへの書き込みを待ち受け、
+inotify が使えない環境では一定間隔でフォルダを走査する。
+書き込み途中のファイルを処理しないよう、サイズと更新時刻が一定時間変わらなくなったファイルだけを返す
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import time
+
+# inotify のイベント（linux/inotify.h）
+IN_CREATE = 0x00000100
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+# 変化がなくても念のためフォルダを走査し直す間隔（秒）
+RESCAN_SECONDS = 60
+
+
+class InotifyWaiter:
+    """inotify でフォルダへのファイルの作成・書き込み完了・移動を待つ（Linuxのみ）"""
+
+    mode = "inotify"
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        mask = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"{folder} を監視できません")
+
+    def wait(self, timeout):
+        """イベントが届くか timeout 秒経過するまで待つ"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            # 届いたイベントは読み捨て、フォルダを走査し直す
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWaiter:
+    """一定間隔でフォルダを走査する（inotify が使えない場合）"""
+
+    mode = "ポーリング"
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    """書き込みが終わった未処理の音声ファイルを検出する"""
+
+    def __init__(self, folder, extensions, stable_seconds=2.0, poll_interval=2.0, use_inotify=True):
+        self.folder = folder
+        self.extensions = extensions
+        self.stable_seconds = stable_seconds
+        self.pending = {}  # ファイル名 -> ((サイズ, 更新時刻), その状態を最初に確認した時刻)
+        self.attempted = {}  # 処理を試みたファイル名 -> (サイズ, 更新時刻)
+        self.waiter = None
+        if use_inotify:
+            try:
+                self.waiter = InotifyWaiter(folder)
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify を使用できないため、ポーリングでフォルダを監視します: {e}")
+        if self.waiter is None:
+            self.waiter = PollingWaiter(poll_interval)
+
+    @property
+    def mode(self):
+        return self.waiter.mode
+
+    def scan(self):
+        """サイズと更新時刻が stable_seconds 以上変化していない未処理のファイル名を返す"""
+        now = time.monotonic()
+        ready = []
+        seen = set()
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                # 隠しファイル（アップロード途中の一時ファイルなど）は対象外
+                if entry.name.startswith(".") or not entry.name.lower().endswith(self.extensions):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                seen.add(entry.name)
+                if self.attempted.get(entry.name) == signature:
+                    # 処理に失敗して残っているファイルは、更新されるまで再処理しない
+                    continue
+                previous = self.pending.get(entry.name)
+                if previous is None or previous[0] != signature:
+                    self.pending[entry.name] = (signature, now)
+                elif now - previous[1] >= self.stable_seconds:
+                    ready.append(entry.name)
+
+        # フォルダからなくなったファイルの記録を削除
+        self.pending = {name: state for name, state in self.pending.items() if name in seen}
+        self.attempted = {name: signature for name, signature in self.attempted.items() if name in seen}
+        return sorted(ready)
+
+    def mark_attempted(self, names):
+        """処理を試みたファイルを記録する（失敗してフォルダに残った場合に繰り返し処理しないため）"""
+        for name in names:
+            state = self.pending.pop(name, None)
+            if state is not None:
+                self.attempted[name] = state[0]
+
+    def wait(self):
+        """次の走査まで待つ。書き込み中のファイルがあれば、安定を確認できる時間だけ待つ"""
+        if self.pending:
+            time.sleep(self.stable_seconds)
+        else:
+            self.waiter.wait(RESCAN_SECONDS)
+
+    def close(self):
+        self.waiter.close()
@@ -0,0 +1,121 @@
+"""
+ジョブジャーナル
+文字起こしジョブの状態をSQLiteに記録し、プロセスが途中で終了しても再起動時に
+未完了のジョブを再開できるようにする。出力ファイルは一時ファイルに書き込んでから
+置き換えるため、途中まで書かれた出力が残ることはない
+
+状態は queued（処理待ち）→ processing（文字起こし中）→ written（出力済み・音声の移動待ち）
+→ completed / error / cancelled（キャンセル・処理時間の上限による中断）と進む。
+written のジョブは再起動時に音声の移動だけを行えばよい。cancelled のジョブは再開しない
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "jobs.sqlite3")
+
+# 再開の対象とする状態
+UNFINISHED_STATUSES = ("queued", "processing", "written")
+
+# 完了・エラーになったジョブの記録を残す期間（秒）
+RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+
+def atomic_write_text(path, text):
+    """一時ファイルに書き込んでから置き換え、書き込み途中のファイルが残らないようにする"""
+    temp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def file_signature(path):
+    """ファイルが差し替えられていないか確認するための (サイズ, 更新時刻)"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def finish_move(audio_path, processed_path):
+    """出力済みのジョブの音声を処理済みフォルダへ移動する（移動済みなら何もしない）"""
+    if os.path.exists(audio_path):
+        shutil.move(audio_path, processed_path)
+
+
+class JobJournal:
+    """ジョブの状態を記録するSQLiteのジャーナル（スレッド・プロセス間で共有可能）"""
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 複数のワーカープロセスから書き込むため、ロック待ちのタイムアウトを長めにする
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, source TEXT NOT NULL, file TEXT NOT NULL, settings TEXT NOT NULL, "
+                "status TEXT NOT NULL, message TEXT NOT NULL DEFAULT '', "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?, ?) AND updated_at < ?",
+                (*UNFINISHED_STATUSES, time.time() - RETENTION_SECONDS)
+            )
+
+    def add(self, job_id, source, file, settings, status="queued"):
+        """ジョブを記録する（同じIDのジョブがあれば置き換える）"""
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO jobs (id, source, file, settings, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, source, file, json.dumps(settings, ensure_ascii=False), status, now, now)
+            )
+
+    def update(self, job_id, status, message=""):
+        """ジョブの状態を更新する"""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, message = ?, updated_at = ? WHERE id = ?",
+                (status, message, time.time(), job_id)
+            )
+
+    def unfinished(self, source):
+        """前回の実行で完了しなかったジョブを登録順に返す"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, source, file, settings, status, message, created_at FROM jobs "
+                "WHERE source = ? AND status IN (?, ?, ?) ORDER BY created_at",
+                (source, *UNFINISHED_STATUSES)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row):
+        job_id, source, file, settings, status, message, created_at = row
+        return {
+            "id": job_id,
+            "source": source,
+            "file": file,
+            "settings": json.loads(settings),
+            "status": status,
+            "message": message,
+            "created_at": created_at
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
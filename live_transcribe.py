@@ -0,0 +1,222 @@
+"""
+リアルタイム文字起こし
+マイクなどから届き続ける音声を最大30秒のスライディングウィンドウに溜め、一定間隔で
+ウィンドウ全体を文字起こしし直す。ウィンドウの末尾から hold_seconds 以上前に終わっている
+セグメントは確定（final）としてウィンドウから取り除き、それ以降は暫定（partial）として返す。
+ウィンドウが max_window_seconds を超えた場合は強制的に確定させるため、保持する音声と
+確定までの遅延には上限がある
+"""
+
+import os
+import subprocess
+import threading
+
+import numpy as np
+from whisper.audio import SAMPLE_RATE
+
+DEFAULT_STEP_SECONDS = 1.0
+DEFAULT_HOLD_SECONDS = 2.0
+DEFAULT_MAX_WINDOW_SECONDS = 20.0
+
+
+def pcm16_to_float(data):
+    """16bit リトルエンディアンのPCMを float32 の波形に変換する"""
+    return np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+
+
+def resample(audio, sample_rate):
+    """波形を16kHzに線形補間でリサンプリングする"""
+    if sample_rate == SAMPLE_RATE or len(audio) == 0:
+        return audio
+    length = int(round(len(audio) * SAMPLE_RATE / sample_rate))
+    positions = np.arange(length) * (sample_rate / SAMPLE_RATE)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+class PcmDecoder:
+    """16bit PCM（任意のサンプルレート、モノラル）をそのまま波形に変換する"""
+
+    def __init__(self, on_audio, sample_rate=SAMPLE_RATE):
+        self.on_audio = on_audio
+        self.sample_rate = sample_rate
+        self.remainder = b""
+
+    def write(self, data):
+        data = self.remainder + data
+        # サンプルの途中で区切られたバイトは次のチャンクに回す
+        usable = len(data) - len(data) % 2
+        self.remainder = data[usable:]
+        if usable:
+            self.on_audio(resample(pcm16_to_float(data[:usable]), self.sample_rate))
+
+    def close(self):
+        pass
+
+
+class FfmpegDecoder:
+    """Opus（WebM/Ogg）などの圧縮音声をffmpegで16kHzモノラルのPCMに逐次デコードする"""
+
+    def __init__(self, on_audio):
+        self.on_audio = on_audio
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self.pcm = PcmDecoder(on_audio)
+        self.thread = threading.Thread(target=self._read, name="live-ffmpeg-reader", daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        # デコードできた分からすぐに渡すため、届いた分だけ読み出す
+        while True:
+            data = os.read(self.process.stdout.fileno(), 65536)
+            if not data:
+                break
+            self.pcm.write(data)
+
+    def write(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def close(self):
+        """入力を閉じ、残りのデコード結果を受け取ってからffmpegを終了する"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.thread.join()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+class LiveTranscriber:
+    """スライディングウィンドウで音声を逐次文字起こしし、確定・暫定の結果を保持する"""
+
+    def __init__(self, step_seconds=DEFAULT_STEP_SECONDS, hold_seconds=DEFAULT_HOLD_SECONDS,
+                 max_window_seconds=DEFAULT_MAX_WINDOW_SECONDS):
+        self.step_samples = int(step_seconds * SAMPLE_RATE)
+        self.hold_seconds = hold_seconds
+        self.max_window_seconds = max_window_seconds
+        self.changed = threading.Condition()
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_offset = 0.0  # buffer[0] の、ストリーム先頭からの時刻（秒）
+        self.received_samples = 0
+        self.decoded_samples = 0  # 前回文字起こししたときまでに受信していたサンプル数
+        self.finished = False
+        self.done = False
+        self.final_segments = []
+        self.partial_segments = []
+        self.version = 0
+
+    def add_audio(self, audio):
+        """16kHzの波形を受信バッファに追加する"""
+        with self.changed:
+            self.buffer = np.concatenate([self.buffer, audio])
+            self.received_samples += len(audio)
+            self.changed.notify_all()
+
+    def finish(self):
+        """音声の終わりを通知する（残りの音声を文字起こしして、すべて確定させる）"""
+        with self.changed:
+            self.finished = True
+            self.changed.notify_all()
+
+    def _ready(self):
+        return (self.received_samples - self.decoded_samples >= self.step_samples
+                or (self.finished and not self.done))
+
+    def wait_ready(self, timeout):
+        """文字起こしすべき音声が溜まるか、音声が終わるまで最大 timeout 秒待つ"""
+        with self.changed:
+            return self.changed.wait_for(self._ready, timeout=timeout)
+
+    def step(self, transcribe):
+        """現在のウィンドウを文字起こしし、確定したセグメントのリストを返す
+
+        transcribe(16kHzの波形) は whisper.transcribe と同じ形式の辞書を返す関数
+        """
+        with self.changed:
+            audio = self.buffer
+            offset = self.buffer_offset
+            finished = self.finished
+            self.decoded_samples = self.received_samples
+
+        duration = len(audio) / SAMPLE_RATE
+        segments = []
+        if len(audio) > 0:
+            segments = [segment for segment in transcribe(audio)["segments"] if segment["text"].strip()]
+
+        if finished:
+            commit_count = len(segments)
+        else:
+            # 末尾付近で終わるセグメントは続きの音声で変わり得るため暫定のままにする
+            commit_count = 0
+            for segment in segments:
+                if segment["end"] > duration - self.hold_seconds:
+                    break
+                commit_count += 1
+            if commit_count == 0 and segments and duration >= self.max_window_seconds:
+                # ウィンドウが長くなりすぎた場合は、最後のセグメント以外（1つしかなければそれも）確定させる
+                commit_count = max(len(segments) - 1, 1)
+
+        if finished:
+            commit_seconds = duration
+        elif commit_count:
+            commit_seconds = segments[commit_count - 1]["end"]
+        elif not segments and duration >= self.max_window_seconds:
+            # 発話のない区間は末尾を残して捨てる
+            commit_seconds = duration - self.hold_seconds
+        else:
+            commit_seconds = 0.0
+        commit_seconds = min(max(commit_seconds, 0.0), duration)
+
+        def shift(segment):
+            return {
+                "start": round(offset + segment["start"], 3),
+                "end": round(offset + segment["end"], 3),
+                "text": segment["text"]
+            }
+
+        with self.changed:
+            committed = []
+            for segment in segments[:commit_count]:
+                committed.append({"id": len(self.final_segments), **shift(segment)})
+                self.final_segments.append(committed[-1])
+            self.partial_segments = [shift(segment) for segment in segments[commit_count:]]
+            commit_samples = int(commit_seconds * SAMPLE_RATE)
+            self.buffer = self.buffer[commit_samples:]
+            self.buffer_offset += commit_samples / SAMPLE_RATE
+            if finished and self.decoded_samples == self.received_samples:
+                self.done = True
+            self.version += 1
+            self.changed.notify_all()
+        return committed
+
+    def close(self):
+        """エラーなどで文字起こしを打ち切る"""
+        with self.changed:
+            self.finished = True
+            self.done = True
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_update(self, since, timeout):
+        """結果のバージョンが since より新しくなるか、すべて確定するまで最大 timeout 秒待つ"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version > since or self.done, timeout=timeout)
+
+    def snapshot(self, start=0):
+        """start 番目以降の確定セグメントと暫定セグメントを返す"""
+        with self.changed:
+            return {
+                "version": self.version,
+                "done": self.done,
+                "received_seconds": self.received_samples / SAMPLE_RATE,
+                "decoded_seconds": self.decoded_samples / SAMPLE_RATE,
+                "start": start,
+                "final": list(self.final_segments[start:]),
+                "final_count": len(self.final_segments),
+                "partial": list(self.partial_segments),
+                "partial_text": "".join(segment["text"] for segment in self.partial_segments)
+            }
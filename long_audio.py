@@ -0,0 +1,75 @@
+"""
+長時間音声の分割文字起こし
+エネルギーベースの簡易VADで無音に近い位置を探して音声を分割し、
+各チャンクの文字起こし結果をタイムスタンプを補正しながら元の順序で結合する
+"""
+
+import numpy as np
+from whisper.audio import SAMPLE_RATE, HOP_LENGTH
+
+# VADのフレーム長（ミリ秒）と、エネルギーを平滑化するフレーム数
+FRAME_MS = 30
+SMOOTHING_FRAMES = 10
+
+
+def frame_energy(audio, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS):
+    """フレームごとのRMSエネルギーを計算し、短い雑音に反応しないよう平滑化する"""
+    frame_length = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame_length
+    frames = audio[:n_frames * frame_length].reshape(n_frames, frame_length)
+    energy = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+    kernel = np.ones(SMOOTHING_FRAMES, dtype=np.float32) / SMOOTHING_FRAMES
+    return np.convolve(energy, kernel, mode="same"), frame_length
+
+
+def split_on_silence(audio, chunk_seconds=300, search_seconds=30, sample_rate=SAMPLE_RATE):
+    """目標のチャンク長ごとに、前後 search_seconds の範囲で最もエネルギーが低い位置で分割する
+
+    戻り値は (開始サンプル, 終了サンプル) のリスト
+    """
+    total = len(audio)
+    chunk_samples = int(chunk_seconds * sample_rate)
+    n_chunks = max(1, int(round(total / chunk_samples)))
+    if n_chunks == 1:
+        return [(0, total)]
+
+    energy, frame_length = frame_energy(audio, sample_rate)
+    search_frames = int(search_seconds * sample_rate) // frame_length
+
+    boundaries = [0]
+    for i in range(1, n_chunks):
+        target = (i * total // n_chunks) // frame_length
+        low = max(boundaries[-1] // frame_length + 1, target - search_frames)
+        high = min(len(energy), target + search_frames)
+        if low >= high:
+            continue
+        quietest = low + int(np.argmin(energy[low:high]))
+        boundaries.append(quietest * frame_length)
+    boundaries.append(total)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def merge_chunk_results(results, offsets, sample_rate=SAMPLE_RATE):
+    """チャンクごとの文字起こし結果を、開始位置（サンプル数）でタイムスタンプを補正して結合する"""
+    segments = []
+    for result, offset in zip(results, offsets):
+        offset_seconds = offset / sample_rate
+        for segment in result.get("segments", []):
+            segment = dict(segment)
+            segment["id"] = len(segments)
+            segment["seek"] = segment.get("seek", 0) + offset // HOP_LENGTH
+            segment["start"] = segment["start"] + offset_seconds
+            segment["end"] = segment["end"] + offset_seconds
+            if "words" in segment:
+                segment["words"] = [
+                    {**word, "start": word["start"] + offset_seconds, "end": word["end"] + offset_seconds}
+                    for word in segment["words"]
+                ]
+            segments.append(segment)
+    return {
+        "text": "".join(result["text"] for result in results),
+        "segments": segments,
+        "language": results[0].get("language") if results else None
+    }
@@ -0,0 +1,292 @@
+"""
+性能メトリクス
+処理段階ごとの所要時間（キュー待ち、音声のデコード、log-mel、エンコーダ、デコーダ、書き出しなど）、
+実時間比、キャッシュのヒット数を集計し、Prometheusのテキスト形式（ウェブアプリの /metrics）や
+CLIの集計表として出力する。外部ライブラリには依存しない。
+ワーカープロセスで計測した値は drain() で取り出し、親プロセスで merge() して合算する
+"""
+
+import contextlib
+import math
+import threading
+import time
+
+import psutil
+import torch
+
+# 所要時間（秒）のヒストグラムの区切り
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+# 実時間比のヒストグラムの区切り
+RTF_BUCKETS = (0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """増加するだけの値（ラベルの組み合わせごとに保持）"""
+
+    type = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with REGISTRY.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with REGISTRY.lock:
+            return [(self.name, dict(zip(self.label_names, key)), value) for key, value in sorted(self.values.items())]
+
+    def state(self):
+        return dict(self.values)
+
+    def merge(self, state):
+        for key, value in state.items():
+            self.values[key] = self.values.get(key, 0) + value
+
+    def reset(self):
+        self.values = {}
+
+
+class Histogram:
+    """観測値の分布（区切りごとの累積件数・合計・件数・最大値）"""
+
+    type = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.values = {}  # ラベル -> {"counts", "sum", "count", "max"}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _empty(self):
+        return {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0, "max": 0.0}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with REGISTRY.lock:
+            entry = self.values.setdefault(key, self._empty())
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+            entry["max"] = max(entry["max"], value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """with ブロックの所要時間を観測する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with REGISTRY.lock:
+            values = self.state()
+        samples = []
+        for key, entry in sorted(values.items()):
+            labels = dict(zip(self.label_names, key))
+            for bound, count in zip(self.buckets, entry["counts"]):
+                samples.append((f"{self.name}_bucket", {**labels, "le": format_value(float(bound))}, count))
+            samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, entry["count"]))
+            samples.append((f"{self.name}_sum", labels, entry["sum"]))
+            samples.append((f"{self.name}_count", labels, entry["count"]))
+        return samples
+
+    def summary(self):
+        """ラベルごとの件数・合計・平均・最大値"""
+        return [
+            {
+                **dict(zip(self.label_names, key)),
+                "count": entry["count"],
+                "sum": entry["sum"],
+                "mean": entry["sum"] / entry["count"] if entry["count"] else 0.0,
+                "max": entry["max"]
+            }
+            for key, entry in sorted(self.values.items())
+        ]
+
+    def state(self):
+        return {key: {**entry, "counts": list(entry["counts"])} for key, entry in self.values.items()}
+
+    def merge(self, state):
+        for key, other in state.items():
+            entry = self.values.setdefault(key, self._empty())
+            entry["counts"] = [a + b for a, b in zip(entry["counts"], other["counts"])]
+            entry["sum"] += other["sum"]
+            entry["count"] += other["count"]
+            entry["max"] = max(entry["max"], other["max"])
+
+    def reset(self):
+        self.values = {}
+
+
+class CallbackMetric:
+    """出力時に関数を呼んで値を取得するメトリクス（メモリ使用量やキャッシュの統計など）
+
+    func() は値、または (ラベルの辞書, 値) のリストを返す
+    """
+
+    def __init__(self, name, help_text, func, metric_type="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+        self.type = metric_type
+
+    def samples(self):
+        value = self.func()
+        if isinstance(value, list):
+            return [(self.name, labels, sample) for labels, sample in value]
+        return [(self.name, {}, value)]
+
+
+class MetricsRegistry:
+    """メトリクスをまとめて管理し、Prometheusのテキスト形式で出力する"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.metrics = []
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics = [existing for existing in self.metrics if existing.name != metric.name]
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheusのテキスト形式（text/plain; version=0.0.4）で出力する"""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+        # キャッシュの統計など他のロックを取る関数を呼ぶため、レジストリのロックを持たずに値を取得する
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception:
+                # 取得に失敗した値は出力しない（他のメトリクスは出力を続ける）
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def drain(self):
+        """計測した値を取り出してリセットする（ワーカープロセスから親プロセスに渡すため）"""
+        with self.lock:
+            state = {}
+            for metric in self.metrics:
+                if hasattr(metric, "state"):
+                    state[metric.name] = metric.state()
+                    metric.reset()
+            return state
+
+    def merge(self, state):
+        """drain() で取り出した値を合算する"""
+        with self.lock:
+            for metric in self.metrics:
+                if metric.name in state:
+                    metric.merge(state[metric.name])
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "whisper_stage_seconds",
+    "処理段階ごとの所要時間（秒）",
+    ("stage",)
+))
+AUDIO_SECONDS = REGISTRY.register(Counter(
+    "whisper_audio_seconds_total",
+    "文字起こしした音声の長さの合計（秒）"
+))
+REAL_TIME_FACTOR = REGISTRY.register(Histogram(
+    "whisper_real_time_factor",
+    "文字起こしの実時間比（推論時間 ÷ 音声の長さ）",
+    buckets=RTF_BUCKETS
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "whisper_cache_requests_total",
+    "キャッシュの参照回数（cache: model / result / mel / encoder、result: hit / miss）",
+    ("cache", "result")
+))
+JOBS = REGISTRY.register(Counter(
+    "whisper_jobs_total",
+    "終了したジョブ数（status: completed / error / cancelled）",
+    ("status",)
+))
+REGISTRY.register(CallbackMetric(
+    "whisper_process_resident_memory_bytes",
+    "このプロセスの常駐メモリ（RSS、バイト）",
+    lambda: psutil.Process().memory_info().rss
+))
+REGISTRY.register(CallbackMetric(
+    "whisper_torch_threads",
+    "PyTorchの演算スレッド数",
+    torch.get_num_threads
+))
+
+
+def stage_timer(stage):
+    """処理段階の所要時間を計測する with ブロックを返す"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def record_transcription(audio_seconds, elapsed_seconds, count=1):
+    """文字起こしした音声の長さと実時間比を記録する（count 個の音声をまとめて処理した場合は、それぞれ同じ実時間比とする）"""
+    AUDIO_SECONDS.inc(audio_seconds)
+    if audio_seconds > 0:
+        for _ in range(count):
+            REAL_TIME_FACTOR.observe(elapsed_seconds / audio_seconds)
+
+
+def format_summary():
+    """CLIの終了時に表示する集計表（処理段階ごとの所要時間・実時間比・キャッシュヒット数など）"""
+    lines = ["性能メトリクス:"]
+    stages = STAGE_SECONDS.summary()
+    if stages:
+        # 見出しの全角文字は2桁分の幅で表示されるため、その分だけ詰めて揃える
+        lines.append(f"  {'処理段階':<10}{'回数':>6}{'合計(秒)':>10}{'平均(秒)':>10}{'最大(秒)':>10}")
+        for entry in stages:
+            lines.append(f"  {entry['stage']:<14}{entry['count']:>8}{entry['sum']:>12.2f}"
+                         f"{entry['mean']:>12.3f}{entry['max']:>12.3f}")
+    audio_seconds = sum(AUDIO_SECONDS.values.values())
+    for entry in REAL_TIME_FACTOR.summary():
+        lines.append(f"  実時間比: 平均 {entry['sum'] / entry['count']:.3f}、最大 {entry['max']:.3f}"
+                     f"（{entry['count']}件、音声 {audio_seconds:.1f}秒）")
+    for cache in ("model", "result", "mel", "encoder"):
+        hits = CACHE_REQUESTS.values.get((cache, "hit"), 0)
+        misses = CACHE_REQUESTS.values.get((cache, "miss"), 0)
+        if hits + misses:
+            lines.append(f"  {cache}キャッシュ: ヒット {hits}/{hits + misses}")
+    lines.append(f"  RSS: {psutil.Process().memory_info().rss / 1024**2:.0f}MB、"
+                 f"PyTorchスレッド数: {torch.get_num_threads()}")
+    return "\n".join(lines)
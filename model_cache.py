@@ -0,0 +1,172 @@
+"""
+Whisperモデルのキャッシュ
+(モデル名, デバイス, 計算タイプ) ごとに読み込み済みモデルを保持し、
+メモリ上限を超えた場合は最も長く使われていないモデルから解放する
+"""
+
+import contextlib
+import gc
+import logging
+import threading
+import time
+
+import psutil
+import torch
+
+from metrics import CACHE_REQUESTS
+
+
+def estimate_model_bytes(model):
+    """モデルの重みとバッファが占めるメモリ量（バイト）を概算"""
+    if hasattr(model, "memory_bytes"):
+        # 推論バックエンドは自身のメモリ量を返す
+        return model.memory_bytes()
+    total = 0
+    # 動的量子化したLinear層の重みはパラメータに含まれないため、state_dict から数える
+    for value in model.state_dict().values():
+        for tensor in (value if isinstance(value, tuple) else (value,)):
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def default_memory_budget():
+    """デフォルトのメモリ上限（物理メモリの半分）"""
+    return psutil.virtual_memory().total // 2
+
+
+class ModelCache:
+    """読み込み済みモデルをキーごとに保持するLRUキャッシュ
+
+    Whisperはデコード中にモデルへフックを登録するため、1つのモデルインスタンスを
+    同時に複数のジョブで使うことはできない。使用中のインスタンスは貸し出し扱いとし、
+    同じキーのジョブが並行した場合は追加のインスタンスを読み込む。
+    """
+
+    def __init__(self, loader, max_bytes=None):
+        # loader(model_name, device, compute_type, **kwargs) -> model または None
+        self.loader = loader
+        self.max_bytes = max_bytes if max_bytes is not None else default_memory_budget()
+        self.lock = threading.Lock()
+        self.entries = []  # {"key", "model", "bytes", "in_use", "last_used"}
+        self.stats_by_key = {}
+        self.evictions = 0
+
+    def _key_stats(self, key):
+        if key not in self.stats_by_key:
+            self.stats_by_key[key] = {"hits": 0, "misses": 0, "loads": 0, "load_time": 0.0}
+        return self.stats_by_key[key]
+
+    def _used_bytes(self):
+        return sum(entry["bytes"] for entry in self.entries)
+
+    def _evict(self, required_bytes=0):
+        """メモリ上限に収まるまで、未使用のモデルを古い順に解放する（ロック取得済みで呼ぶこと）"""
+        idle = sorted((entry for entry in self.entries if not entry["in_use"]),
+                      key=lambda entry: entry["last_used"])
+        evicted = 0
+        for entry in idle:
+            if self._used_bytes() + required_bytes <= self.max_bytes:
+                break
+            self.entries.remove(entry)
+            self.evictions += 1
+            evicted += 1
+            logging.info(f"モデルキャッシュから {entry['key'][0]} ({entry['key'][1]}, {entry['key'][2]}) を解放しました")
+        if evicted:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def acquire(self, model_name, device, compute_type, reload=False, **load_kwargs):
+        """モデルを貸し出す。未使用のインスタンスがなければ新しく読み込む"""
+        key = (model_name, device, compute_type)
+        with self.lock:
+            stats = self._key_stats(key)
+            if reload:
+                # 再読み込みが指定された場合は未使用のインスタンスを破棄する
+                self.entries = [entry for entry in self.entries
+                                if entry["key"] != key or entry["in_use"]]
+            for entry in reversed(self.entries):
+                if entry["key"] == key and not entry["in_use"]:
+                    entry["in_use"] = True
+                    entry["last_used"] = time.time()
+                    stats["hits"] += 1
+                    CACHE_REQUESTS.inc(cache="model", result="hit")
+                    return entry["model"]
+            stats["misses"] += 1
+            CACHE_REQUESTS.inc(cache="model", result="miss")
+
+        # 読み込みには時間がかかるため、ロックの外で行う
+        start_time = time.time()
+        model = self.loader(model_name, device, compute_type, **load_kwargs)
+        load_time = time.time() - start_time
+        if model is None:
+            return None
+
+        model_bytes = estimate_model_bytes(model)
+        with self.lock:
+            stats["loads"] += 1
+            stats["load_time"] += load_time
+            self._evict(model_bytes)
+            if self._used_bytes() + model_bytes > self.max_bytes:
+                logging.warning("モデルキャッシュのメモリ上限を超えています（使用中のモデルは解放できません）")
+            self.entries.append({
+                "key": key,
+                "model": model,
+                "bytes": model_bytes,
+                "in_use": True,
+                "last_used": time.time()
+            })
+        return model
+
+    def release(self, model):
+        """貸し出したモデルを返却する"""
+        with self.lock:
+            for entry in self.entries:
+                if entry["model"] is model:
+                    entry["in_use"] = False
+                    entry["last_used"] = time.time()
+                    break
+            self._evict()
+
+    @contextlib.contextmanager
+    def use(self, model_name, device, compute_type, **kwargs):
+        """with文でモデルを借りて、終了時に自動で返却する"""
+        model = self.acquire(model_name, device, compute_type, **kwargs)
+        try:
+            yield model
+        finally:
+            if model is not None:
+                self.release(model)
+
+    def stats(self):
+        """ヒット率・読み込み時間・メモリ使用量などの統計情報を返す"""
+        with self.lock:
+            models = []
+            for key, stats in self.stats_by_key.items():
+                instances = [entry for entry in self.entries if entry["key"] == key]
+                requests = stats["hits"] + stats["misses"]
+                models.append({
+                    "model": key[0],
+                    "device": key[1],
+                    "compute_type": key[2],
+                    "hits": stats["hits"],
+                    "misses": stats["misses"],
+                    "hit_rate": stats["hits"] / requests if requests else 0.0,
+                    "loads": stats["loads"],
+                    "average_load_time": stats["load_time"] / stats["loads"] if stats["loads"] else 0.0,
+                    "instances": len(instances),
+                    "in_use": sum(1 for entry in instances if entry["in_use"]),
+                    "memory_mb": sum(entry["bytes"] for entry in instances) / 1024**2
+                })
+            hits = sum(stats["hits"] for stats in self.stats_by_key.values())
+            misses = sum(stats["misses"] for stats in self.stats_by_key.values())
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "evictions": self.evictions,
+                "memory_used_mb": self._used_bytes() / 1024**2,
+                "memory_budget_mb": self.max_bytes / 1024**2,
+                "models": models
+            }
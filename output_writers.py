@@ -0,0 +1,120 @@
+"""
+文字起こし結果の出力
+1回の文字起こし結果から txt / srt / vtt / tsv / json の各形式を書き出す。
+字幕形式（srt, vtt）と tsv は whisper.utils のライターで整形し、
+どの形式も一時ファイルに書き込んでから置き換える。
+文字起こし中は、確定したセグメントを途中経過ファイルに逐次追記する
+"""
+
+import contextlib
+import io
+import json
+import os
+
+from whisper.utils import WriteSRT, WriteTSV, WriteVTT, format_timestamp
+
+from job_journal import atomic_write_text
+from metrics import stage_timer
+
+OUTPUT_FORMATS = ("txt", "srt", "vtt", "tsv", "json")
+DEFAULT_OUTPUT_FORMATS = ("txt",)
+
+# whisper.utils のライターで整形する形式
+SUBTITLE_WRITERS = {
+    "srt": WriteSRT,
+    "vtt": WriteVTT,
+    "tsv": WriteTSV
+}
+
+# 単語ごとのタイムスタンプがある場合に、字幕（srt, vtt）の1つに入れる最大の単語数
+SUBTITLE_MAX_WORDS = 8
+
+
+def parse_output_formats(value):
+    """カンマ区切りの出力形式の指定（"all" ですべて）をタプルに変換する"""
+    if isinstance(value, str):
+        value = value.split(",")
+    formats = []
+    for output_format in value:
+        output_format = output_format.strip().lower()
+        if not output_format:
+            continue
+        if output_format == "all":
+            return OUTPUT_FORMATS
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"不明な出力形式です: {output_format}（{', '.join(OUTPUT_FORMATS)}, all から選択してください）")
+        if output_format not in formats:
+            formats.append(output_format)
+    return tuple(formats) or DEFAULT_OUTPUT_FORMATS
+
+
+def output_paths(output_folder, audio_file, formats):
+    """音声ファイルに対応する出力ファイルのパスのリストを返す"""
+    base_name = os.path.splitext(os.path.basename(audio_file))[0]
+    return [os.path.join(output_folder, f"{base_name}.{output_format}") for output_format in formats]
+
+
+def format_result(result, output_format):
+    """文字起こし結果を指定の形式の文字列に変換する"""
+    if output_format == "txt":
+        return result["text"]
+    if output_format == "json":
+        return json.dumps(result, ensure_ascii=False, indent=2)
+    options = {}
+    if output_format in ("srt", "vtt") and any(segment.get("words") for segment in result["segments"]):
+        # 単語の時刻を使って、長いセグメントを SUBTITLE_MAX_WORDS 単語ずつの字幕に区切る
+        options["max_words_per_line"] = SUBTITLE_MAX_WORDS
+    buffer = io.StringIO()
+    SUBTITLE_WRITERS[output_format](os.curdir).write_result(result, buffer, **options)
+    return buffer.getvalue()
+
+
+def partial_path(output_folder, audio_file):
+    """音声ファイルに対応する途中経過ファイルのパス"""
+    base_name = os.path.splitext(os.path.basename(audio_file))[0]
+    return os.path.join(output_folder, f"{base_name}.txt.partial")
+
+
+class PartialOutput:
+    """文字起こし中に確定したセグメントを逐次追記する途中経過ファイル（<音声名>.txt.partial）
+
+    長い音声でも最初のウィンドウを処理した時点から内容を確認できる。
+    文字起こしが最後まで終わった場合は、write_outputs が最終的な出力を書き出した後に削除するため、
+    その間にプロセスが終了しても途中経過ファイルは残る。エラーや中断で with ブロックを抜けた場合はすぐに削除する
+    """
+
+    def __init__(self, output_folder, audio_file):
+        self.path = partial_path(output_folder, audio_file)
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "w", encoding="utf-8")
+        return self
+
+    def write_segments(self, segments):
+        """セグメントを1行ずつ追記し、すぐに読めるようフラッシュする"""
+        for segment in segments:
+            start = format_timestamp(segment["start"], always_include_hours=True)
+            end = format_timestamp(segment["end"], always_include_hours=True)
+            self.file.write(f"[{start} --> {end}] {segment['text'].strip()}\n")
+        self.file.flush()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is not None:
+            with contextlib.suppress(OSError):
+                os.remove(self.path)
+
+
+def write_outputs(result, output_folder, audio_file, formats=DEFAULT_OUTPUT_FORMATS):
+    """文字起こし結果を指定のすべての形式で書き出し、出力ファイルのパスのリストを返す
+
+    すべて書き出した後で、途中経過ファイルを削除する
+    """
+    paths = output_paths(output_folder, audio_file, formats)
+    with stage_timer("write"):
+        for output_format, path in zip(formats, paths):
+            atomic_write_text(path, format_result(result, output_format))
+    with contextlib.suppress(OSError):
+        os.remove(partial_path(output_folder, audio_file))
+    return paths
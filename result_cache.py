@@ -0,0 +1,142 @@
+"""
+文字起こし結果のキャッシュ
+音声ファイルの内容のハッシュと推論バックエンド・モデル名・言語・計算タイプをキーに、
+文字起こし結果をJSONとしてディスクに保存する。同じ音声が再アップロードされた場合は
+推論を行わずに保存済みの結果を返す
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from metrics import CACHE_REQUESTS
+
+# デフォルトのキャッシュ保存先と容量上限
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "results")
+DEFAULT_MAX_MB = 500
+
+
+# 計算済みのハッシュ（パス, サイズ, 更新時刻）-> ハッシュ。結果キャッシュと特徴量キャッシュで同じファイルを読み直さないため
+_hash_memo = {}
+_hash_memo_lock = threading.Lock()
+HASH_MEMO_SIZE = 256
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """ファイル内容のSHA-256ハッシュを計算（大きなファイルでもメモリを使わないよう分割して読む）
+
+    サイズと更新時刻が変わっていないファイルは、前回計算したハッシュを返す
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_memo_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    with _hash_memo_lock:
+        if len(_hash_memo) >= HASH_MEMO_SIZE:
+            _hash_memo.clear()
+        _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+class ResultCache:
+    """ディスク上の文字起こし結果キャッシュ（容量上限を超えたら最終利用が古いものから削除）"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, audio_path, model_name, language, compute_type, backend="whisper", word_timestamps=False):
+        """音声の内容と文字起こし設定（推論バックエンドを含む）からキャッシュキーを作成"""
+        settings = f"{backend}|{model_name}|{language}|{compute_type}"
+        if word_timestamps:
+            # 単語ごとのタイムスタンプを含む結果は別に保存する（既存のキャッシュキーは変えない）
+            settings += "|words"
+        return hashlib.sha256(f"{hash_file(audio_path)}|{settings}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """キャッシュ済みの結果を返す。存在しない場合は None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            # 最終利用時刻を更新してLRUの順序に反映する
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            CACHE_REQUESTS.inc(cache="result", result="miss")
+            return None
+        with self.lock:
+            self.hits += 1
+        CACHE_REQUESTS.inc(cache="result", result="hit")
+        return result
+
+    def contains(self, key):
+        """結果が保存済みか（ヒット数には数えない）"""
+        return os.path.exists(self._path(key))
+
+    def put(self, key, result):
+        """文字起こし結果を保存し、容量上限を超えていれば古いものから削除する"""
+        data = {
+            "text": result["text"],
+            "segments": result.get("segments", []),
+            "language": result.get("language")
+        }
+        path = self._path(key)
+        temp_path = f"{path}.tmp.{threading.get_ident()}"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"文字起こし結果をキャッシュに保存できませんでした: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self):
+        """ヒット数・ミス数・ヒット率を返す"""
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0
+            }
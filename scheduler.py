@@ -0,0 +1,130 @@
+"""
+ジョブのスケジューラ
+文字起こしジョブの処理待ち列。ワーカーが次のジョブを取り出すときに、方式に応じて順番を決める。
+  - fair: 利用者ごとの公平配分。利用者が最近処理させた音声の長さ（半減期で減衰）にジョブの音声の長さを
+    足した値が小さいものから処理する。長い音声を登録した利用者がいても、他の利用者の短い音声は待たされず、
+    同じ利用者のジョブは短いものから処理される
+  - sjf: 音声の短いものから処理する（利用者は区別しない）
+  - fifo: 登録順に処理する
+どの方式でも明示的な優先度（priority、大きいほど先）を最優先する。fair と sjf では待ち時間に応じて
+順位を上げる（エージング）ため、短い音声が次々に届いても長い音声がいつまでも処理されないことはない。
+処理中のジョブは中断できないため、reserved_workers を指定すると、その数のワーカーには長い音声を
+割り当てず、すべてのワーカーが長い音声で埋まって短い音声が待たされることを防ぐ
+"""
+
+import itertools
+import threading
+import time
+
+POLICIES = ("fair", "sjf", "fifo")
+DEFAULT_POLICY = "fair"
+
+# 待ち時間1秒あたり、音声の長さ何秒分だけ順位を上げるか
+DEFAULT_AGING_RATE = 2.0
+# 利用者の処理量を半分に減らすまでの時間（秒）
+DEFAULT_USAGE_HALF_LIFE = 600.0
+# 長さを取得できなかった音声の長さとみなす値（秒）
+UNKNOWN_DURATION = 300.0
+# reserved_workers で、予約したワーカーに割り当てない長い音声の長さ（秒）
+LONG_JOB_SECONDS = 600.0
+
+
+class JobScheduler:
+    """優先度・利用者ごとの公平配分・音声の長さで順番を決めるジョブの処理待ち列
+
+    workers はジョブを処理するワーカー数、reserved_workers はそのうち長い音声を割り当てないワーカー数。
+    ワーカーは取り出したジョブの処理が終わったら done() を呼ぶ。
+    clock には現在時刻（秒）を返す関数を指定する（シミュレーションでは仮想時刻を使う）
+    """
+
+    def __init__(self, policy=DEFAULT_POLICY, aging_rate=DEFAULT_AGING_RATE,
+                 usage_half_life=DEFAULT_USAGE_HALF_LIFE, workers=1, reserved_workers=0, clock=time.monotonic):
+        if policy not in POLICIES:
+            raise ValueError(f"不明なスケジューリング方式です: {policy}（{', '.join(POLICIES)} から指定してください）")
+        if not 0 <= reserved_workers < workers:
+            raise ValueError(f"予約するワーカー数は0以上、ワーカー数（{workers}）未満で指定してください")
+        self.policy = policy
+        self.aging_rate = aging_rate
+        self.usage_half_life = usage_half_life
+        self.long_slots = workers - reserved_workers  # 長い音声を同時に処理できる数
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.entries = {}  # ジョブID -> 処理待ちのジョブ
+        self.running = {}  # ジョブID -> 処理中のジョブ
+        self.usage = {}  # 利用者 -> (処理量（音声の秒数）, 更新時刻)
+        self.sequence = itertools.count()
+
+    def put(self, job_id, duration=None, user="", priority=0):
+        """ジョブを処理待ちに追加する（duration は音声の長さ（秒）、不明な場合は None）"""
+        with self.condition:
+            self.entries[job_id] = {
+                "job_id": job_id,
+                "duration": duration if duration is not None else UNKNOWN_DURATION,
+                "user": user,
+                "priority": priority,
+                "enqueued_at": self.clock(),
+                "sequence": next(self.sequence)
+            }
+            self.condition.notify()
+
+    def remove(self, job_id):
+        """処理待ちのジョブを取り除く。処理待ちでなかった場合は False"""
+        with self.condition:
+            return self.entries.pop(job_id, None) is not None
+
+    def _usage(self, user, now):
+        value, updated_at = self.usage.get(user, (0.0, now))
+        return value * 0.5 ** ((now - updated_at) / self.usage_half_life)
+
+    def _key(self, entry, now):
+        if self.policy == "fifo":
+            return (-entry["priority"], 0.0, entry["sequence"])
+        cost = entry["duration"] - self.aging_rate * (now - entry["enqueued_at"])
+        if self.policy == "fair":
+            cost += self._usage(entry["user"], now)
+        return (-entry["priority"], cost, entry["sequence"])
+
+    def _select(self, now):
+        """次に処理するジョブ（長い音声の枠が埋まっている場合は長い音声を除く）。なければ None"""
+        long_running = sum(1 for entry in self.running.values() if entry["duration"] > LONG_JOB_SECONDS)
+        candidates = [entry for entry in self.entries.values()
+                      if entry["duration"] <= LONG_JOB_SECONDS or long_running < self.long_slots]
+        return min(candidates, key=lambda entry: self._key(entry, now), default=None)
+
+    def pop(self):
+        """次に処理するジョブを取り出してジョブIDを返す（待たずに返し、処理できるジョブがなければ None）"""
+        with self.condition:
+            now = self.clock()
+            entry = self._select(now)
+            if entry is None:
+                return None
+            del self.entries[entry["job_id"]]
+            self.running[entry["job_id"]] = entry
+            # 処理を始めた時点で、利用者の処理量に音声の長さを加える
+            self.usage[entry["user"]] = (self._usage(entry["user"], now) + entry["duration"], now)
+            return entry["job_id"]
+
+    def get(self, timeout=None):
+        """処理できるジョブができるまで待ってから取り出す（timeout 秒待ってもなければ None）"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self._select(self.clock()) is not None, timeout=timeout):
+                return None
+            return self.pop()
+
+    def done(self, job_id):
+        """取り出したジョブの処理が終わったことを通知する"""
+        with self.condition:
+            if self.running.pop(job_id, None) is not None:
+                # 長い音声の枠が空いた可能性があるため、待っているワーカーをすべて起こす
+                self.condition.notify_all()
+
+    def order(self):
+        """現時点で処理される順に並べた、処理待ちのジョブIDのリスト"""
+        with self.condition:
+            now = self.clock()
+            return [entry["job_id"] for entry in sorted(self.entries.values(), key=lambda entry: self._key(entry, now))]
+
+    def __len__(self):
+        """処理待ちのジョブ数"""
+        with self.condition:
+            return len(self.entries)
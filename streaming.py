@@ -0,0 +1,459 @@
+"""
+ストリーミング文字起こし
+音声全体を一度にfloat32配列へ展開する whisper.load_audio の代わりに、ffmpegの出力を
+30秒ごとのウィンドウとして読み込みながらlog-melを逐次計算し、ウィンドウ単位でデコードを行う。
+保持するlog-melは最大でも数ウィンドウ分のため、ファイルの長さに関係なくメモリ使用量がほぼ一定になる。
+特徴量キャッシュを指定すると、計算したlog-mel（とエンコーダ出力）を保存し、次回は音声の読み込みから省略する
+"""
+
+import re
+import subprocess
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from whisper.audio import SAMPLE_RATE, HOP_LENGTH, N_FFT, N_FRAMES, N_SAMPLES, FRAMES_PER_SECOND, mel_filters
+from whisper.decoding import DecodingOptions
+from whisper.timing import add_word_timestamps
+from whisper.tokenizer import get_tokenizer
+
+from metrics import record_transcription, stage_timer
+
+# Whisperの transcribe と同じフォールバック用の温度
+DEFAULT_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+def probe_duration(path):
+    """音声の長さ（秒）を取得。ffprobeがない環境では ffmpeg -i の出力から読み取る。取得できない場合は None"""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        path
+    ]
+    try:
+        output = subprocess.run(cmd, capture_output=True, check=True, text=True).stdout
+        return float(output.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        pass
+
+    try:
+        # 出力先を指定しないためffmpegは終了コード1を返すが、標準エラーに長さが表示される
+        output = subprocess.run(["ffmpeg", "-nostdin", "-i", path], capture_output=True, text=True).stderr
+    except OSError:
+        return None
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", output)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def stream_audio(path, window_samples=N_SAMPLES, sample_rate=SAMPLE_RATE):
+    """ffmpegで音声をモノラル16kHzにリサンプリングしながら、window_samples ずつ float32 配列として返す"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate),
+        "-loglevel", "error",
+        "-"
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    window_bytes = window_samples * 2
+    try:
+        while True:
+            data = process.stdout.read(window_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+        process.wait()
+        if process.returncode != 0:
+            error = process.stderr.read().decode(errors="replace")
+            raise RuntimeError(f"音声の読み込みに失敗しました: {error}")
+    finally:
+        # ジェネレータが途中で閉じられた場合もffmpegを終了させる
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def iter_array_windows(audio, window_samples=N_SAMPLES):
+    """読み込み済みの波形を window_samples ずつ返す"""
+    for start in range(0, len(audio), window_samples):
+        yield audio[start:start + window_samples]
+
+
+class LogMelStream:
+    """音声を少しずつ受け取り、ファイル全体に対する正規化前のlog-mel（log10のメルパワー）を逐次計算する
+
+    whisper.log_mel_spectrogram と同じく両端を反射で埋めたSTFTを計算し、フレームが揃った分から返すため、
+    ブロックの区切り方に関係なく、音声全体を一度に計算した場合と同じ値になる。
+    返す配列の形は (フレーム数, n_mels)
+    """
+
+    def __init__(self, n_mels):
+        self.n_mels = n_mels
+        self.filters = mel_filters("cpu", n_mels)
+        self.window = torch.hann_window(N_FFT)
+        self.head = np.zeros(0, dtype=np.float32)  # 先頭を反射で埋めるまで溜めておく音声
+        self.pending = None  # まだフレームにしていない音声（先頭の反射を含む）
+        self.tail = np.zeros(0, dtype=np.float32)  # 末尾を反射で埋めるための直近の音声
+        self.total_samples = 0
+
+    def _empty(self):
+        return np.zeros((0, self.n_mels), dtype=np.float32)
+
+    def _frames(self, samples):
+        """samples から計算できるすべてのフレームと、消費したサンプル数を返す"""
+        if len(samples) < N_FFT:
+            return self._empty(), 0
+        count = (len(samples) - N_FFT) // HOP_LENGTH + 1
+        used = torch.from_numpy(samples[:(count - 1) * HOP_LENGTH + N_FFT])
+        stft = torch.stft(used, N_FFT, HOP_LENGTH, window=self.window, center=False, return_complex=True)
+        log_spec = torch.clamp(self.filters @ (stft.abs() ** 2), min=1e-10).log10()
+        return log_spec.T.numpy(), count * HOP_LENGTH
+
+    def feed(self, audio):
+        """音声を追加し、新しく計算できたフレームを返す"""
+        self.total_samples += len(audio)
+        self.tail = np.concatenate([self.tail, audio])[-(N_FFT // 2 + 1):]
+        if self.pending is None:
+            self.head = np.concatenate([self.head, audio])
+            if len(self.head) <= N_FFT // 2:
+                return self._empty()
+            # 先頭は whisper と同じく反射で埋める
+            audio, self.head = self.head, None
+            self.pending = audio[1:N_FFT // 2 + 1][::-1]
+        self.pending = np.concatenate([self.pending, audio])
+        frames, consumed = self._frames(self.pending)
+        self.pending = self.pending[consumed:]
+        return frames
+
+    def finish(self):
+        """音声の終わりを通知し、残りのフレームを返す（whisper と同じく最後のフレームは含めない）"""
+        expected = self.total_samples // HOP_LENGTH
+        if self.pending is None:
+            # 反射で埋められないほど短い音声は、無音を足してから計算する
+            head = np.pad(self.head, (0, N_FFT // 2 + 1 - len(self.head)))
+            samples = np.concatenate([head[1:N_FFT // 2 + 1][::-1], head, head[-(N_FFT // 2 + 1):-1][::-1]])
+            return self._frames(samples)[0][:expected]
+        samples = np.concatenate([self.pending, self.tail[-(N_FFT // 2 + 1):-1][::-1]])
+        return self._frames(samples)[0][:-1]
+
+
+def normalize_log_mel(frames):
+    """正規化前のlog-mel（フレーム数, n_mels）から、正規化した30秒分のメルを作る
+
+    計算式は whisper.log_mel_spectrogram と同じだが、下限（最大値 - 8.0）の基準にはファイル全体ではなく
+    このウィンドウの最大値を使う。ストリーミングでは最初のウィンドウをエンコードする時点でファイル全体の
+    最大値がわからないためで、30秒以下の音声では whisper と同じ値になるが、それより長い音声では
+    大きな音を含むウィンドウから離れた静かなウィンドウで whisper.transcribe の入力と異なる値になる
+    （キャッシュ済みのlog-melを使う場合も結果が変わらないよう、同じ正規化にしている）
+    """
+    log_spec = torch.from_numpy(np.ascontiguousarray(frames.T, dtype=np.float32))
+    if log_spec.shape[1] < N_FRAMES:
+        # 30秒に満たない部分は無音（log10(1e-10)）で埋める
+        log_spec = F.pad(log_spec, (0, N_FRAMES - log_spec.shape[1]), value=-10.0)
+    log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+    return (log_spec + 4.0) / 4.0
+
+
+def iter_log_mel(windows, n_mels, writer=None):
+    """音声のウィンドウを順に読み込み、正規化前のlog-mel（フレーム数, n_mels）を計算できた分ずつ返す
+
+    writer を指定すると、計算したlog-melを特徴量キャッシュに書き込む（最後まで計算できた場合だけ登録される）
+    """
+    mel_stream = LogMelStream(n_mels)
+    try:
+        while True:
+            with stage_timer("audio_decode"):
+                window = next(windows, None)
+            with stage_timer("mel"):
+                frames = mel_stream.feed(window) if window is not None else mel_stream.finish()
+            if writer is not None:
+                writer.write(frames)
+            if len(frames):
+                yield frames
+            if window is None:
+                break
+        if writer is not None:
+            writer.commit()
+    finally:
+        if hasattr(windows, "close"):
+            windows.close()
+        if writer is not None:
+            writer.close()
+
+
+def transcribe_stream(
+    model,
+    audio,
+    language=None,
+    task="transcribe",
+    fp16=False,
+    temperature=DEFAULT_TEMPERATURES,
+    compression_ratio_threshold=2.4,
+    logprob_threshold=-1.0,
+    no_speech_threshold=0.6,
+    condition_on_previous_text=True,
+    word_timestamps=False,
+    progress_callback=None,
+    segment_callback=None,
+    features=None,
+    **decode_options
+):
+    """音声をウィンドウごとに読み込みながら文字起こしする
+
+    audio にはファイルパスまたは16kHzの波形を指定する。処理の流れ（温度フォールバック、
+    無音判定、タイムスタンプによるシーク）は whisper.transcribe と同じで、
+    戻り値も同じ形式の辞書 {"text", "segments", "language"} になる。
+    ただしlog-melの正規化はウィンドウごとに行う（normalize_log_mel を参照）。
+    word_timestamps を指定すると、各セグメントに単語ごとのタイムスタンプ "words" を追加する。
+    progress_callback を指定すると、ウィンドウを1つデコードするごとに
+    progress_callback(処理済みフレーム数, 総フレーム数) が呼ばれる（総フレーム数が不明な場合は None）。
+    segment_callback を指定すると、ウィンドウごとに確定したセグメントのリストが渡される。
+    features に特徴量キャッシュのエントリ（feature_cache.FeatureEntry）を指定すると、保存済みのlog-melがあれば
+    音声を読み込まずにそれを使い、なければ計算したlog-melを保存する。エンコーダ出力も同様に再利用する
+    """
+    if language == "auto":
+        language = None
+    if isinstance(temperature, (int, float)):
+        temperature = (temperature,)
+    if model.device.type == "cpu":
+        # CPUではfp16に対応していないため常にfp32で計算する
+        fp16 = False
+    dtype = torch.float16 if fp16 else torch.float32
+
+    n_mels = model.dims.n_mels
+    cached_mel = features.load_mel() if features is not None else None
+    if cached_mel is not None:
+        # 保存済みのlog-melを30秒ずつ読み出す（音声の読み込みとlog-melの計算を省略）
+        mel_blocks = iter_array_windows(cached_mel, N_FRAMES)
+        total_frames = len(cached_mel)
+    else:
+        if isinstance(audio, str):
+            windows = stream_audio(audio)
+            duration = probe_duration(audio) if progress_callback is not None else None
+            total_frames = int(duration * SAMPLE_RATE) // HOP_LENGTH if duration else None
+        else:
+            windows = iter_array_windows(audio)
+            total_frames = len(audio) // HOP_LENGTH
+        mel_blocks = iter_log_mel(windows, n_mels, features.mel_writer() if features is not None else None)
+    buffer = np.zeros((0, n_mels), dtype=np.float32)
+    buffer_offset = 0  # buffer[0] の元音声でのフレーム位置
+    exhausted = False
+
+    input_stride = N_FRAMES // model.dims.n_audio_ctx  # 出力トークン1つあたりのメルフレーム数
+    time_precision = input_stride * HOP_LENGTH / SAMPLE_RATE
+
+    tokenizer = None
+    seek = 0  # 処理済みの位置（サンプル数）
+    all_tokens = []
+    all_segments = []
+    prompt_reset_since = 0
+    last_speech_timestamp = 0.0
+
+    def encode(mel_segment, seek_frame):
+        # エンコーダはウィンドウごとに1回だけ実行し、温度フォールバック時のデコードでも使い回す
+        cached = features.load_encoder_output(seek_frame) if features is not None else None
+        if cached is not None:
+            return torch.from_numpy(np.array(cached)).to(model.device).to(dtype)
+        with stage_timer("encoder"), torch.no_grad():
+            audio_features = model.embed_audio(mel_segment.unsqueeze(0))[0]
+            if audio_features.is_cuda:
+                torch.cuda.synchronize()
+        if features is not None:
+            features.save_encoder_output(seek_frame, audio_features.cpu().numpy())
+        return audio_features
+
+    def decode_with_fallback(audio_features):
+        for t in temperature:
+            kwargs = {**decode_options}
+            if t > 0:
+                kwargs.pop("beam_size", None)
+                kwargs.pop("patience", None)
+            else:
+                kwargs.pop("best_of", None)
+            options = DecodingOptions(**kwargs, task=task, language=language, temperature=t, fp16=fp16)
+            result = model.decode(audio_features, options)
+
+            needs_fallback = False
+            if compression_ratio_threshold is not None and result.compression_ratio > compression_ratio_threshold:
+                needs_fallback = True  # 繰り返しが多すぎる
+            if logprob_threshold is not None and result.avg_logprob < logprob_threshold:
+                needs_fallback = True  # 平均対数確率が低すぎる
+            if (no_speech_threshold is not None and result.no_speech_prob > no_speech_threshold
+                    and logprob_threshold is not None and result.avg_logprob < logprob_threshold):
+                needs_fallback = False  # 無音
+            if not needs_fallback:
+                break
+        return result
+
+    def report_progress():
+        if progress_callback is not None:
+            processed_frames = seek // HOP_LENGTH
+            if total_frames is not None:
+                processed_frames = min(processed_frames, total_frames)
+            progress_callback(processed_frames, total_frames)
+
+    start_time = time.perf_counter()
+    total_mel_frames = 0
+    try:
+        while True:
+            # 現在位置から1ウィンドウ分のlog-melが揃うまで読み込む（seek は常にフレームの境界にある）
+            seek_frame = seek // HOP_LENGTH
+            while not exhausted and buffer_offset + len(buffer) < seek_frame + N_FRAMES:
+                try:
+                    block = next(mel_blocks)
+                    total_mel_frames += len(block)
+                    buffer = np.concatenate([buffer[seek_frame - buffer_offset:], block])
+                    buffer_offset = seek_frame
+                except StopIteration:
+                    exhausted = True
+            buffer = buffer[seek_frame - buffer_offset:]
+            buffer_offset = seek_frame
+
+            segment_frames = min(len(buffer), N_FRAMES)
+            if segment_frames == 0:
+                break
+            segment_samples = segment_frames * HOP_LENGTH
+            time_offset = seek / SAMPLE_RATE
+
+            with stage_timer("mel"):
+                mel_segment = normalize_log_mel(buffer[:N_FRAMES]).to(model.device).to(dtype)
+            audio_features = encode(mel_segment, seek_frame)
+
+            if tokenizer is None:
+                if language is None:
+                    if model.is_multilingual:
+                        _, probs = model.detect_language(audio_features)
+                        language = max(probs, key=probs.get)
+                    else:
+                        language = "en"
+                tokenizer = get_tokenizer(
+                    model.is_multilingual,
+                    num_languages=model.num_languages,
+                    language=language,
+                    task=task
+                )
+
+            decode_options["prompt"] = all_tokens[prompt_reset_since:]
+            with stage_timer("decoder"):
+                result = decode_with_fallback(audio_features)
+
+            if no_speech_threshold is not None:
+                should_skip = result.no_speech_prob > no_speech_threshold
+                if logprob_threshold is not None and result.avg_logprob > logprob_threshold:
+                    should_skip = False
+                if should_skip:
+                    seek += segment_samples
+                    report_progress()
+                    continue
+
+            def new_segment(start, end, tokens):
+                tokens = tokens.tolist()
+                return {
+                    "seek": seek // HOP_LENGTH,
+                    "start": start,
+                    "end": end,
+                    "text": tokenizer.decode([token for token in tokens if token < tokenizer.eot]),
+                    "tokens": tokens,
+                    "temperature": result.temperature,
+                    "avg_logprob": result.avg_logprob,
+                    "compression_ratio": result.compression_ratio,
+                    "no_speech_prob": result.no_speech_prob
+                }
+
+            previous_seek = seek
+            current_segments = []
+            tokens = torch.tensor(result.tokens)
+            timestamp_tokens = tokens.ge(tokenizer.timestamp_begin)
+            single_timestamp_ending = timestamp_tokens[-2:].tolist() == [False, True]
+
+            consecutive = torch.where(timestamp_tokens[:-1] & timestamp_tokens[1:])[0]
+            consecutive.add_(1)
+            if len(consecutive) > 0:
+                # タイムスタンプが連続する位置でセグメントに区切る
+                slices = consecutive.tolist()
+                if single_timestamp_ending:
+                    slices.append(len(tokens))
+                last_slice = 0
+                for current_slice in slices:
+                    sliced_tokens = tokens[last_slice:current_slice]
+                    start_pos = sliced_tokens[0].item() - tokenizer.timestamp_begin
+                    end_pos = sliced_tokens[-1].item() - tokenizer.timestamp_begin
+                    current_segments.append(new_segment(
+                        time_offset + start_pos * time_precision,
+                        time_offset + end_pos * time_precision,
+                        sliced_tokens
+                    ))
+                    last_slice = current_slice
+                if single_timestamp_ending:
+                    seek += segment_samples
+                else:
+                    # 途中で終わったセグメントは無視し、最後のタイムスタンプまで進める
+                    last_timestamp_pos = tokens[last_slice - 1].item() - tokenizer.timestamp_begin
+                    seek += last_timestamp_pos * input_stride * HOP_LENGTH
+            else:
+                duration = segment_samples / SAMPLE_RATE
+                timestamps = tokens[timestamp_tokens.nonzero().flatten()]
+                if len(timestamps) > 0 and timestamps[-1].item() != tokenizer.timestamp_begin:
+                    duration = (timestamps[-1].item() - tokenizer.timestamp_begin) * time_precision
+                current_segments.append(new_segment(time_offset, time_offset + duration, tokens))
+                seek += segment_samples
+
+            if word_timestamps:
+                # クロスアテンションから単語ごとの時刻を推定する
+                with stage_timer("word_timestamps"):
+                    add_word_timestamps(
+                        segments=current_segments,
+                        model=model,
+                        tokenizer=tokenizer,
+                        mel=mel_segment,
+                        num_frames=segment_frames,
+                        last_speech_timestamp=last_speech_timestamp
+                    )
+                if not single_timestamp_ending:
+                    # 最後の単語の終わりから次のウィンドウを始める
+                    word_ends = [word["end"] for segment in current_segments for word in segment.get("words", [])]
+                    if word_ends and word_ends[-1] > time_offset:
+                        seek = round(word_ends[-1] * FRAMES_PER_SECOND) * HOP_LENGTH
+                word_ends = [word["end"] for segment in current_segments for word in segment.get("words", [])]
+                if word_ends:
+                    last_speech_timestamp = word_ends[-1]
+
+            # シーク位置が進まない場合の無限ループを防止
+            if seek <= previous_seek:
+                seek = previous_seek + segment_samples
+
+            current_segments = [
+                segment for segment in current_segments
+                if segment["start"] != segment["end"] and segment["text"].strip()
+            ]
+            for segment in current_segments:
+                segment["id"] = len(all_segments)
+                all_segments.append(segment)
+                all_tokens.extend(segment["tokens"])
+            if segment_callback is not None and current_segments:
+                segment_callback(current_segments)
+
+            if not condition_on_previous_text or result.temperature > 0.5:
+                # 温度が高い場合は前の文脈を引き継がない
+                prompt_reset_since = len(all_tokens)
+
+            report_progress()
+    finally:
+        if hasattr(mel_blocks, "close"):
+            mel_blocks.close()
+        if features is not None:
+            features.close()
+    record_transcription(total_mel_frames * HOP_LENGTH / SAMPLE_RATE, time.perf_counter() - start_time)
+
+    return {
+        "text": tokenizer.decode(all_tokens) if tokenizer is not None else "",
+        "segments": all_segments,
+        "language": language
+    }
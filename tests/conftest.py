@@ -0,0 +1,9 @@
+"""
+テストの共通設定
+モジュールはリポジトリ直下に置かれているため、tests から import できるようにパスを追加する
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,40 @@
+"""audio_prefetch の先読みする範囲のテスト"""
+
+import numpy as np
+import pytest
+
+import audio_prefetch
+from audio_prefetch import AudioPrefetcher
+
+DURATIONS = {"short1": 10, "long1": 600, "short2": 20, "long2": 600, "short3": 5, "huge": 7200}
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    paths = []
+    monkeypatch.setattr(audio_prefetch, "probe_duration", DURATIONS.get)
+
+    def load_audio(path):
+        paths.append(path)
+        return np.zeros(DURATIONS[path], dtype=np.float32)
+
+    monkeypatch.setattr(audio_prefetch.whisper, "load_audio", load_audio)
+    return paths
+
+
+def test_long_audio_is_prefetched_only_within_long_ahead(decoded):
+    order = ["short1", "long1", "short2", "long2", "short3"]
+    with AudioPrefetcher(order, ahead=5, long_ahead=2, max_seconds=1800) as prefetcher:
+        results = {path: prefetcher.get(path) for path in order}
+    # 先頭から2ファイル以内の long1 は先読みし、それより後ろの long2 は先読みしない
+    assert results["long1"] is not None
+    assert results["long2"] is None
+    assert all(results[path] is not None for path in ("short1", "short2", "short3"))
+    assert "long2" not in decoded
+
+
+def test_long_ahead_defaults_to_ahead(decoded):
+    order = ["short1", "long1", "long2", "huge"]
+    with AudioPrefetcher(order, ahead=4, max_seconds=1800) as prefetcher:
+        results = [prefetcher.get(path) for path in order]
+    assert [result is not None for result in results] == [True, True, True, False]
@@ -0,0 +1,70 @@
+"""eta の実時間比の学習と残り時間の見積もりのテスト"""
+
+import json
+
+import pytest
+
+from eta import DECAY, RtfModel, blend_rtf, make_key, schedule_eta
+
+
+def test_make_key():
+    assert make_key("whisper", "base", "cpu", "float32") == "whisper/base/cpu/float32"
+
+
+def test_estimate_is_none_until_learned(tmp_path):
+    model = RtfModel(str(tmp_path / "rtf.json"))
+    assert model.estimate("k") is None
+    assert model.stats() == {}
+
+
+def test_update_learns_decayed_ratio_and_persists(tmp_path):
+    path = tmp_path / "cache" / "rtf.json"
+    model = RtfModel(str(path))
+    model.update("k", 100, 50)
+    assert model.estimate("k") == pytest.approx(0.5)
+    model.update("k", 100, 10)
+    # 古いジョブの重みは DECAY 倍になる
+    expected = (50 * DECAY + 10) / (100 * DECAY + 100)
+    assert model.estimate("k") == pytest.approx(expected)
+    assert model.stats() == {"k": {"rtf": pytest.approx(expected), "jobs": 2}}
+
+    # 別のインスタンスから読み込んでも同じ見積もりになる
+    assert RtfModel(str(path)).estimate("k") == pytest.approx(expected)
+    assert json.loads(path.read_text(encoding="utf-8"))["k"]["jobs"] == 2
+
+
+def test_update_ignores_unknown_duration(tmp_path):
+    model = RtfModel(str(tmp_path / "rtf.json"))
+    model.update("k", None, 10)
+    model.update("k", 0, 10)
+    assert model.estimate("k") is None
+
+
+def test_broken_file_is_ignored(tmp_path):
+    path = tmp_path / "rtf.json"
+    path.write_text("{", encoding="utf-8")
+    assert RtfModel(str(path)).estimate("k") is None
+
+
+def test_blend_rtf():
+    # 観測値がなければ学習値、学習値がなければ観測値
+    assert blend_rtf(0.5, 0.0, 0.0, 100) == 0.5
+    assert blend_rtf(None, 10.0, 20.0, 100) == pytest.approx(0.5)
+    assert blend_rtf(None, 0.0, 0.0, 100) is None
+    # 処理が進むほど観測値の重みが大きくなる
+    assert blend_rtf(1.0, 5.0, 25.0, 100) == pytest.approx(0.25 * 0.2 + 0.75 * 1.0)
+    assert blend_rtf(1.0, 20.0, 100.0, 100) == pytest.approx(0.2)
+    # 音声の長さが不明な場合は重みを決められないため学習値を使う
+    assert blend_rtf(1.0, 20.0, 100.0, None) == 1.0
+
+
+def test_schedule_eta_assigns_jobs_to_the_first_free_worker():
+    # ワーカー2つ（10秒後と30秒後に空く）に、処理時間5秒・20秒・1秒のジョブを順に割り当てる
+    assert schedule_eta([10.0, 30.0], [5.0, 20.0, 1.0]) == [(10.0, 15.0), (15.0, 35.0), (30.0, 31.0)]
+
+
+def test_schedule_eta_with_unknown_estimates():
+    # 処理時間が分からないジョブを割り当てたワーカーはそれ以降の見積もりに使えない
+    assert schedule_eta([0.0], [None, 5.0]) == [(0.0, None), (None, None)]
+    assert schedule_eta([None, 2.0], [3.0, 4.0]) == [(2.0, 5.0), (5.0, 9.0)]
+    assert schedule_eta([], [1.0]) == [(None, None)]
@@ -0,0 +1,103 @@
+"""feature_cache のキーとLRUによる削除のテスト"""
+
+import os
+
+import numpy as np
+
+from feature_cache import FeatureCache, MEL_SUFFIX
+from streaming import iter_array_windows, iter_log_mel
+
+
+def write_audio_file(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def save_mel(entry, frames):
+    writer = entry.mel_writer()
+    writer.write(frames)
+    writer.commit()
+    entry.close()
+
+
+def test_mel_is_keyed_by_content_and_n_mels(tmp_path):
+    cache = FeatureCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    audio_a = write_audio_file(tmp_path / "a.wav", b"audio-a")
+    copy_a = write_audio_file(tmp_path / "copy.wav", b"audio-a")
+    audio_b = write_audio_file(tmp_path / "b.wav", b"audio-b")
+    frames = np.arange(80 * 5, dtype=np.float32).reshape(5, 80)
+
+    assert cache.entry(audio_a, "base", "float32", 80).load_mel() is None
+    save_mel(cache.entry(audio_a, "base", "float32", 80), frames)
+
+    # 内容が同じなら別名のファイルでも、モデルが違っても同じlog-melを使う
+    np.testing.assert_array_equal(cache.entry(copy_a, "small", "int8", 80).load_mel(), frames)
+    assert cache.has_mel(copy_a)
+    # メルの数が違う場合と、内容が違う場合は使わない
+    assert cache.entry(audio_a, "large-v3", "float32", 128).load_mel() is None
+    assert not cache.has_mel(audio_b)
+
+
+def test_encoder_output_is_keyed_by_model_and_window(tmp_path):
+    cache = FeatureCache(str(tmp_path / "cache"), 10 * 1024 * 1024, store_encoder=True)
+    audio = write_audio_file(tmp_path / "a.wav", b"audio")
+    output = np.ones((1500, 8), dtype=np.float32)
+    entry = cache.entry(audio, "base", "float32", 80)
+    entry.save_encoder_output(0, output)
+    entry.close()
+
+    np.testing.assert_array_equal(cache.entry(audio, "base", "float32", 80).load_encoder_output(0), output)
+    assert cache.entry(audio, "base", "float32", 80).load_encoder_output(3000) is None
+    assert cache.entry(audio, "base", "float16", 80).load_encoder_output(0) is None
+    assert cache.entry(audio, "small", "float32", 80).load_encoder_output(0) is None
+    # log-melがなくても、エンコーダ出力があればキャッシュ済みの特徴量として数える
+    assert not cache.has_mel(audio)
+    assert cache.has_features(audio)
+    assert not cache.has_features(write_audio_file(tmp_path / "b.wav", b"other"))
+
+
+def test_encoder_output_is_not_stored_unless_enabled(tmp_path):
+    cache = FeatureCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    audio = write_audio_file(tmp_path / "a.wav", b"audio")
+    entry = cache.entry(audio, "base", "float32", 80)
+    entry.save_encoder_output(0, np.ones((1500, 8), dtype=np.float32))
+    entry.close()
+    assert os.listdir(cache.cache_dir) == []
+
+
+def test_incomplete_mel_is_not_registered(tmp_path):
+    cache = FeatureCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    audio_path = write_audio_file(tmp_path / "a.wav", b"audio")
+    entry = cache.entry(audio_path, "base", "float32", 80)
+    audio = np.zeros(16000 * 65, dtype=np.float32)
+    frames = iter_log_mel(iter_array_windows(audio), 80, writer=entry.mel_writer())
+    # 途中で読むのをやめた場合は一時ファイルごと捨てられる
+    next(frames)
+    frames.close()
+    entry.close()
+    assert os.listdir(cache.cache_dir) == []
+
+    entry = cache.entry(audio_path, "base", "float32", 80)
+    expected = np.concatenate(list(iter_log_mel(iter_array_windows(audio), 80, writer=entry.mel_writer())))
+    entry.close()
+    np.testing.assert_array_equal(cache.entry(audio_path, "base", "float32", 80).load_mel(), expected)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    frames = np.zeros((1000, 80), dtype=np.float32)  # 320000 バイト
+    cache = FeatureCache(str(tmp_path / "cache"), frames.nbytes * 2)
+    paths = [write_audio_file(tmp_path / f"{name}.wav", name.encode()) for name in ("a", "b", "c")]
+
+    for i, path in enumerate(paths[:2]):
+        save_mel(cache.entry(path, "base", "float32", 80), frames)
+        mel_path = cache.entry(path, "base", "float32", 80).mel_path
+        os.utime(mel_path, (1000 + i, 1000 + i))
+    # a を参照すると最終利用時刻が更新され、b の方が古くなる
+    assert cache.entry(paths[0], "base", "float32", 80).load_mel() is not None
+
+    save_mel(cache.entry(paths[2], "base", "float32", 80), frames)
+    remaining = sorted(name for name in os.listdir(cache.cache_dir) if name.endswith(MEL_SUFFIX))
+    assert len(remaining) == 2
+    assert cache.has_mel(paths[0])
+    assert not cache.has_mel(paths[1])
+    assert cache.has_mel(paths[2])
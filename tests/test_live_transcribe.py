@@ -0,0 +1,93 @@
+"""live_transcribe のスライディングウィンドウの確定・切り詰めのテスト"""
+
+import numpy as np
+import pytest
+from whisper.audio import SAMPLE_RATE
+
+from live_transcribe import LiveTranscriber, PcmDecoder, resample
+
+
+def seconds(value):
+    return np.zeros(int(value * SAMPLE_RATE), dtype=np.float32)
+
+
+def fake_transcribe(segments, calls=None):
+    """ウィンドウの長さを記録し、決まったセグメントを返す文字起こし関数"""
+    def transcribe(audio):
+        if calls is not None:
+            calls.append(len(audio) / SAMPLE_RATE)
+        return {"segments": [{"start": start, "end": end, "text": text} for start, end, text in segments]}
+    return transcribe
+
+
+def test_segments_far_from_the_end_are_committed_and_trimmed():
+    live = LiveTranscriber(step_seconds=1, hold_seconds=2, max_window_seconds=20)
+    live.add_audio(seconds(10))
+    assert live.wait_ready(0)
+    committed = live.step(fake_transcribe([(0, 3, "a"), (3, 7, "b"), (7, 9.5, "c")]))
+
+    assert [segment["text"] for segment in committed] == ["a", "b"]
+    assert [segment["id"] for segment in live.final_segments] == [0, 1]
+    assert [segment["text"] for segment in live.partial_segments] == ["c"]
+    # 確定した7秒分をウィンドウから取り除き、以降の時刻はストリーム先頭からの時刻で返す
+    assert live.buffer_offset == pytest.approx(7)
+    assert len(live.buffer) == 3 * SAMPLE_RATE
+    assert not live.wait_ready(0)
+
+    live.add_audio(seconds(2))
+    committed = live.step(fake_transcribe([(0, 2.5, "c"), (2.5, 4.5, "d")]))
+    assert committed == [{"id": 2, "start": 7.0, "end": 9.5, "text": "c"}]
+    assert live.partial_segments == [{"start": 9.5, "end": 11.5, "text": "d"}]
+
+
+def test_long_window_forces_a_commit():
+    live = LiveTranscriber(step_seconds=1, hold_seconds=2, max_window_seconds=20)
+    live.add_audio(seconds(20))
+    committed = live.step(fake_transcribe([(0, 19, "a"), (19, 19.5, "b")]))
+    # 末尾付近で終わるセグメントしかなくても、最後のもの以外は確定させる
+    assert [segment["text"] for segment in committed] == ["a"]
+    assert live.buffer_offset == pytest.approx(19)
+
+
+def test_silence_is_dropped_when_the_window_is_full():
+    live = LiveTranscriber(step_seconds=1, hold_seconds=2, max_window_seconds=20)
+    live.add_audio(seconds(20))
+    calls = []
+    assert live.step(fake_transcribe([(0, 1, " ")], calls)) == []
+    assert calls == [pytest.approx(20)]
+    assert live.final_segments == []
+    # 末尾の hold_seconds 秒だけを残す
+    assert live.buffer_offset == pytest.approx(18)
+    assert len(live.buffer) == 2 * SAMPLE_RATE
+
+
+def test_finish_commits_everything():
+    live = LiveTranscriber(step_seconds=1, hold_seconds=2, max_window_seconds=20)
+    live.add_audio(seconds(5))
+    live.step(fake_transcribe([(0, 4.5, "a")]))
+    assert live.final_segments == []
+    live.finish()
+    assert live.wait_ready(0)
+    committed = live.step(fake_transcribe([(0, 4.5, "a")]))
+    assert [segment["text"] for segment in committed] == ["a"]
+    assert live.partial_segments == []
+    assert len(live.buffer) == 0
+    assert live.done
+
+
+def test_pcm_decoder_keeps_split_samples():
+    received = []
+    decoder = PcmDecoder(received.append)
+    pcm = np.array([0, 16384, -16384, 32767], dtype="<i2").tobytes()
+    decoder.write(pcm[:3])
+    decoder.write(pcm[3:])
+    np.testing.assert_allclose(np.concatenate(received), [0, 0.5, -0.5, 32767 / 32768])
+
+
+def test_resample_to_16khz():
+    audio = np.linspace(0, 1, 48000, dtype=np.float32)
+    resampled = resample(audio, 48000)
+    assert len(resampled) == 16000
+    assert resampled.dtype == np.float32
+    assert resampled[0] == 0
+    assert resample(audio, SAMPLE_RATE) is audio
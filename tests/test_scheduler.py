@@ -0,0 +1,123 @@
+"""scheduler.JobScheduler の処理順のテスト"""
+
+import pytest
+
+from scheduler import JobScheduler, LONG_JOB_SECONDS, UNKNOWN_DURATION
+
+
+class FakeClock:
+    """テスト用の手動で進める時計"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(policy, **kwargs):
+    clock = FakeClock()
+    return JobScheduler(policy, clock=clock, **kwargs), clock
+
+
+def drain(scheduler):
+    order = []
+    while (job_id := scheduler.pop()) is not None:
+        order.append(job_id)
+        scheduler.done(job_id)
+    return order
+
+
+def test_fifo_keeps_submission_order():
+    scheduler, _ = make_scheduler("fifo")
+    for job_id, duration in (("a", 500), ("b", 10), ("c", 100)):
+        scheduler.put(job_id, duration)
+    assert scheduler.order() == ["a", "b", "c"]
+    assert drain(scheduler) == ["a", "b", "c"]
+
+
+def test_sjf_orders_by_duration():
+    scheduler, _ = make_scheduler("sjf")
+    for job_id, duration in (("a", 500), ("b", 10), ("c", 100)):
+        scheduler.put(job_id, duration)
+    assert drain(scheduler) == ["b", "c", "a"]
+
+
+def test_unknown_duration_is_treated_as_default():
+    scheduler, _ = make_scheduler("sjf")
+    scheduler.put("unknown", None)
+    scheduler.put("shorter", UNKNOWN_DURATION - 1)
+    scheduler.put("longer", UNKNOWN_DURATION + 1)
+    assert drain(scheduler) == ["shorter", "unknown", "longer"]
+
+
+@pytest.mark.parametrize("policy", ["fair", "sjf", "fifo"])
+def test_priority_comes_first(policy):
+    scheduler, _ = make_scheduler(policy)
+    scheduler.put("normal", 10)
+    scheduler.put("low", 5, priority=-1)
+    scheduler.put("high", 1000, priority=1)
+    assert drain(scheduler) == ["high", "normal", "low"]
+
+
+def test_fair_share_prefers_users_with_less_recent_usage():
+    scheduler, _ = make_scheduler("fair")
+    scheduler.put("heavy-1", 100, user="heavy")
+    assert scheduler.pop() == "heavy-1"
+    scheduler.done("heavy-1")
+    # heavy は処理済みの100秒分だけ後回しになる
+    scheduler.put("heavy-2", 20, user="heavy")
+    scheduler.put("light-1", 60, user="light")
+    assert drain(scheduler) == ["light-1", "heavy-2"]
+
+
+def test_fair_share_usage_decays_with_half_life():
+    scheduler, clock = make_scheduler("fair", usage_half_life=100, aging_rate=0)
+    scheduler.put("heavy-1", 100, user="heavy")
+    scheduler.pop()
+    scheduler.done("heavy-1")
+    # 3半減期後には処理量は12.5秒分まで減る
+    clock.now = 300
+    scheduler.put("heavy-2", 20, user="heavy")
+    scheduler.put("light-1", 40, user="light")
+    assert drain(scheduler) == ["heavy-2", "light-1"]
+
+
+def test_aging_lets_long_jobs_overtake_new_short_jobs():
+    scheduler, clock = make_scheduler("sjf", aging_rate=2.0)
+    scheduler.put("long", 400)
+    clock.now = 200
+    # 200秒待った長い音声は 400 - 2 * 200 = 0 秒相当になり、新しく届いた短い音声より先になる
+    scheduler.put("short", 30)
+    assert scheduler.order() == ["long", "short"]
+
+
+def test_reserved_workers_keep_a_slot_for_short_jobs():
+    scheduler, _ = make_scheduler("sjf", workers=2, reserved_workers=1)
+    scheduler.put("long-1", LONG_JOB_SECONDS + 1)
+    scheduler.put("long-2", LONG_JOB_SECONDS + 2)
+    assert scheduler.pop() == "long-1"
+    # 長い音声の枠が埋まっているため、2つ目の長い音声は取り出せない
+    assert scheduler.pop() is None
+    assert scheduler.get(timeout=0) is None
+    scheduler.put("short", 30)
+    assert scheduler.pop() == "short"
+    scheduler.done("long-1")
+    assert scheduler.pop() == "long-2"
+
+
+def test_remove_and_len():
+    scheduler, _ = make_scheduler("fifo")
+    scheduler.put("a", 10)
+    scheduler.put("b", 10)
+    assert len(scheduler) == 2
+    assert scheduler.remove("a") is True
+    assert scheduler.remove("a") is False
+    assert len(scheduler) == 1
+    assert drain(scheduler) == ["b"]
+
+
+@pytest.mark.parametrize("kwargs", [{"policy": "lifo"}, {"workers": 1, "reserved_workers": 1}])
+def test_invalid_settings_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        JobScheduler(**kwargs)
@@ -0,0 +1,96 @@
+"""streaming の逐次log-mel計算が whisper.log_mel_spectrogram と一致すること、ウィンドウごとの正規化のテスト"""
+
+import numpy as np
+import pytest
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FFT, N_FRAMES, SAMPLE_RATE
+
+from streaming import LogMelStream, iter_array_windows, iter_log_mel, normalize_log_mel
+
+
+def whisper_normalize(frames):
+    """正規化前のlog-mel（フレーム数, n_mels）に whisper.log_mel_spectrogram と同じ正規化をする"""
+    log_spec = torch.from_numpy(np.ascontiguousarray(frames.T))
+    log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+    return ((log_spec + 4.0) / 4.0).numpy()
+
+
+def stream_log_mel(audio, block_sizes, n_mels=80):
+    """audio を block_sizes の大きさのブロックに分けて LogMelStream に渡し、得られたフレームを連結する"""
+    stream = LogMelStream(n_mels)
+    frames = []
+    position = 0
+    sizes = iter(block_sizes)
+    while position < len(audio):
+        size = next(sizes, len(audio))
+        frames.append(stream.feed(audio[position:position + size]))
+        position += size
+    frames.append(stream.finish())
+    return np.concatenate(frames)
+
+
+def make_audio(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+@pytest.mark.parametrize("seconds", [0.1, 0.5, 3.3, 31.7])
+@pytest.mark.parametrize("block_sizes", [
+    [],  # 一度に渡す
+    [1, 7, N_FFT // 2 - 10, 100, HOP_LENGTH, 5000] * 200,  # 反射で埋める長さより短いブロックを含む
+    [16000] * 100
+])
+def test_log_mel_stream_matches_whisper(seconds, block_sizes):
+    audio = make_audio(seconds)
+    expected = whisper.log_mel_spectrogram(audio).numpy()
+    frames = stream_log_mel(audio, block_sizes)
+    assert frames.shape == (len(audio) // HOP_LENGTH, 80)
+    np.testing.assert_allclose(whisper_normalize(frames), expected, atol=1e-4)
+
+
+def test_log_mel_stream_handles_audio_too_short_to_reflect():
+    # whisper は反射で埋められない長さの音声を計算できないが、無音を足して計算する
+    audio = make_audio(0.01)
+    frames = stream_log_mel(audio, [7] * 100)
+    assert frames.shape == (len(audio) // HOP_LENGTH, 80)
+    assert np.isfinite(frames).all()
+
+
+def test_log_mel_stream_supports_128_mels():
+    audio = make_audio(2.0)
+    expected = whisper.log_mel_spectrogram(audio, n_mels=128).numpy()
+    np.testing.assert_allclose(whisper_normalize(stream_log_mel(audio, [3000] * 20, n_mels=128)), expected,
+                               atol=1e-4)
+
+
+def test_iter_log_mel_over_windows_matches_whisper():
+    audio = make_audio(65.0)
+    frames = np.concatenate(list(iter_log_mel(iter_array_windows(audio), 80)))
+    np.testing.assert_allclose(whisper_normalize(frames), whisper.log_mel_spectrogram(audio).numpy(), atol=1e-4)
+
+
+def test_normalize_log_mel_matches_whisper_for_short_audio():
+    audio = make_audio(12.0)
+    frames = stream_log_mel(audio, [])
+    mel = normalize_log_mel(frames).numpy()
+    expected = whisper.log_mel_spectrogram(audio).numpy()
+    assert mel.shape == (80, N_FRAMES)
+    np.testing.assert_allclose(mel[:, :len(frames)], expected, atol=1e-4)
+    # 30秒に満たない部分は無音（log10(1e-10)）として正規化される
+    np.testing.assert_allclose(mel[:, len(frames):], (max(-10.0, frames.max() - 8.0) + 4.0) / 4.0, atol=1e-6)
+
+
+def test_normalize_log_mel_uses_the_window_maximum():
+    # 大きな音の30秒の後に、ごく小さな音の30秒が続く音声
+    audio = np.concatenate([make_audio(30.0), 1e-4 * make_audio(30.0, seed=1)])
+    frames = stream_log_mel(audio, [])
+    quiet = frames[N_FRAMES:2 * N_FRAMES]
+    mel = normalize_log_mel(quiet).numpy()
+    # 下限の基準はファイル全体ではなく、このウィンドウの最大値
+    np.testing.assert_allclose(mel, whisper_normalize(quiet), atol=1e-6)
+    assert mel.min() == pytest.approx((quiet.max() - 8.0 + 4.0) / 4.0, abs=1e-6)
+    # そのため、ファイル全体で正規化する whisper.log_mel_spectrogram とは値が異なる
+    whole_file = whisper.log_mel_spectrogram(audio).numpy()[:, N_FRAMES:2 * N_FRAMES]
+    assert not np.allclose(mel, whole_file, atol=1e-2)